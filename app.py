@@ -1,31 +1,65 @@
-from flask import Flask, render_template, redirect, url_for, request, flash, session, g, jsonify, send_from_directory
-from flask_socketio import SocketIO, join_room as sio_join_room, leave_room as sio_leave_room, emit
-from sqlalchemy import create_engine, select, text, inspect
-from sqlalchemy.orm import Session
+from flask import Flask, render_template, redirect, url_for, request, flash, session, g, jsonify, send_from_directory, Response, stream_with_context
+from flask_socketio import SocketIO, join_room as sio_join_room, leave_room as sio_leave_room, emit, disconnect as sio_disconnect
+from sqlalchemy import create_engine, select, insert, update, delete, text, inspect, event, func, or_, and_
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.dialects import postgresql, sqlite
+from collections import OrderedDict
+import atexit
+import base64
+import math
+import csv
 import datetime
+import hashlib
+import heapq
+import io
+import json
 import os
+import threading
+import time
+import uuid
+import zlib
 from functools import wraps
 import jwt
-import bcrypt
 from models import Base, User, FormA, FormB, FormC, FormD, GameUser, GameUserAvatar, Avatar
 from config import Config
+from search import ensure_search_index, index_form_a, search_form_a
+from bulk import bulk_insert, uuid7
+from index_queue import IndexQueue
+from assets import AssetTable, IMMUTABLE
+from catalog import AvatarCatalog
+from passwords import PasswordHasher, PasswordPoolBusy
+from wallet import Wallet
+from thumbnails import ThumbnailCache
+from avatar_sync import migrate_avatars_table
+from rooms import RoomRegistry
+from broadcaster import TickBroadcaster, ENCODINGS, batch_group
+from wire import encode_elf_batch, encode_city_batch
+from interest import RoomInterest
+from sessions import EventLog, ResumeSessions
+from leaderboard import Leaderboard, PlayerStanding, encode_cursor as encode_rank_cursor, decode_cursor as decode_rank_cursor
+from entities import ENTITY_FIELDS, index_entities, find_entity, stories_mentioning, top_entities, cooccurring_entities
 
 app = Flask(__name__)
 app.config.from_object(Config)
 socketio = SocketIO(app, cors_allowed_origins='*', async_mode='threading')
 
-# In-memory room state for Elf Quest multiplayer
-# rooms[roomCode] = { players: {sid: {username,x,y,dir,frame,hasSword}}, openedChests: set, cutBushes: set }
-elf_rooms = {}
+# In-memory multiplayer rooms, with a sid -> room index (see rooms.py)
+game_rooms = RoomRegistry()
 
-# In-memory room state for City Life (game 06) multiplayer
-# city_rooms[roomCode] = { players: {sid: {username,x,z,ry,moving,colorSlot}} }
-city_rooms = {}
+# Elf Quest rooms
+# elf_rooms[roomCode] = { players: {sid: {username,x,y,dir,frame,hasSword,colorSlot,hp}}, openedChests: [], cutBushes: [], cutTrees: [], events: EventLog }
+elf_rooms = game_rooms.rooms('elf')
+
+# City Life (game 06) rooms
+# city_rooms[roomCode] = { players: {sid: {username,x,z,ry,moving,colorSlot,insideHouse}}, interest: RoomInterest }
+city_rooms = game_rooms.rooms('city')
 
 # JWT secret for game authentication
 GAME_JWT_SECRET = os.getenv('GAME_JWT_SECRET', 'labyrinth-game-secret-key-change-in-production')
 
 db_engine = create_engine(app.config["SQLALCHEMY_DATABASE_URI"], pool_pre_ping=True)
+# INSERT construct with ON CONFLICT support for the configured database
+insert_ignore = postgresql.insert if db_engine.dialect.name == 'postgresql' else sqlite.insert
 
 # Create all tables on startup (safe to run multiple times - only creates if not exists)
 Base.metadata.create_all(db_engine)
@@ -66,14 +100,158 @@ def migrate_game_users_table():
 
 migrate_game_users_table()
 
-# Helper function to get user from keyword
+# Migration: Add the thumbnail variants column to avatars (shared with the avatar scripts)
+migrate_avatars_table(db_engine)
+
+# Migration: Remove duplicate (user_id, avatar_id) ownership rows so the unique index can be built
+def migrate_game_user_avatars_duplicates():
+    inspector = inspect(db_engine)
+    if 'game_user_avatars' not in inspector.get_table_names():
+        return
+    if any(ix['name'] == 'ux_game_user_avatars_user_avatar' for ix in inspector.get_indexes('game_user_avatars')):
+        return
+
+    with db_engine.connect() as conn:
+        duplicates = conn.execute(
+            select(GameUserAvatar.user_id, GameUserAvatar.avatar_id)
+            .group_by(GameUserAvatar.user_id, GameUserAvatar.avatar_id)
+            .having(func.count() > 1)
+        ).all()
+        if not duplicates:
+            return
+        removed = 0
+        for user_id, avatar_id in duplicates:
+            # Keep the first purchase
+            ids = conn.scalars(
+                select(GameUserAvatar.id)
+                .where(GameUserAvatar.user_id == user_id, GameUserAvatar.avatar_id == avatar_id)
+                .order_by(GameUserAvatar.purchased_at, GameUserAvatar.id)
+            ).all()
+            conn.execute(delete(GameUserAvatar).where(GameUserAvatar.id.in_(ids[1:])))
+            removed += len(ids) - 1
+        # Re-sync the denormalized counter of the affected players
+        owned = (select(func.count()).select_from(GameUserAvatar)
+                 .where(GameUserAvatar.user_id == GameUser.id)
+                 .scalar_subquery())
+        conn.execute(
+            update(GameUser)
+            .where(GameUser.id.in_({user_id for user_id, _ in duplicates}))
+            .values(avatars=owned)
+        )
+        conn.commit()
+        print(f"Removed {removed} duplicate game_user_avatars rows")
+
+migrate_game_user_avatars_duplicates()
+
+# Migration: Create model indexes that were added after their tables already existed
+def migrate_indexes():
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(db_engine, checkfirst=True)
+            except Exception as e:
+                print(f"Could not create index {index.name}: {e}")
+
+migrate_indexes()
+
+# Full-text search over Form A (FTS5 on SQLite, tsvector + GIN on PostgreSQL)
+search_enabled = ensure_search_index(db_engine)
+
+# Bounded LRU cache with a per-entry TTL, safe to share between request threads
+class LRUCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+# Compact, detached copy of a User row - this is what the keyword cache stores
+class CachedUser:
+    __slots__ = ('id', 'email', 'keyword', 'author', 'active', 'status')
+
+    def __init__(self, id, email, keyword, author, active, status):
+        self.id = id
+        self.email = email
+        self.keyword = keyword
+        self.author = author
+        self.active = active
+        self.status = status
+
+keyword_cache = LRUCache(app.config["KEYWORD_CACHE_SIZE"], app.config["KEYWORD_CACHE_TTL"])
+
+# Helper function to get user from keyword (served from keyword_cache when possible)
 def get_user_by_keyword(keyword):
+    user = keyword_cache.get(keyword)
+    if user is not None:
+        return user
+
     with Session(db_engine) as db_session:
-        user = db_session.query(User).filter(User.keyword == keyword).one_or_none()
-        if user:
-            # Return a detached copy with only the needed attributes
-            return type('obj', (object,), {'id': user.id, 'email': user.email, 'keyword': user.keyword})()
-    return None
+        row = db_session.execute(
+            select(User.id, User.email, User.keyword, User.author, User.active, User.status)
+            .where(User.keyword == keyword)
+        ).one_or_none()
+    if row is None:
+        return None
+
+    user = CachedUser(*row)
+    keyword_cache.set(keyword, user)
+    return user
+
+# Drop cached identities when a user's keyword, active flag or status changes.
+# Writes made by other processes (e.g. scripts/) are picked up once the TTL expires.
+@event.listens_for(User, 'after_update')
+def invalidate_keyword_cache(mapper, connection, target):
+    state = inspect(target)
+    changed = False
+    for attr in ('keyword', 'active', 'status'):
+        history = state.attrs[attr].history
+        if history.has_changes():
+            changed = True
+            for old_value in history.deleted:
+                if attr == 'keyword' and old_value:
+                    keyword_cache.pop(old_value)
+    if changed:
+        keyword_cache.pop(target.keyword)
+
+@event.listens_for(User, 'after_delete')
+def evict_deleted_user(mapper, connection, target):
+    keyword_cache.pop(target.keyword)
 
 # Decorator to require keyword authentication
 def keyword_required(f):
@@ -129,19 +307,25 @@ def form_a():
             flash("About is required.", "error")
             return render_template("form_a.html", keyword=g.keyword)
 
+        fields = {
+            "user_id": g.current_user.id,
+            "about": about,
+            "headline": headline,
+            "lede": lede,
+            "nut_graf": nut_graf,
+            "body": body,
+            "conclusion": conclusion,
+            "organizations": organizations,
+            "persons": persons
+        }
         with Session(db_engine) as db_session:
-            record = FormA(
-                user_id=g.current_user.id,
-                about=about,
-                headline=headline,
-                lede=lede,
-                nut_graf=nut_graf,
-                body=body,
-                conclusion=conclusion,
-                organizations=organizations,
-                persons=persons
-            )
+            record = FormA(**fields)
             db_session.add(record)
+            db_session.flush()
+            indexed = {"id": record.id, "created_at": record.created_at, **fields}
+            if search_enabled:
+                index_form_a(db_session.connection(), [indexed])
+            index_entities(db_session.connection(), [indexed])
             db_session.commit()
         flash("Form A submitted.", "success")
         return redirect(url_for("dashboard", key=g.keyword))
@@ -186,21 +370,369 @@ def form_c():
     return render_template("form_c.html", keyword=g.keyword)
 
 # ---- Button D: Records Table ----
+TIMELINE_PAGE_SIZE = 25
+
+# Listing columns per form - the large Text columns are never loaded for the timeline
+TIMELINE_SOURCES = (
+    ("Form A", FormA, (FormA.headline, FormA.about)),
+    ("Form B", FormB, (FormB.name,)),
+    ("Form C", FormC, (FormC.subject,)),
+)
+
+def encode_cursor(created_at, record_id):
+    raw = f"{created_at.isoformat()}|{record_id.hex}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Return (created_at, id) from a timeline cursor, or None if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, record_id = raw.split("|")
+        return datetime.datetime.fromisoformat(created_at), uuid.UUID(record_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def load_timeline_page(db_session, user_id, cursor=None, backwards=False, limit=TIMELINE_PAGE_SIZE):
+    """Keyset page over forms A/B/C, newest first.
+
+    Each form is read with its own range scan on (user_id, created_at, id),
+    limited to limit + 1 rows, and the sorted streams are merged here.
+    """
+    streams = []
+    for label, model, columns in TIMELINE_SOURCES:
+        stmt = select(model.id, model.created_at, model.author, *columns).where(model.user_id == user_id)
+        if cursor:
+            created_at, record_id = cursor
+            if backwards:
+                stmt = stmt.where(or_(model.created_at > created_at,
+                                      and_(model.created_at == created_at, model.id > record_id)))
+            else:
+                stmt = stmt.where(or_(model.created_at < created_at,
+                                      and_(model.created_at == created_at, model.id < record_id)))
+        if backwards:
+            stmt = stmt.order_by(model.created_at.asc(), model.id.asc())
+        else:
+            stmt = stmt.order_by(model.created_at.desc(), model.id.desc())
+        streams.append([(label, row) for row in db_session.execute(stmt.limit(limit + 1))])
+
+    merged = heapq.merge(*streams, key=lambda item: (item[1].created_at, item[1].id), reverse=not backwards)
+    rows = [item for _, item in zip(range(limit + 1), merged)]
+    has_more = len(rows) > limit
+    if backwards and not has_more:
+        # Paged back past the newest record - show the regular first page instead
+        return load_timeline_page(db_session, user_id, None, False, limit)
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+
+    records = [{
+        "type": label,
+        "uuid": str(row.id),
+        "headline": (row.headline or row.about[:50]) if label == "Form A" else row[3],
+        "author": row.author or "N/A",
+        "created_at": row.created_at
+    } for label, row in rows]
+
+    if backwards:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor is not None, has_more
+    prev_cursor = encode_cursor(rows[0][1].created_at, rows[0][1].id) if rows and has_prev else None
+    next_cursor = encode_cursor(rows[-1][1].created_at, rows[-1][1].id) if rows and has_next else None
+    return records, prev_cursor, next_cursor
+
 @app.route("/form/d", methods=["GET"])
 @keyword_required
 def form_d():
-    records = []
+    cursor = None
+    backwards = False
+    if request.args.get("before"):
+        cursor, backwards = decode_cursor(request.args["before"]), True
+    elif request.args.get("after"):
+        cursor = decode_cursor(request.args["after"])
+    if cursor is None:
+        backwards = False
+
     with Session(db_engine) as db_session:
-        for rec in db_session.query(FormA).filter(FormA.user_id == g.current_user.id).all():
-            records.append({
-                "type": "Form A",
-                "uuid": str(rec.id),
-                "headline": rec.headline or rec.about[:50],
-                "author": rec.author or "N/A",
-                "created_at": rec.created_at
+        records, prev_cursor, next_cursor = load_timeline_page(db_session, g.current_user.id, cursor, backwards)
+    return render_template("form_d.html", records=records, keyword=g.keyword,
+                           prev_cursor=prev_cursor, next_cursor=next_cursor)
+
+# ---- Form A Search ----
+SEARCH_PAGE_SIZE = 20
+
+@app.route("/form/a/search", methods=["GET"])
+@keyword_required
+def form_a_search():
+    query = request.args.get("q", "").strip()[:200]
+    page = max(request.args.get("page", 1, type=int), 1)
+    results, has_more = [], False
+    if query and search_enabled:
+        with Session(db_engine) as db_session:
+            results, has_more = search_form_a(db_session.connection(), g.current_user.id, query,
+                                              page=page, per_page=SEARCH_PAGE_SIZE)
+    elif query:
+        flash("Search is not available on this database.", "error")
+    return render_template("form_a_search.html", keyword=g.keyword, query=query, page=page,
+                           results=results, has_more=has_more)
+
+# ---- Form A Entities (persons / organizations) ----
+def entity_kind_arg():
+    kind = request.args.get("kind", "").strip().lower() or None
+    return kind if kind in ENTITY_FIELDS.values() else None
+
+@app.route("/entities/lookup", methods=["GET"])
+@keyword_required
+def entity_lookup():
+    name = request.args.get("name", "").strip()
+    if not name:
+        return jsonify({"error": "name is required"}), 400
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+    with Session(db_engine) as db_session:
+        conn = db_session.connection()
+        matches = []
+        for entity in find_entity(conn, name, entity_kind_arg()):
+            stories = stories_mentioning(conn, entity.id, g.current_user.id, limit)
+            matches.append({
+                "id": str(entity.id),
+                "kind": entity.kind,
+                "name": entity.name,
+                "stories": [{
+                    "uuid": str(s.id),
+                    "headline": s.headline or s.about[:50],
+                    "created_at": s.created_at.isoformat() if s.created_at else None
+                } for s in stories]
             })
-    records.sort(key=lambda r: r["created_at"] or datetime.datetime.min, reverse=True)
-    return render_template("form_d.html", records=records, keyword=g.keyword)
+    return jsonify({"entities": matches})
+
+@app.route("/entities/top", methods=["GET"])
+@keyword_required
+def entity_top():
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    with Session(db_engine) as db_session:
+        rows = top_entities(db_session.connection(), g.current_user.id, entity_kind_arg(), limit)
+    return jsonify({"entities": [
+        {"id": str(r.id), "kind": r.kind, "name": r.name, "mentions": r.mentions} for r in rows
+    ]})
+
+@app.route("/entities/<uuid:entity_id>/cooccurrences", methods=["GET"])
+@keyword_required
+def entity_cooccurrences(entity_id):
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    with Session(db_engine) as db_session:
+        rows = cooccurring_entities(db_session.connection(), entity_id, g.current_user.id, limit)
+    return jsonify({"entity_id": str(entity_id), "entities": [
+        {"id": str(r.id), "kind": r.kind, "name": r.name, "stories": r.stories} for r in rows
+    ]})
+
+# ---- Bulk Export (CSV / NDJSON) ----
+EXPORT_FORMS = {"a": FormA, "b": FormB, "c": FormC}
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+def export_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+def iter_export_rows(user_id, forms, since):
+    """Yield (form, row mapping) for every record, streamed with a server-side cursor"""
+    with Session(db_engine) as db_session:
+        for form in forms:
+            model = EXPORT_FORMS[form]
+            stmt = select(model.__table__).where(model.user_id == user_id)
+            if since:
+                stmt = stmt.where(model.last_update >= since)
+            stmt = stmt.order_by(model.created_at, model.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+            for row in db_session.execute(stmt):
+                yield form, row._mapping
+
+def iter_export_csv(rows, forms):
+    columns = []
+    for form in forms:
+        columns += [c.name for c in EXPORT_FORMS[form].__table__.columns if c.name not in columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["form"] + columns)
+    for form, row in rows:
+        writer.writerow([form] + [export_value(row.get(c)) for c in columns])
+        if buffer.tell() >= EXPORT_FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def iter_export_ndjson(rows):
+    chunk = []
+    size = 0
+    for form, row in rows:
+        line = json.dumps({"form": form, **{k: export_value(v) for k, v in row.items()}}) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_FLUSH_BYTES:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    yield "".join(chunk)
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route("/export", methods=["GET"])
+@keyword_required
+def export_records():
+    form_arg = request.args.get("form", "all").strip().lower()
+    forms = list(EXPORT_FORMS) if form_arg == "all" else [form_arg]
+    if any(form not in EXPORT_FORMS for form in forms):
+        return jsonify({"error": "form must be a, b, c or all"}), 400
+
+    fmt = request.args.get("format", "ndjson").strip().lower()
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    since = None
+    if request.args.get("since"):
+        try:
+            since = datetime.datetime.fromisoformat(request.args["since"])
+        except ValueError:
+            return jsonify({"error": "since must be an ISO 8601 timestamp"}), 400
+
+    rows = iter_export_rows(g.current_user.id, forms, since)
+    if fmt == "csv":
+        chunks, mimetype = iter_export_csv(rows, forms), "text/csv"
+    else:
+        chunks, mimetype = iter_export_ndjson(rows), "application/x-ndjson"
+    filename = f"newsflash-{form_arg}-{datetime.datetime.utcnow():%Y%m%d%H%M%S}.{fmt}"
+    if request.args.get("gzip") in ("1", "true", "yes"):
+        chunks, mimetype, filename = iter_gzip(chunks), "application/gzip", filename + ".gz"
+
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+# ---- Bulk Import (NDJSON) ----
+# Fields accepted per form, the first one being required (same rules as the form handlers)
+IMPORT_FIELDS = {
+    "a": ("about", "headline", "lede", "nut_graf", "body", "conclusion", "organizations", "persons"),
+    "b": ("name", "summary", "comment"),
+    "c": ("subject", "details", "extra"),
+}
+IMPORT_MAX_ERRORS = 1000
+
+# Search/entity indexing of imported Form A stories, a chunk at a time (see index_queue.py)
+index_queue = IndexQueue(db_engine, search=search_enabled, batch_size=app.config["INDEX_QUEUE_BATCH_SIZE"],
+                         interval_seconds=app.config["INDEX_QUEUE_INTERVAL_SECONDS"])
+
+def run_index_queue():
+    while True:
+        socketio.sleep(index_queue.interval_seconds)
+        try:
+            index_queue.run_pending()
+        except Exception as e:
+            print(f"Could not index imported stories: {e}")
+
+socketio.start_background_task(run_index_queue)
+
+def validate_import_line(data, form):
+    """Return (form, column values) for one NDJSON object, or raise ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError("line is not a JSON object")
+    form = form or str(data.get("form", "")).strip().lower()
+    if form not in IMPORT_FIELDS:
+        raise ValueError("form must be a, b or c")
+    table = EXPORT_FORMS[form].__table__
+    fields = IMPORT_FIELDS[form]
+
+    values = {}
+    for field in fields + ("author",):
+        value = data.get(field)
+        value = "" if value is None else str(value).strip()
+        limit = getattr(table.c[field].type, "length", None)
+        if limit and len(value) > limit:
+            raise ValueError(f"{field} is longer than {limit} characters")
+        values[field] = value
+    if not values[fields[0]]:
+        raise ValueError(f"{fields[0]} is required")
+    values["author"] = values["author"] or None
+
+    created_at = datetime.datetime.utcnow()
+    if data.get("created_at"):
+        try:
+            created_at = datetime.datetime.fromisoformat(str(data["created_at"]))
+        except ValueError:
+            raise ValueError("created_at must be an ISO 8601 timestamp")
+    values.update(id=uuid7(), created_at=created_at, last_update=created_at, active=True, status=None)
+    return form, values
+
+def insert_import_rows(conn, form, rows):
+    """Write validated rows of one form; Form A stories are queued for search and entity indexing"""
+    columns = tuple(rows[0])
+    bulk_insert(conn, EXPORT_FORMS[form].__table__, columns, [tuple(row[c] for c in columns) for row in rows])
+    if form == "a":
+        index_queue.enqueue(conn, [row["id"] for row in rows])
+
+def flush_import_batch(conn, form, batch, result):
+    """Insert one batch (COPY / executemany, see bulk.py); on failure retry row by row to isolate the bad lines"""
+    rows = [values for _, values in batch]
+    try:
+        with conn.begin_nested():
+            insert_import_rows(conn, form, rows)
+        result["inserted"] += len(rows)
+    except Exception:
+        for line_no, values in batch:
+            try:
+                with conn.begin_nested():
+                    insert_import_rows(conn, form, [values])
+                result["inserted"] += 1
+            except Exception as e:
+                record_import_error(result, line_no, f"database error: {e.__class__.__name__}")
+    conn.commit()
+
+def record_import_error(result, line_no, message):
+    result["error_count"] += 1
+    if len(result["errors"]) < IMPORT_MAX_ERRORS:
+        result["errors"].append({"line": line_no, "error": message})
+
+@app.route("/import", methods=["POST"])
+@keyword_required
+def import_records():
+    form = request.args.get("form", "").strip().lower() or None
+    if form and form not in IMPORT_FIELDS:
+        return jsonify({"error": "form must be a, b or c"}), 400
+    batch_size = min(max(request.args.get("batch_size", app.config["IMPORT_BATCH_SIZE"], type=int), 1),
+                     app.config["IMPORT_MAX_BATCH_SIZE"])
+
+    user_id = g.current_user.id
+    result = {"inserted": 0, "error_count": 0, "errors": []}
+    batches = {key: [] for key in IMPORT_FIELDS}
+    with index_queue.importing(), db_engine.connect() as conn:
+        # request.stream reads byte-wise on readline(); buffer it so lines are split in bulk
+        stream = io.BufferedReader(request.stream, 64 * 1024)
+        for line_no, raw in enumerate(stream, 1):
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                line_form, values = validate_import_line(json.loads(raw), form)
+            except (ValueError, UnicodeDecodeError) as e:  # json.JSONDecodeError is a ValueError
+                record_import_error(result, line_no, str(e))
+                continue
+            values["user_id"] = user_id
+            batch = batches[line_form]
+            batch.append((line_no, values))
+            if len(batch) >= batch_size:
+                flush_import_batch(conn, line_form, batch, result)
+                batch.clear()
+        for line_form, batch in batches.items():
+            if batch:
+                flush_import_batch(conn, line_form, batch, result)
+
+    return jsonify(result)
 
 # ---- Form D Detail View ----
 @app.route("/form/d/<uuid:record_id>", methods=["GET"])
@@ -217,60 +749,139 @@ def form_d_detail(record_id):
 # LABYRINTH GAME ROUTES
 # ============================================
 
+# Precompressed, fingerprinted copies of games/ and static/ (built by scripts/build_assets.py)
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+asset_table = AssetTable(page_max_age=app.config["ASSET_PAGE_MAX_AGE"])
+if asset_table.load(os.path.join(APP_DIR, app.config["ASSET_BUILD_DIR"]), APP_DIR):
+    print("Serving games/ and static/ from the asset build")
+
+def send_asset(directory, filename):
+    """Serve a file from the asset build when it has one, else from disk"""
+    relpath = os.path.relpath(os.path.join(directory, filename), APP_DIR).replace(os.sep, '/')
+    asset, immutable = asset_table.lookup(relpath)
+    if asset is None:
+        return send_from_directory(directory, filename)
+    return asset_table.respond(asset, immutable, request)
+
+def serve_static_asset(filename):
+    return send_asset(app.static_folder, filename)
+
+app.view_functions['static'] = serve_static_asset
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    # url_for('static', filename=...) points templates at the immutable fingerprinted name
+    if endpoint == 'static' and 'filename' in values and asset_table.enabled:
+        values['filename'] = asset_table.url_for('static/' + values['filename'])[len('static/'):]
+
 # Serve game static files
 GAME_DIR = os.path.join(os.path.dirname(__file__), 'games', '01')
 GAME_IMG_DIR = os.path.join(os.path.dirname(__file__), 'games', 'img')
 
+thumbnail_cache = ThumbnailCache(
+    os.path.join(APP_DIR, app.config["THUMBNAIL_DIR"]),
+    os.path.join(GAME_IMG_DIR, 'avatars'),
+    widths=app.config["THUMBNAIL_WIDTHS"],
+    quality=app.config["THUMBNAIL_QUALITY"]
+)
+if not thumbnail_cache.available:
+    # The pages still work, but with one full-size image per avatar
+    print("Pillow (with WebP support) not installed - no avatar thumbnails or sprite atlas (pip install -r requirements.txt)")
+
 @app.route('/games/img/<path:filename>')
 def serve_game_images(filename):
-    return send_from_directory(GAME_IMG_DIR, filename)
+    # Avatar thumbnails: content-addressed, generated on first request if not in the cache yet
+    if filename.startswith('thumbs/'):
+        path = thumbnail_cache.ensure(filename[len('thumbs/'):])
+        if path is None:
+            return jsonify({'error': 'Thumbnail not found'}), 404
+        response = send_from_directory(os.path.dirname(path), os.path.basename(path))
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+    return send_asset(GAME_IMG_DIR, filename)
 
 @app.route('/games/01/')
 @app.route('/games/01/<path:filename>')
 def serve_game(filename='login.html'):
-    return send_from_directory(GAME_DIR, filename)
+    return send_asset(GAME_DIR, filename)
 
 GAME_02_DIR = os.path.join(os.path.dirname(__file__), 'games', '02')
 
 @app.route('/games/02/')
 @app.route('/games/02/<path:filename>')
 def serve_game_02(filename='game.html'):
-    return send_from_directory(GAME_02_DIR, filename)
+    return send_asset(GAME_02_DIR, filename)
 
 GAME_03_DIR = os.path.join(os.path.dirname(__file__), 'games', '03')
 
 @app.route('/games/03/')
 @app.route('/games/03/<path:filename>')
 def serve_game_03(filename='game.html'):
-    return send_from_directory(GAME_03_DIR, filename)
+    return send_asset(GAME_03_DIR, filename)
 
 GAME_04_DIR = os.path.join(os.path.dirname(__file__), 'games', '04')
 
 @app.route('/games/04/')
 @app.route('/games/04/<path:filename>')
 def serve_game_04(filename='game.html'):
-    return send_from_directory(GAME_04_DIR, filename)
+    return send_asset(GAME_04_DIR, filename)
 
 GAME_05_DIR = os.path.join(os.path.dirname(__file__), 'games', '05')
 
 @app.route('/games/05/')
 @app.route('/games/05/<path:filename>')
 def serve_game_05(filename='game.html'):
-    return send_from_directory(GAME_05_DIR, filename)
+    return send_asset(GAME_05_DIR, filename)
 
 GAME_06_DIR = os.path.join(os.path.dirname(__file__), 'games', '06')
 
 @app.route('/games/06/')
 @app.route('/games/06/<path:filename>')
 def serve_game_06(filename='game.html'):
-    return send_from_directory(GAME_06_DIR, filename)
+    return send_asset(GAME_06_DIR, filename)
 
 GAME_07_DIR = os.path.join(os.path.dirname(__file__), 'games', '07')
 
 @app.route('/games/07/')
 @app.route('/games/07/<path:filename>')
 def serve_game_07(filename='game.html'):
-    return send_from_directory(GAME_07_DIR, filename)
+    return send_asset(GAME_07_DIR, filename)
+
+# Verified game tokens, keyed by a hash of the token and kept until the token's exp
+verified_game_tokens = LRUCache(maxsize=app.config["GAME_TOKEN_CACHE_SIZE"], ttl=app.config["GAME_TOKEN_CACHE_TTL"])
+
+def verify_game_token(token):
+    """(user id, username) of a valid token; raises jwt errors, KeyError or ValueError otherwise"""
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    claims = verified_game_tokens.get(key)
+    if claims is None:
+        data = jwt.decode(token, GAME_JWT_SECRET, algorithms=['HS256'])
+        # As a UUID so it binds to Uuid columns on every backend (SQLite rejects the plain string)
+        claims = (uuid.UUID(data['id']), data['username'])
+        ttl = verified_game_tokens.ttl
+        if 'exp' in data:
+            ttl = min(ttl, data['exp'] - time.time())
+        if ttl > 0:
+            verified_game_tokens.set(key, claims, ttl=ttl)
+    return claims
+
+# Request-scoped database session for the game API, closed when the request ends
+def game_db():
+    if 'game_db' not in g:
+        g.game_db = Session(db_engine, expire_on_commit=False)
+    return g.game_db
+
+@app.teardown_appcontext
+def close_game_db(exc):
+    db_session = g.pop('game_db', None)
+    if db_session is not None:
+        db_session.close()
+
+# The authenticated GameUser, loaded at most once per request (None if it no longer exists)
+def load_game_user():
+    if 'game_user' not in g:
+        g.game_user = game_db().get(GameUser, g.game_user_id)
+    return g.game_user
 
 # Game JWT authentication decorator
 def game_token_required(f):
@@ -285,17 +896,40 @@ def game_token_required(f):
             return jsonify({'error': 'Access token required'}), 401
 
         try:
-            data = jwt.decode(token, GAME_JWT_SECRET, algorithms=['HS256'])
-            g.game_user_id = data['id']
-            g.game_username = data['username']
+            g.game_user_id, g.game_username = verify_game_token(token)
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token expired'}), 403
-        except jwt.InvalidTokenError:
+        except (jwt.InvalidTokenError, KeyError, ValueError):
             return jsonify({'error': 'Invalid token'}), 403
 
         return f(*args, **kwargs)
     return decorated
 
+# bcrypt runs in a small bounded process pool so a burst of logins cannot tie up every request thread
+password_hasher = PasswordHasher(
+    rounds=app.config["BCRYPT_ROUNDS"],
+    workers=app.config["PASSWORD_POOL_WORKERS"],
+    max_pending=app.config["PASSWORD_POOL_MAX_PENDING"],
+    timeout=app.config["PASSWORD_HASH_TIMEOUT"],
+    request_threads=app.config["WEB_THREADS"]
+)
+
+@app.errorhandler(PasswordPoolBusy)
+def password_pool_busy(e):
+    response = jsonify({'error': 'Server is busy, please try again in a moment'})
+    response.headers['Retry-After'] = '2'
+    return response, 503
+
+def with_hash_timing(response, elapsed_ms):
+    """Expose time spent waiting on bcrypt as a Server-Timing metric"""
+    response.headers['Server-Timing'] = f'bcrypt;dur={elapsed_ms:.1f}'
+    return response
+
+# Game API: Password pool metrics
+@app.route('/games/01/api/metrics/passwords', methods=['GET'])
+def game_password_metrics():
+    return jsonify(password_hasher.stats())
+
 # Game API: Register
 @app.route('/games/01/api/register', methods=['POST'])
 def game_register():
@@ -321,20 +955,23 @@ def game_register():
             return jsonify({'error': 'Username already taken'}), 400
 
         # Hash password
-        hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        hashed, hash_ms = password_hasher.hash(password)
 
         # Create user
         user = GameUser(
             name=name,
             username=username,
-            password=hashed.decode('utf-8'),
+            password=hashed,
             coins=0,
-            highest_level=1
+            highest_level=1,
+            highest_level_at=datetime.datetime.utcnow()
         )
         db_session.add(user)
         db_session.commit()
 
-        return jsonify({'message': 'User registered successfully', 'userId': str(user.id)}), 201
+        leaderboard.update(str(user.id), name=name, highest_level=1,
+                           highest_level_at=user.highest_level_at, avatars=0, coins=0)
+        return with_hash_timing(jsonify({'message': 'User registered successfully', 'userId': str(user.id)}), hash_ms), 201
 
 # Game API: Login
 @app.route('/games/01/api/login', methods=['POST'])
@@ -353,8 +990,18 @@ def game_login():
         if not user:
             return jsonify({'error': 'Invalid username or password'}), 401
 
-        if not bcrypt.checkpw(password.encode('utf-8'), user.password.encode('utf-8')):
-            return jsonify({'error': 'Invalid username or password'}), 401
+        matches, hash_ms = password_hasher.check(password, user.password)
+        if not matches:
+            return with_hash_timing(jsonify({'error': 'Invalid username or password'}), hash_ms), 401
+
+        # Transparently upgrade hashes made with a different cost factor
+        if password_hasher.needs_rehash(user.password):
+            try:
+                user.password, rehash_ms = password_hasher.hash(password)
+                db_session.commit()
+                hash_ms += rehash_ms
+            except PasswordPoolBusy:
+                pass  # Keep the old hash, try again on a later login
 
         # Generate JWT token (7 days expiry)
         token = jwt.encode({
@@ -363,7 +1010,7 @@ def game_login():
             'exp': datetime.datetime.utcnow() + datetime.timedelta(days=7)
         }, GAME_JWT_SECRET, algorithm='HS256')
 
-        return jsonify({
+        return with_hash_timing(jsonify({
             'message': 'Login successful',
             'token': token,
             'user': {
@@ -373,54 +1020,92 @@ def game_login():
                 'coins': user.coins,
                 'highest_level': user.highest_level
             }
-        })
+        }), hash_ms)
 
 # Game API: Get Profile
 @app.route('/games/01/api/user/profile', methods=['GET'])
 @game_token_required
 def game_profile():
-    with Session(db_engine) as db_session:
-        user = db_session.query(GameUser).filter(GameUser.id == g.game_user_id).first()
+    db_session = game_db()
+    user = load_game_user()
 
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    # Get owned avatar ids from database (just the ids, not whole GameUserAvatar rows)
+    owned_avatars = db_session.scalars(
+        select(GameUserAvatar.avatar_id).where(GameUserAvatar.user_id == user.id)
+    ).all()
+    # avatars counts purchased avatars; the default one is always owned
+    avatars_count = user.avatars or 0
+    if 'avatar-default' not in owned_avatars:
+        owned_avatars.insert(0, 'avatar-default')
+        avatars_count += 1
+
+    return jsonify({
+        'user': {
+            'id': str(user.id),
+            'name': user.name,
+            'username': user.username,
+            # Include deltas this worker has not flushed yet
+            'coins': max((user.coins or 0) + wallet.pending(user.id), 0),
+            'highest_level': user.highest_level,
+            'highest_level_at': user.highest_level_at.isoformat() if user.highest_level_at else None,
+            'owned_avatars': owned_avatars,
+            'selected_avatar': user.selected_avatar or 'avatar-default',
+            'avatars_count': avatars_count
+        }
+    })
 
-        # Get owned avatars from database
-        owned_avatars = [ua.avatar_id for ua in user.owned_avatars]
-        if 'avatar-default' not in owned_avatars:
-            owned_avatars.insert(0, 'avatar-default')
+# Game wallet: signed coin deltas, coalesced per player and flushed every WALLET_FLUSH_SECONDS
+wallet = Wallet(db_engine, window_seconds=app.config["WALLET_FLUSH_SECONDS"],
+                key_ttl_hours=app.config["WALLET_KEY_TTL_HOURS"])
 
-        return jsonify({
-            'user': {
-                'id': str(user.id),
-                'name': user.name,
-                'username': user.username,
-                'coins': user.coins,
-                'highest_level': user.highest_level,
-                'highest_level_at': user.highest_level_at.isoformat() if user.highest_level_at else None,
-                'owned_avatars': owned_avatars,
-                'selected_avatar': user.selected_avatar or 'avatar-default',
-                'avatars_count': len(owned_avatars)
-            }
-        })
+def flush_wallet():
+    for user_id, coins in wallet.flush().items():
+        update_leaderboard_player(user_id, coins=coins)
 
-# Game API: Update Coins
-@app.route('/games/01/api/user/coins', methods=['PUT'])
-@game_token_required
-def game_update_coins():
-    data = request.get_json()
-    coins = data.get('coins')
+def run_wallet_flusher():
+    while True:
+        socketio.sleep(wallet.window_seconds)
+        try:
+            flush_wallet()
+        except Exception as e:
+            print(f"Could not flush wallet: {e}")
 
-    if not isinstance(coins, int) or coins < 0:
-        return jsonify({'error': 'Invalid coins value'}), 400
+socketio.start_background_task(run_wallet_flusher)
+# Don't lose the last window's deltas on a graceful shutdown
+atexit.register(wallet.flush)
 
-    with Session(db_engine) as db_session:
-        user = db_session.query(GameUser).filter(GameUser.id == g.game_user_id).first()
-        if user:
-            user.coins = coins
-            db_session.commit()
+# Game API: Add or spend coins (signed delta, optional idempotency key)
+@app.route('/games/01/api/user/wallet', methods=['POST'])
+@game_token_required
+def game_wallet_delta():
+    data = request.get_json(silent=True) or {}
+    delta = data.get('delta')
+    key = request.headers.get('Idempotency-Key') or data.get('key')
+
+    if not isinstance(delta, int) or isinstance(delta, bool):
+        return jsonify({'error': 'Invalid delta value'}), 400
+    if abs(delta) > app.config["WALLET_MAX_DELTA"]:
+        return jsonify({'error': 'Delta too large'}), 400
+    if key is not None and (not isinstance(key, str) or not 0 < len(key) <= 100):
+        return jsonify({'error': 'Invalid idempotency key'}), 400
+
+    if delta < 0:
+        # Spends are checked against the balance right away
+        result, coins = wallet.spend(g.game_user_id, delta, key)
+        if coins is None:
+            return jsonify({'error': 'User not found'}), 404
+        if result == 'insufficient':
+            return jsonify({'error': 'Not enough coins', 'coins': coins}), 409
+        if result == 'spent':
+            update_leaderboard_player(g.game_user_id, coins=coins)
+        return jsonify({'coins': coins, 'duplicate': result == 'duplicate'})
 
-        return jsonify({'message': 'Coins updated', 'coins': coins})
+    # Applied by the next flush; the response does not wait for it
+    queued = wallet.add(g.game_user_id, delta, key)
+    return jsonify({'queued': queued, 'duplicate': not queued}), 202
 
 # Game API: Change Password
 @app.route('/games/01/api/user/password', methods=['PUT'])
@@ -436,22 +1121,22 @@ def game_change_password():
     if len(new_password) < 4:
         return jsonify({'error': 'New password must be at least 4 characters'}), 400
 
-    with Session(db_engine) as db_session:
-        user = db_session.query(GameUser).filter(GameUser.id == g.game_user_id).first()
+    db_session = game_db()
+    user = load_game_user()
 
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
 
-        # Verify current password
-        if not bcrypt.checkpw(current_password.encode('utf-8'), user.password.encode('utf-8')):
-            return jsonify({'error': 'Current password is incorrect'}), 401
+    # Verify current password
+    matches, check_ms = password_hasher.check(current_password, user.password)
+    if not matches:
+        return with_hash_timing(jsonify({'error': 'Current password is incorrect'}), check_ms), 401
 
-        # Hash and save new password
-        hashed = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt())
-        user.password = hashed.decode('utf-8')
-        db_session.commit()
+    # Hash and save new password
+    user.password, hash_ms = password_hasher.hash(new_password)
+    db_session.commit()
 
-        return jsonify({'message': 'Password updated successfully'})
+    return with_hash_timing(jsonify({'message': 'Password updated successfully'}), check_ms + hash_ms)
 
 # Game API: Update Progress
 @app.route('/games/01/api/user/progress', methods=['PUT'])
@@ -459,136 +1144,216 @@ def game_change_password():
 def game_update_progress():
     data = request.get_json()
     level = data.get('level', 1)
-    coins = data.get('coins', 0)
+    # Coins only change through /user/wallet (signed deltas), never as absolute totals
+
+    db_session = game_db()
+    user = load_game_user()
 
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    # Update highest level and track when it was achieved
+    if level > user.highest_level:
+        user.highest_level = level
+        user.highest_level_at = datetime.datetime.utcnow()
+    db_session.commit()
+
+    leaderboard.update(str(g.game_user_id), name=user.name, highest_level=user.highest_level,
+                       highest_level_at=user.highest_level_at, avatars=user.avatars, coins=user.coins)
+    return jsonify({
+        'message': 'Progress saved',
+        'coins': user.coins,
+        'highest_level': user.highest_level
+    })
+
+# Game API: Leaderboard
+# Served from memory: seeded from the database at startup, updated by the game API
+# and re-seeded periodically to pick up writes made by other gunicorn workers.
+leaderboard = Leaderboard(top_k=app.config["LEADERBOARD_TOP_K"])
+
+def load_leaderboard():
     with Session(db_engine) as db_session:
-        user = db_session.query(GameUser).filter(GameUser.id == g.game_user_id).first()
+        rows = db_session.query(
+            GameUser.id,
+            GameUser.name,
+            GameUser.highest_level,
+            GameUser.highest_level_at,
+            GameUser.avatars,
+            GameUser.coins
+        ).order_by(
+            GameUser.highest_level.desc(),
+            GameUser.highest_level_at.asc()
+        ).all()
+    leaderboard.load(PlayerStanding(str(row[0]), *row[1:]) for row in rows)
 
+# Cold path: a player this worker has not seen yet (e.g. registered on another worker)
+def load_leaderboard_player(user_id):
+    with Session(db_engine) as db_session:
+        user = db_session.query(GameUser).filter(GameUser.id == user_id).first()
         if not user:
-            return jsonify({'error': 'User not found'}), 404
-
-        # Update highest level and track when it was achieved
-        if level > user.highest_level:
-            user.highest_level = level
-            user.highest_level_at = datetime.datetime.utcnow()
-        user.coins = coins
-        db_session.commit()
+            return False
+        leaderboard.update(str(user.id), name=user.name, highest_level=user.highest_level,
+                           highest_level_at=user.highest_level_at, avatars=user.avatars, coins=user.coins)
+    return True
+
+def update_leaderboard_player(user_id, **fields):
+    """Apply a partial update; a player this worker has not seen yet is loaded whole instead."""
+    if not leaderboard.update(str(user_id), create=False, **fields):
+        load_leaderboard_player(user_id)
+
+def refresh_leaderboard():
+    while True:
+        socketio.sleep(app.config["LEADERBOARD_REFRESH_SECONDS"])
+        try:
+            load_leaderboard()
+        except Exception as e:
+            print(f"Could not refresh leaderboard: {e}")
 
-        return jsonify({
-            'message': 'Progress saved',
-            'coins': coins,
-            'highest_level': user.highest_level
-        })
+try:
+    load_leaderboard()
+except Exception as e:
+    print(f"Could not load leaderboard: {e}")
+socketio.start_background_task(refresh_leaderboard)
 
-# Game API: Leaderboard
 @app.route('/games/01/api/leaderboard', methods=['GET'])
 def game_leaderboard():
-    from sqlalchemy import func
+    version, etag, body = leaderboard.snapshot()
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
-    with Session(db_engine) as db_session:
-        # Ranking 1: Highest level achieved, tie-break by earliest date
-        level_leaders = db_session.query(GameUser).order_by(
-            GameUser.highest_level.desc(),
-            GameUser.highest_level_at.asc()
-        ).limit(15).all()
+LEADERBOARD_BOARDS = ('level', 'avatars')
 
-        level_ranking = [{
-            'rank': i + 1,
-            'name': u.name,
-            'highest_level': u.highest_level,
-            'achieved_at': u.highest_level_at.strftime('%Y-%m-%d') if u.highest_level_at else None
-        } for i, u in enumerate(level_leaders)]
+# Game API: My rank, with the players ranked just above and below
+@app.route('/games/01/api/leaderboard/me', methods=['GET'])
+@game_token_required
+def game_leaderboard_me():
+    window = min(max(request.args.get('window', 5, type=int), 0), 50)
+    user_id = str(g.game_user_id)
+    if user_id not in leaderboard and not load_leaderboard_player(g.game_user_id):
+        return jsonify({'error': 'User not found'}), 404
+
+    result = {}
+    for board in LEADERBOARD_BOARDS:
+        rank, total, entries = leaderboard.around(board, user_id, window)
+        result[board] = {'rank': rank, 'total': total, 'window': entries}
+    return jsonify(result)
+
+# Game API: Full ranking, keyset-paginated with ?after=<cursor>
+@app.route('/games/01/api/leaderboard/<board>', methods=['GET'])
+def game_leaderboard_page(board):
+    if board not in LEADERBOARD_BOARDS:
+        return jsonify({'error': 'Unknown ranking'}), 404
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+
+    after = None
+    if request.args.get('after'):
+        after = decode_rank_cursor(board, request.args['after'])
+        if after is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    entries, last_key = leaderboard.page(board, after, limit)
+    return jsonify({
+        'ranking': entries,
+        'next': encode_rank_cursor(board, last_key) if last_key else None
+    })
 
-        # Ranking 2: Most avatars (count from game_user_avatars), tie-break by coins
-        avatar_counts = db_session.query(
-            GameUser.id,
-            GameUser.name,
-            GameUser.coins,
-            func.count(GameUserAvatar.id).label('avatar_count')
-        ).outerjoin(GameUserAvatar, GameUser.id == GameUserAvatar.user_id).group_by(
-            GameUser.id
-        ).order_by(
-            func.count(GameUserAvatar.id).desc(),
-            GameUser.coins.desc()
-        ).limit(15).all()
-
-        avatar_ranking = [{
-            'rank': i + 1,
-            'name': row.name,
-            'avatars': row.avatar_count,
-            'coins': row.coins
-        } for i, row in enumerate(avatar_counts)]
-
-        return jsonify({
-            'level_ranking': level_ranking,
-            'avatar_ranking': avatar_ranking
-        })
-
-# Helper function to get avatar prices from database
-def get_avatar_price(db_session, avatar_id):
-    """Get avatar price from database, return 0 for default avatar"""
+# Avatar catalog cache - shared by the marketplace API and purchases
+avatar_catalog = AvatarCatalog(
+    db_engine,
+    refresh_seconds=app.config["CATALOG_REFRESH_SECONDS"],
+    thumbnails=thumbnail_cache,
+    source_root=APP_DIR,
+    atlas_tile=app.config["AVATAR_ATLAS_TILE"],
+    atlas_max_tiles=app.config["AVATAR_ATLAS_MAX_TILES"]
+)
+
+# Helper function to get avatar prices (from the catalog cache)
+def get_avatar_price(avatar_id):
+    """Get avatar price, return 0 for default avatar and None for unknown/inactive avatars"""
     if avatar_id == 'avatar-default':
         return 0
-    avatar = db_session.query(Avatar).filter(Avatar.avatar_id == avatar_id, Avatar.active == True).first()
-    return avatar.price if avatar else None
+    return avatar_catalog.get_price(avatar_id)
 
 # Game API: Get all available avatars (for marketplace)
 @app.route('/games/01/api/avatars', methods=['GET'])
 def game_get_all_avatars():
-    """Get list of all available avatars with their details - only public avatars from database"""
+    """Get list of all available avatars with their details - only public avatars, from the catalog cache"""
+    catalog = avatar_catalog.snapshot()
+    response = Response(catalog.body, mimetype='application/json')
+    response.set_etag(catalog.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+# Game API: Everything the Labyrinth pages need (profile, owned avatars, catalog) in one round trip
+@app.route('/games/01/api/bootstrap', methods=['GET'])
+@game_token_required
+def game_bootstrap():
+    catalog = avatar_catalog.snapshot()
+    pending = wallet.pending(g.game_user_id)
+
     with Session(db_engine) as db_session:
-        # Only get public avatars from database
-        avatars = db_session.query(Avatar).filter(
-            Avatar.active == True,
-            Avatar.is_public == True
-        ).order_by(Avatar.price.asc()).all()
-
-        avatar_list = [{
-            'avatar_id': avatar.avatar_id,
-            'name': avatar.name,
-            'price': avatar.price,
-            'creator_name': avatar.creator_name,
-            'image_path': avatar.image_path,
-            'is_public': avatar.is_public,
-            'number_of_users': avatar.number_of_users
-        } for avatar in avatars]
-
-        # Add default avatar at beginning if not already in list
-        if not any(a['avatar_id'] == 'avatar-default' for a in avatar_list):
-            avatar_list.insert(0, {
-                'avatar_id': 'avatar-default',
-                'name': 'Default Avatar',
-                'price': 0,
-                'creator_name': None,
-                'image_path': 'games/img/avatars/public/avatar-default.png',
-                'is_public': True,
-                'number_of_users': 0
-            })
+        # Any change to the player bumps last_update, so a revalidation only needs this one column
+        last_update = db_session.scalar(select(GameUser.last_update).where(GameUser.id == g.game_user_id))
+        if last_update is None:
+            return jsonify({'error': 'User not found'}), 404
+        etag = f"{g.game_user_id.hex}-{last_update.timestamp():.6f}-{pending}-{catalog.etag}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+
+        # User and owned avatars in a single joined query
+        user = db_session.scalars(
+            select(GameUser).options(joinedload(GameUser.owned_avatars)).where(GameUser.id == g.game_user_id)
+        ).unique().one()
 
-        return jsonify({'avatars': avatar_list})
+        owned_avatars = [ua.avatar_id for ua in user.owned_avatars]
+        avatars_count = user.avatars or 0
+        if 'avatar-default' not in owned_avatars:
+            owned_avatars.insert(0, 'avatar-default')
+            avatars_count += 1
+        profile = json.dumps({
+            'id': str(user.id),
+            'name': user.name,
+            'username': user.username,
+            'coins': max((user.coins or 0) + pending, 0),
+            'highest_level': user.highest_level,
+            'highest_level_at': user.highest_level_at.isoformat() if user.highest_level_at else None,
+            'owned_avatars': owned_avatars,
+            'selected_avatar': user.selected_avatar or 'avatar-default',
+            'avatars_count': avatars_count
+        }, separators=(',', ':')).encode('utf-8')
+
+    # The catalog is spliced in pre-encoded
+    response = Response(b'{"user":' + profile + b',"catalog":' + catalog.body + b'}', mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 # Game API: Get user's avatars
 @app.route('/games/01/api/user/avatars', methods=['GET'])
 @game_token_required
 def game_get_avatars():
-    with Session(db_engine) as db_session:
-        user = db_session.query(GameUser).filter(GameUser.id == g.game_user_id).first()
+    user = load_game_user()
 
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
 
-        # Get list of owned avatar IDs
-        owned_avatars = [ua.avatar_id for ua in user.owned_avatars]
+    # Get list of owned avatar IDs
+    owned_avatars = [ua.avatar_id for ua in user.owned_avatars]
 
-        # Always include the default avatar
-        if 'avatar-default' not in owned_avatars:
-            owned_avatars.insert(0, 'avatar-default')
+    # Always include the default avatar
+    if 'avatar-default' not in owned_avatars:
+        owned_avatars.insert(0, 'avatar-default')
 
-        return jsonify({
-            'owned_avatars': owned_avatars,
-            'selected_avatar': user.selected_avatar or 'avatar-default',
-            'coins': user.coins
-        })
+    return jsonify({
+        'owned_avatars': owned_avatars,
+        'selected_avatar': user.selected_avatar or 'avatar-default',
+        'coins': user.coins
+    })
 
 # Game API: Buy an avatar
 @app.route('/games/01/api/user/avatars/buy', methods=['POST'])
@@ -600,58 +1365,64 @@ def game_buy_avatar():
     if not avatar_id:
         return jsonify({'error': 'Avatar ID is required'}), 400
 
-    with Session(db_engine) as db_session:
-        # Get avatar price from database
-        price = get_avatar_price(db_session, avatar_id)
-        if price is None:
-            return jsonify({'error': 'Invalid avatar'}), 400
-
-        user = db_session.query(GameUser).filter(GameUser.id == g.game_user_id).first()
-
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-
-        # Check if already owned
-        existing = db_session.query(GameUserAvatar).filter(
-            GameUserAvatar.user_id == user.id,
-            GameUserAvatar.avatar_id == avatar_id
+    # Get avatar price from the catalog cache
+    price = get_avatar_price(avatar_id)
+    if price is None:
+        return jsonify({'error': 'Invalid avatar'}), 400
+
+    # One transaction, no read-modify-write: the unique (user_id, avatar_id) index rejects a second
+    # purchase and the conditional UPDATE only deducts coins the player still has, so concurrent
+    # buys cannot double-spend or create duplicate ownership rows.
+    with db_engine.connect() as conn:
+        purchased = conn.execute(
+            insert_ignore(GameUserAvatar.__table__)
+            .values(id=uuid.uuid4(), user_id=g.game_user_id, avatar_id=avatar_id)
+            .on_conflict_do_nothing(index_elements=['user_id', 'avatar_id'])
+            .returning(GameUserAvatar.id)
         ).first()
-
-        if existing:
+        if purchased is None:
             return jsonify({'error': 'You already own this avatar'}), 400
 
-        # Check if user has enough coins
-        if user.coins < price:
-            return jsonify({'error': f'Not enough coins. You need {price} coins but only have {user.coins}'}), 400
-
-        # Deduct coins and create avatar ownership
-        user.coins -= price
-
-        new_avatar = GameUserAvatar(
-            user_id=user.id,
-            avatar_id=avatar_id
-        )
-        db_session.add(new_avatar)
+        user = conn.execute(
+            update(GameUser)
+            .where(GameUser.id == g.game_user_id, GameUser.coins >= price)
+            .values(coins=GameUser.coins - price, avatars=func.coalesce(GameUser.avatars, 0) + 1)
+            .returning(GameUser.name, GameUser.coins, GameUser.avatars)
+        ).first()
+        if user is None:
+            conn.rollback()
+            coins = conn.scalar(select(GameUser.coins).where(GameUser.id == g.game_user_id))
+            if coins is None:
+                return jsonify({'error': 'User not found'}), 404
+            return jsonify({'error': f'Not enough coins. You need {price} coins but only have {coins}'}), 400
 
         # Update avatar's number_of_users count if not default
         if avatar_id != 'avatar-default':
-            avatar = db_session.query(Avatar).filter(Avatar.avatar_id == avatar_id).first()
-            if avatar:
-                avatar.number_of_users += 1
-
-        db_session.commit()
+            conn.execute(
+                update(Avatar)
+                .where(Avatar.avatar_id == avatar_id)
+                # Keep last_update: it stamps catalog edits, not sales (catalog.py)
+                .values(number_of_users=func.coalesce(Avatar.number_of_users, 0) + 1, last_update=Avatar.last_update)
+            )
 
         # Get updated list of owned avatars
-        owned_avatars = [ua.avatar_id for ua in user.owned_avatars]
-        if 'avatar-default' not in owned_avatars:
-            owned_avatars.insert(0, 'avatar-default')
-
-        return jsonify({
-            'message': f'Successfully purchased {avatar_id}!',
-            'coins': user.coins,
-            'owned_avatars': owned_avatars,
-            'avatars_count': len(owned_avatars)
-        })
+        owned_avatars = conn.scalars(
+            select(GameUserAvatar.avatar_id).where(GameUserAvatar.user_id == g.game_user_id)
+        ).all()
+        conn.commit()
+
+    if avatar_id != 'avatar-default':
+        avatar_catalog.record_purchase(avatar_id)
+    update_leaderboard_player(g.game_user_id, name=user.name, avatars=user.avatars, coins=user.coins)
+    if 'avatar-default' not in owned_avatars:
+        owned_avatars.insert(0, 'avatar-default')
+
+    return jsonify({
+        'message': f'Successfully purchased {avatar_id}!',
+        'coins': user.coins,
+        'owned_avatars': owned_avatars,
+        'avatars_count': len(owned_avatars)
+    })
 
 # Game API: Set selected avatar
 @app.route('/games/01/api/user/avatars/select', methods=['PUT'])
@@ -663,35 +1434,72 @@ def game_select_avatar():
     if not avatar_id:
         return jsonify({'error': 'Avatar ID is required'}), 400
 
-    with Session(db_engine) as db_session:
-        user = db_session.query(GameUser).filter(GameUser.id == g.game_user_id).first()
+    db_session = game_db()
+    user = load_game_user()
 
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
 
-        # Check if user owns this avatar (or it's the default)
-        if avatar_id != 'avatar-default':
-            owned = db_session.query(GameUserAvatar).filter(
-                GameUserAvatar.user_id == user.id,
-                GameUserAvatar.avatar_id == avatar_id
-            ).first()
+    # Check if user owns this avatar (or it's the default)
+    if avatar_id != 'avatar-default':
+        owned = db_session.query(GameUserAvatar).filter(
+            GameUserAvatar.user_id == user.id,
+            GameUserAvatar.avatar_id == avatar_id
+        ).first()
 
-            if not owned:
-                return jsonify({'error': 'You do not own this avatar'}), 400
+        if not owned:
+            return jsonify({'error': 'You do not own this avatar'}), 400
 
-        user.selected_avatar = avatar_id
-        db_session.commit()
+    user.selected_avatar = avatar_id
+    db_session.commit()
 
-        return jsonify({
-            'message': 'Avatar selected',
-            'selected_avatar': avatar_id
-        })
+    return jsonify({
+        'message': 'Avatar selected',
+        'selected_avatar': avatar_id
+    })
 
 
 # ============================================================
 # ELF QUEST MULTIPLAYER — Socket.IO events
 # ============================================================
 
+# Player moves are sent to each room as one batched snapshot per tick (see broadcaster.py)
+room_broadcaster = TickBroadcaster(
+    socketio, game_rooms,
+    tick_hz=app.config["ROOM_TICK_HZ"],
+    min_hz=app.config["ROOM_TICK_MIN_HZ"],
+    adapt_players=app.config["ROOM_TICK_ADAPT_PLAYERS"]
+)
+room_broadcaster.register('elf', ('x', 'y', 'dir', 'frame', 'hasSword', 'hp'), encode_elf_batch)
+room_broadcaster.register('city', ('x', 'z', 'ry', 'moving'), encode_city_batch)
+socketio.start_background_task(room_broadcaster.run)
+
+# Dropped players keep their seat for a grace period and can resume it (see sessions.py)
+resume_sessions = ResumeSessions(app.config["SESSION_GRACE_SECONDS"])
+
+def evict_expired_sessions():
+    """Background task: free the seats of dropped players who did not come back in time."""
+    while True:
+        socketio.sleep(1)
+        try:
+            for sid in resume_sessions.expired():
+                left = game_rooms.leave(sid)
+                if left is None:
+                    continue
+                game, room, r, _ = left
+                release_player(r, sid)
+                socketio.emit(f'{game}_player_left', {'sid': sid}, to=room)
+        except Exception as e:
+            print(f"Session eviction failed: {e}")
+
+socketio.start_background_task(evict_expired_sessions)
+
+# Game API: Multiplayer room metrics
+@app.route('/games/01/api/metrics/rooms', methods=['GET'])
+def game_room_metrics():
+    return jsonify({'rooms': game_rooms.stats(), 'broadcast': room_broadcaster.stats(),
+                    'sessions': resume_sessions.stats()})
+
 @socketio.on('elf_join_room')
 def on_elf_join_room(data):
     sid = request.sid
@@ -705,34 +1513,56 @@ def on_elf_join_room(data):
     if not room:
         return
 
-    if room not in elf_rooms:
-        elf_rooms[room] = {'players': {}, 'openedChests': [], 'cutBushes': [], 'cutTrees': []}
-
-    r = elf_rooms[room]
-    if len(r['players']) >= 4 and sid not in r['players']:
-        emit('elf_room_full')
+    def new_player(r):
+        # Assign the lowest unused color slot (0=green, 1=blue, 2=red, 3=purple)
+        used_slots = {p.get('colorSlot', 0) for s, p in r['players'].items() if s != sid}
+        color_slot = next(i for i in range(4) if i not in used_slots)
+        return {
+            'username': username, 'x': x, 'y': y, 'dir': dir_,
+            'frame': 0, 'hasSword': has_sword, 'colorSlot': color_slot, 'hp': hp
+        }
+
+    with game_rooms.lock:
+        resumed = resume_seat('elf', room, data)
+        if resumed is not None:
+            old_sid, r, player = resumed
+            player.update({'x': x, 'y': y, 'dir': dir_, 'hasSword': has_sword, 'hp': hp})
+            left = None
+        else:
+            r, player, left = game_rooms.join(
+                'elf', room, sid,
+                lambda: {'players': {}, 'openedChests': [], 'cutBushes': [], 'cutTrees': [],
+                         'events': EventLog(app.config["ROOM_EVENT_BUFFER"])},
+                new_player, 4
+            )
+            if r is None:
+                emit('elf_room_full')
+                return
+        color_slot = player['colorSlot']
+        # Send current room state to the joining player
+        state = {
+            'sid': sid,
+            'myColorSlot': color_slot,
+            'players': {s: dict(p) for s, p in r['players'].items() if s != sid},
+            'resumeToken': resume_sessions.issue(sid),
+            'epoch': r['events'].epoch,
+            'seq': r['events'].seq,
+        }
+        # A client that still has the world up to some seq only needs the events since
+        missed = r['events'].since(data.get('epoch'), data.get('seq'))
+        if missed is not None:
+            state['events'] = missed
+        else:
+            state['openedChests'] = list(r['openedChests'])
+            state['cutBushes'] = list(r['cutBushes'])
+            state['cutTrees'] = list(r['cutTrees'])
+    announce_room_left(left)
+    join_game_room(room, data)
+    emit('elf_room_state', state)
+
+    if resumed is not None:
+        announce_resumed('elf', room, old_sid)
         return
-
-    # Assign the lowest unused color slot (0=green, 1=blue, 2=red, 3=purple)
-    used_slots = {p.get('colorSlot', 0) for p in r['players'].values()}
-    color_slot = next(i for i in range(4) if i not in used_slots)
-
-    r['players'][sid] = {
-        'username': username, 'x': x, 'y': y, 'dir': dir_,
-        'frame': 0, 'hasSword': has_sword, 'colorSlot': color_slot, 'hp': hp
-    }
-    sio_join_room(room)
-
-    # Send current room state to the joining player
-    emit('elf_room_state', {
-        'sid': sid,
-        'myColorSlot': color_slot,
-        'players': {s: p for s, p in r['players'].items() if s != sid},
-        'openedChests': r['openedChests'],
-        'cutBushes': r['cutBushes'],
-        'cutTrees': r['cutTrees'],
-    })
-
     # Notify others in the room (include full state so they place the new player correctly)
     emit('elf_player_joined', {
         'sid': sid, 'username': username,
@@ -743,18 +1573,17 @@ def on_elf_join_room(data):
 @socketio.on('elf_player_update')
 def on_elf_player_update(data):
     sid = request.sid
-    # Find which room this sid is in
-    for room, r in elf_rooms.items():
-        if sid in r['players']:
-            p = r['players'][sid]
-            p['x'] = data.get('x', p['x'])
-            p['y'] = data.get('y', p['y'])
-            p['dir'] = data.get('dir', p['dir'])
-            p['frame'] = data.get('frame', p['frame'])
-            p['hasSword'] = data.get('hasSword', p['hasSword'])
-            p['hp'] = data.get('hp', p.get('hp', 3))
-            emit('elf_remote_update', {'sid': sid, **p}, to=room, include_self=False)
-            break
+    found = game_rooms.find(sid, 'elf')
+    if found is None:
+        return
+    room, r, p = found
+    p['x'] = data.get('x', p['x'])
+    p['y'] = data.get('y', p['y'])
+    p['dir'] = data.get('dir', p['dir'])
+    p['frame'] = data.get('frame', p['frame'])
+    p['hasSword'] = data.get('hasSword', p['hasSword'])
+    p['hp'] = data.get('hp', p.get('hp', 3))
+    room_broadcaster.mark('elf', room, sid)
 
 
 @socketio.on('elf_world_event')
@@ -762,60 +1591,93 @@ def on_elf_world_event(data):
     sid = request.sid
     event_type = data.get('type')
     key = str(data.get('key', ''))
-    for room, r in elf_rooms.items():
-        if sid in r['players']:
-            if event_type == 'chest' and key not in r['openedChests']:
-                r['openedChests'].append(key)
-            elif event_type == 'bush' and key not in r['cutBushes']:
-                r['cutBushes'].append(key)
-            elif event_type == 'tree' and key not in r['cutTrees']:
-                r['cutTrees'].append(key)
-            elif event_type == 'bush_regrow':
-                r['cutBushes'] = []
-            emit('elf_world_event', {'type': event_type, 'key': key}, to=room, include_self=False)
-            break
+    found = game_rooms.find(sid, 'elf')
+    if found is None:
+        return
+    room, r, _ = found
+    with game_rooms.lock:
+        if event_type == 'chest' and key not in r['openedChests']:
+            r['openedChests'].append(key)
+        elif event_type == 'bush' and key not in r['cutBushes']:
+            r['cutBushes'].append(key)
+        elif event_type == 'tree' and key not in r['cutTrees']:
+            r['cutTrees'].append(key)
+        elif event_type == 'bush_regrow':
+            r['cutBushes'] = []
+        world_event = r['events'].append({'type': event_type, 'key': key})
+    emit('elf_world_event', world_event, to=room, include_self=False)
 
 
 # ============================================
 # City Life (game 06) multiplayer
 # ============================================
-CITY_MAX_PLAYERS = 8
+CITY_MAX_PLAYERS = app.config["CITY_MAX_PLAYERS"]
+
+def city_number(value, default):
+    # Positions feed the spatial grid, so drop anything that is not a finite number
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return value if math.isfinite(value) else default
+
+def new_city_room():
+    return {
+        'players': {},
+        'interest': RoomInterest(
+            cell_size=app.config["CITY_INTEREST_CELL"],
+            radius=app.config["CITY_INTEREST_RADIUS"],
+            far_every=app.config["CITY_FAR_UPDATE_EVERY"]
+        )
+    }
 
 @socketio.on('city_join_room')
 def on_city_join_room(data):
     sid = request.sid
     room = str(data.get('room', '')).strip().lower()[:12]
     username = str(data.get('username', 'Guest'))[:32]
-    x = float(data.get('x', 0))
-    z = float(data.get('z', 0))
-    ry = float(data.get('ry', 0))
+    x = city_number(data.get('x'), 0.0)
+    z = city_number(data.get('z'), 0.0)
+    ry = city_number(data.get('ry'), 0.0)
     if not room:
         return
 
-    if room not in city_rooms:
-        city_rooms[room] = {'players': {}}
-
-    r = city_rooms[room]
-    if len(r['players']) >= CITY_MAX_PLAYERS and sid not in r['players']:
-        emit('city_room_full')
+    def new_player(r):
+        # Assign the lowest unused color slot (0..CITY_MAX_PLAYERS-1)
+        used_slots = {p.get('colorSlot', 0) for s, p in r['players'].items() if s != sid}
+        color_slot = next(i for i in range(CITY_MAX_PLAYERS) if i not in used_slots)
+        return {
+            'username': username, 'x': x, 'z': z, 'ry': ry,
+            'moving': False, 'colorSlot': color_slot, 'insideHouse': False
+        }
+
+    with game_rooms.lock:
+        resumed = resume_seat('city', room, data)
+        if resumed is not None:
+            old_sid, r, player = resumed
+            player.update({'x': x, 'z': z, 'ry': ry})
+            left = None
+        else:
+            r, player, left = game_rooms.join('city', room, sid, new_city_room, new_player, CITY_MAX_PLAYERS)
+            if r is None:
+                emit('city_room_full', {'maxPlayers': CITY_MAX_PLAYERS})
+                return
+        r['interest'].grid.move(sid, x, z)
+        color_slot = player['colorSlot']
+        state = {
+            'sid': sid,
+            'myColorSlot': color_slot,
+            'maxPlayers': CITY_MAX_PLAYERS,
+            'players': {s: dict(p) for s, p in r['players'].items() if s != sid},
+            'resumeToken': resume_sessions.issue(sid),
+        }
+    announce_room_left(left)
+    join_game_room(room, data)
+    emit('city_room_state', state)
+
+    if resumed is not None:
+        announce_resumed('city', room, old_sid)
         return
-
-    # Assign the lowest unused color slot (0..CITY_MAX_PLAYERS-1)
-    used_slots = {p.get('colorSlot', 0) for p in r['players'].values()}
-    color_slot = next(i for i in range(CITY_MAX_PLAYERS) if i not in used_slots)
-
-    r['players'][sid] = {
-        'username': username, 'x': x, 'z': z, 'ry': ry,
-        'moving': False, 'colorSlot': color_slot
-    }
-    sio_join_room(room)
-
-    emit('city_room_state', {
-        'sid': sid,
-        'myColorSlot': color_slot,
-        'players': {s: p for s, p in r['players'].items() if s != sid},
-    })
-
     emit('city_player_joined', {
         'sid': sid, 'username': username,
         'x': x, 'z': z, 'ry': ry, 'colorSlot': color_slot
@@ -825,15 +1687,24 @@ def on_city_join_room(data):
 @socketio.on('city_player_update')
 def on_city_player_update(data):
     sid = request.sid
-    for room, r in city_rooms.items():
-        if sid in r['players']:
-            p = r['players'][sid]
-            p['x'] = data.get('x', p['x'])
-            p['z'] = data.get('z', p['z'])
-            p['ry'] = data.get('ry', p['ry'])
-            p['moving'] = data.get('moving', p['moving'])
-            emit('city_remote_update', {'sid': sid, **p}, to=room, include_self=False)
-            break
+    found = game_rooms.find(sid, 'city')
+    if found is None:
+        return
+    room, r, p = found
+    p['x'] = city_number(data.get('x'), p['x'])
+    p['z'] = city_number(data.get('z'), p['z'])
+    p['ry'] = city_number(data.get('ry'), p['ry'])
+    p['moving'] = bool(data.get('moving', p['moving']))
+    r['interest'].grid.move(sid, p['x'], p['z'])
+    inside = bool(data.get('insideHouse', p['insideHouse']))
+    if inside != p['insideHouse']:
+        # House interiors are private: hide the player from the room while inside, and bring
+        # them back up to date with everyone they missed when they come out
+        p['insideHouse'] = inside
+        emit('city_player_inside', {'sid': sid, 'inside': inside}, to=room, include_self=False)
+        if not inside:
+            room_broadcaster.send('city', sid, r['interest'].visible(r['players'], sid))
+    room_broadcaster.mark('city', room, sid)
 
 
 @socketio.on('city_chat')
@@ -842,30 +1713,77 @@ def on_city_chat(data):
     msg = str(data.get('msg', ''))[:200]
     if not msg.strip():
         return
-    for room, r in city_rooms.items():
-        if sid in r['players']:
-            username = r['players'][sid].get('username', 'Guest')
-            emit('city_chat', {'sid': sid, 'username': username, 'msg': msg}, to=room)
-            break
+    found = game_rooms.find(sid, 'city')
+    if found is None:
+        return
+    room, _, p = found
+    emit('city_chat', {'sid': sid, 'username': p.get('username', 'Guest'), 'msg': msg}, to=room)
 
 
+def join_game_room(room, data):
+    """Join the Socket.IO room, and the batch group of the encoding the client asked for."""
+    encoding = 'binary' if data.get('encoding') == 'binary' else 'json'
+    sio_join_room(room)
+    for other in ENCODINGS:
+        if other != encoding:
+            sio_leave_room(batch_group(room, other))
+    sio_join_room(batch_group(room, encoding))
+    room_broadcaster.set_encoding(request.sid, encoding)
+
+def release_player(r, sid):
+    """Drop a sid's per-room bookkeeping once it no longer holds a seat in r."""
+    if 'interest' in r:
+        r['interest'].grid.remove(sid)
+    room_broadcaster.forget(sid)
+
+def announce_room_left(left):
+    """Tell the rest of a room that a player left it (left is what game_rooms.leave() returned)."""
+    if left is None:
+        return
+    game, room, r, _ = left
+    sid = request.sid
+    release_player(r, sid)
+    sio_leave_room(room)
+    for encoding in ENCODINGS:
+        sio_leave_room(batch_group(room, encoding))
+    emit(f'{game}_player_left', {'sid': sid}, to=room)
+
+def resume_seat(game, room, data):
+    """Give the sender the seat its resume token (data['resume']) holds in this room.
+
+    Returns (old sid, room, player), or None to join normally. Call under game_rooms.lock.
+    """
+    sid = request.sid
+    old_sid = resume_sessions.holder(data.get('resume'))
+    if old_sid is None or old_sid == sid:
+        return None
+    found = game_rooms.find(old_sid, game)
+    if found is None or found[0] != room or game_rooms.rename(old_sid, sid) is None:
+        return None
+    _, r, player = found
+    release_player(r, old_sid)
+    resume_sessions.transfer(old_sid, sid)
+    return old_sid, r, player
+
+def announce_resumed(game, room, old_sid):
+    """Tell the rest of a room that a player is back under a new sid, in the same seat."""
+    # If the server has not noticed the old connection is gone yet, close it: it no longer has a seat
+    sio_disconnect(sid=old_sid, namespace='/')
+    emit(f'{game}_player_resumed', {'oldSid': old_sid, 'sid': request.sid}, to=room, include_self=False)
+    room_broadcaster.mark(game, room, request.sid)
+
+# Disconnect reason of a client that closed the connection itself (socketio.Server.reason.CLIENT_DISCONNECT)
+CLIENT_DISCONNECT = 'client disconnect'
+
 @socketio.on('disconnect')
 def on_disconnect(reason=None):
     sid = request.sid
-    for room, r in list(elf_rooms.items()):
-        if sid in r['players']:
-            del r['players'][sid]
-            emit('elf_player_left', {'sid': sid}, to=room)
-            if not r['players']:
-                del elf_rooms[room]
-            break
-    for room, r in list(city_rooms.items()):
-        if sid in r['players']:
-            del r['players'][sid]
-            emit('city_player_left', {'sid': sid}, to=room)
-            if not r['players']:
-                del city_rooms[room]
-            break
+    # flask-socketio < 5.5 passes no reason: every drop then keeps the seat until the grace period ends
+    if reason != CLIENT_DISCONNECT and resume_sessions.suspend(sid):
+        # Keep the seat for a while: the client may reconnect with its resume token
+        return
+    resume_sessions.drop(sid)
+    announce_room_left(game_rooms.leave(sid))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+"""
+Precompressed, fingerprinted static assets for games/ and static/.
+
+scripts/build_assets.py splits the inline scripts and styles of the game
+pages into separate files, then writes every asset into build/assets/ together
+with gzip (and, when the brotli package is installed, brotli) variants, gives
+non-HTML files a content-hash name (move_square.js -> move_square.1a2b3c4d.js)
+and rewrites the HTML/CSS references to those names. AssetTable memory-maps
+the build at startup and answers requests from it: the best variant for the
+client's Accept-Encoding, a strong ETag, immutable caching for fingerprinted
+names and a short TTL for the page shells. Without a build (or with a stale
+one) the routes fall back to serving the files from disk as before.
+"""
+import json
+import mimetypes
+import mmap
+import os
+from flask import Response
+
+MANIFEST_NAME = 'manifest.json'
+
+# Directories (relative to the repo root) that are built; their URL is '/' + the relative path
+SOURCE_DIRS = ('games', 'static')
+
+# Formats that are already compressed - fingerprinted but stored as-is
+INCOMPRESSIBLE = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.ico', '.mp3', '.ogg', '.woff', '.woff2', '.zip'}
+
+# Preferred order when the client accepts several encodings
+ENCODINGS = ('br', 'gzip')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+def fingerprint_name(relpath, digest):
+    """games/01/move_square.js -> games/01/move_square.<digest[:8]>.js"""
+    root, ext = os.path.splitext(relpath)
+    return f"{root}.{digest[:8]}{ext}"
+
+def is_fingerprinted_type(relpath):
+    # HTML pages keep their URLs (they are what people link to); everything else gets a content hash
+    return not relpath.endswith('.html')
+
+class Asset:
+    __slots__ = ('relpath', 'url_path', 'etag', 'mimetype', 'variants')
+
+    def __init__(self, relpath, url_path, etag, mimetype, variants):
+        self.relpath = relpath
+        self.url_path = url_path   # Fingerprinted path (same as relpath for HTML)
+        self.etag = etag
+        self.mimetype = mimetype
+        self.variants = variants   # encoding ('identity', 'gzip', 'br') -> mmap
+
+class AssetTable:
+    def __init__(self, page_max_age=0):
+        # HTML shells may be cached briefly; they are small and point at immutable bundles
+        self.page_max_age = page_max_age
+        self.enabled = False
+        self._by_path = {}   # request path -> (asset, immutable)
+        self._urls = {}      # source relpath -> fingerprinted relpath
+        self._files = []
+
+    def load(self, build_dir, source_root):
+        """Map a build into memory; returns False (and stays disabled) if it is missing or stale."""
+        manifest_path = os.path.join(build_dir, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return False
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        # A build that no longer matches the sources would serve old code - ignore it entirely
+        stale = []
+        for relpath, entry in manifest['files'].items():
+            try:
+                # Bundles extracted from a page are checked against the page
+                st = os.stat(os.path.join(source_root, entry.get('source', relpath)))
+            except FileNotFoundError:
+                stale.append(relpath)
+                continue
+            if st.st_size != entry['source_size'] or st.st_mtime_ns != entry['source_mtime_ns']:
+                stale.append(relpath)
+        if stale:
+            print(f"Asset build is stale ({len(stale)} files changed, e.g. {stale[0]}); "
+                  f"serving from disk - run scripts/build_assets.py")
+            return False
+
+        by_path = {}
+        urls = {}
+        for relpath, entry in manifest['files'].items():
+            variants = {encoding: self._map(os.path.join(build_dir, name))
+                        for encoding, name in entry['variants'].items()}
+            mimetype = mimetypes.guess_type(relpath)[0] or 'application/octet-stream'
+            asset = Asset(relpath, entry['url_path'], entry['hash'][:16], mimetype, variants)
+            by_path[relpath] = (asset, False)
+            if entry['url_path'] != relpath:
+                by_path[entry['url_path']] = (asset, True)
+                urls[relpath] = entry['url_path']
+        self._by_path = by_path
+        self._urls = urls
+        self.enabled = True
+        return True
+
+    def _map(self, path):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            # Read-only mappings share the page cache between gunicorn workers
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._files.append(mapped)
+        return mapped
+
+    def url_for(self, relpath):
+        """Fingerprinted relative path of a source file (unchanged if it is not in the build)."""
+        return self._urls.get(relpath, relpath)
+
+    def lookup(self, relpath):
+        """(asset, immutable) for a request path relative to the repo root, or (None, False)."""
+        return self._by_path.get(relpath, (None, False))
+
+    def respond(self, asset, immutable, request):
+        """Response with the best encoding for the request, or 304 if the client's copy is current."""
+        encoding = 'identity'
+        for candidate in ENCODINGS:
+            if candidate in asset.variants and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+        # Each encoding is a different representation, so it gets its own strong ETag
+        etag = asset.etag if encoding == 'identity' else f"{asset.etag}-{encoding}"
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            body = asset.variants[encoding]
+            response = Response([memoryview(body)] if body else [], mimetype=asset.mimetype)
+            response.content_length = len(body)
+            if encoding != 'identity':
+                response.content_encoding = encoding
+        response.set_etag(etag)
+        if immutable:
+            response.headers['Cache-Control'] = IMMUTABLE
+        elif asset.mimetype == 'text/html' and self.page_max_age:
+            response.headers['Cache-Control'] = f'public, max-age={self.page_max_age}'
+        else:
+            response.headers['Cache-Control'] = REVALIDATE
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,264 @@
+"""
+Incremental sync of the avatars table with the images under games/img/avatars.
+
+public/ holds the marketplace avatars, users/ private uploads. A manifest
+(build/avatar_manifest.json) remembers the size, mtime and content hash of
+every image, so a sync only reads files that are new or changed. Everything
+that differs from the table - new images, changed images, images that came
+back - is written with one bulk INSERT ... ON CONFLICT (avatar_id) DO UPDATE,
+and avatars whose image disappeared are deactivated instead of deleted, so
+ownership rows and number_of_users are never lost.
+"""
+import datetime
+import json
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from sqlalchemy import select, update, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from models import Avatar
+from thumbnails import file_hash
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
+
+# Sub folder -> whether its avatars are shown in the marketplace
+FOLDERS = (('public', True), ('users', False))
+
+def migrate_avatars_table(engine):
+    """Add the thumbnail variants column to an avatars table created before it existed.
+
+    create_all() does not add columns to existing tables, so the app and every script that
+    reads Avatar rows call this first.
+    """
+    inspector = inspect(engine)
+    if 'avatars' in inspector.get_table_names():
+        columns = [col['name'] for col in inspector.get_columns('avatars')]
+
+        with engine.connect() as conn:
+            if 'variants' not in columns:
+                try:
+                    conn.execute(text('ALTER TABLE avatars ADD COLUMN variants TEXT'))
+                    conn.commit()
+                    print("Added variants column to avatars")
+                except Exception as e:
+                    print(f"Could not add variants column: {e}")
+
+def generate_avatar_id(filename):
+    """Generate avatar_id from filename (without extension)."""
+    name_without_ext = Path(filename).stem
+    # Replace spaces with hyphens and lowercase
+    avatar_id = name_without_ext.replace(' ', '-').lower()
+    # Remove special characters except hyphens
+    avatar_id = re.sub(r'[^a-z0-9\-]', '', avatar_id)
+    return avatar_id
+
+def generate_display_name(filename):
+    """Generate a nice display name from filename."""
+    name_without_ext = Path(filename).stem
+    # Replace hyphens and underscores with spaces
+    name = name_without_ext.replace('-', ' ').replace('_', ' ')
+    # Title case
+    return name.title()
+
+def assign_price(avatar_id, is_public):
+    """Assign a price based on avatar type and whether it's public."""
+    # Default avatar is free
+    if 'default' in avatar_id:
+        return 0
+
+    # Erik series has specific prices
+    if avatar_id.startswith('erik-'):
+        erik_prices = {
+            'erik-green': 50,
+            'erik-smart': 100,
+            'erik-rocknroll': 150,
+            'erik-kidhappyman': 200,
+            'erik-fartman': 250,
+            'erik-monsterkey': 300,
+            'erik-sickman': 350,
+            'erik-richman': 500
+        }
+        return erik_prices.get(avatar_id, 100)
+
+    # Public avatars: 50-300 coins
+    if is_public:
+        return 100
+
+    # Private/user avatars: more expensive
+    return 500
+
+class ImageFile:
+    __slots__ = ('image_path', 'avatar_id', 'is_public', 'size', 'mtime_ns', 'hash', 'changed')
+
+    def __init__(self, image_path, is_public, size, mtime_ns):
+        self.image_path = image_path   # Relative to the repo root, as stored in avatars.image_path
+        self.avatar_id = generate_avatar_id(image_path.rsplit('/', 1)[-1])
+        self.is_public = is_public
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.hash = None
+        self.changed = True            # Content differs from the last sync (or was never synced)
+
+class AvatarSync:
+    def __init__(self, engine, root='.', base='games/img/avatars', manifest_path='build/avatar_manifest.json',
+                 thumbnails=None):
+        self.engine = engine
+        self.root = root                    # Repo root; image paths are relative to it
+        self.base = base
+        self.manifest_path = manifest_path  # Relative to root unless absolute
+        self.thumbnails = thumbnails        # ThumbnailCache, or None to skip thumbnail generation
+        dialect = postgresql if engine.dialect.name == 'postgresql' else sqlite
+        self._insert = dialect.insert(Avatar.__table__)
+
+    def scan(self):
+        """Image files of the avatar folders, by image_path (stat only, nothing is read)."""
+        files = {}
+        for folder, is_public in FOLDERS:
+            directory = os.path.join(self.root, self.base, folder)
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                for entry in sorted(entries, key=lambda e: e.name):
+                    if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTENSIONS:
+                        continue
+                    st = entry.stat()
+                    image_path = f"{self.base}/{folder}/{entry.name}"
+                    files[image_path] = ImageFile(image_path, is_public, st.st_size, st.st_mtime_ns)
+        return files
+
+    def _manifest_file(self):
+        return os.path.join(self.root, self.manifest_path)
+
+    def load_manifest(self):
+        try:
+            with open(self._manifest_file()) as f:
+                return json.load(f).get('files', {})
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_manifest(self, files):
+        path = self._manifest_file()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        manifest = {'files': {f.image_path: {'size': f.size, 'mtime_ns': f.mtime_ns, 'hash': f.hash}
+                              for f in files.values()}}
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+        with os.fdopen(fd, 'w') as out:
+            json.dump(manifest, out, separators=(',', ':'), sort_keys=True)
+        os.replace(tmp, path)
+
+    def sync(self, full=False):
+        """Bring the avatars table in line with the image folders; returns a report dict.
+
+        full=True ignores the manifest (every image is hashed again) and also resets name,
+        price, creator and visibility of existing avatars to the values derived from the file.
+        number_of_users is never touched.
+        """
+        started = time.perf_counter()
+        files = self.scan()
+        manifest = {} if full else self.load_manifest()
+
+        # Hash only what is new or whose size/mtime moved; a touched but identical file is unchanged
+        hashed = 0
+        for f in files.values():
+            known = manifest.get(f.image_path)
+            if known and known['size'] == f.size and known['mtime_ns'] == f.mtime_ns:
+                f.hash = known['hash']
+                f.changed = False
+            else:
+                f.hash = file_hash(os.path.join(self.root, f.image_path))
+                f.changed = known is None or known['hash'] != f.hash
+                hashed += 1
+
+        # The first file wins when two names map to the same avatar_id (public/ is scanned first)
+        by_id = {}
+        duplicates = []
+        for f in files.values():
+            if f.avatar_id in by_id:
+                duplicates.append(f.image_path)
+            else:
+                by_id[f.avatar_id] = f
+
+        with self.engine.connect() as conn:
+            existing = {row.avatar_id: row for row in conn.execute(
+                select(Avatar.avatar_id, Avatar.image_path, Avatar.active, Avatar.variants))}
+
+        thumbnails = self.thumbnails if self.thumbnails is not None and self.thumbnails.available else None
+        now = datetime.datetime.utcnow()
+        rows = []
+        added, updated, thumbnail_count = [], [], 0
+        for avatar_id, f in by_id.items():
+            row = existing.get(avatar_id)
+            variants = row.variants if row is not None else None
+            # Recorded variants stay valid as long as they were made from this exact image
+            recorded_hash = json.loads(variants)['hash'] if variants else None
+            if thumbnails is not None and (full or recorded_hash != f.hash):
+                try:
+                    new_variants = json.dumps(thumbnails.generate(os.path.join(self.root, f.image_path), f.hash),
+                                              sort_keys=True)
+                except Exception as e:
+                    print(f"  [ERROR] thumbnails of {f.image_path}: {e}")
+                    new_variants = None
+                if new_variants != variants:
+                    variants = new_variants
+                    thumbnail_count += 1
+            elif recorded_hash is not None and recorded_hash != f.hash:
+                variants = None  # Thumbnails of the old image; the pages fall back to the original
+
+            if not (row is None or full or f.changed or not row.active
+                    or row.image_path != f.image_path or variants != row.variants):
+                continue
+            (added if row is None else updated).append(avatar_id)
+            rows.append({
+                'avatar_id': avatar_id,
+                'name': generate_display_name(f.image_path),
+                'price': assign_price(avatar_id, f.is_public),
+                'creator_name': None if f.is_public else 'User Upload',
+                'image_path': f.image_path,
+                'is_public': f.is_public,
+                'number_of_users': 0,
+                'active': True,
+                'status': 'active',
+                'variants': variants,
+                'created_at': now,
+                'last_update': now,
+            })
+
+        # Avatars whose image was removed from a managed folder
+        deactivated = [avatar_id for avatar_id, row in existing.items()
+                       if row.active and row.image_path.startswith(self.base + '/')
+                       and row.image_path not in files and avatar_id not in by_id]
+
+        with self.engine.begin() as conn:
+            if rows:
+                stmt = self._insert
+                changes = {
+                    'image_path': stmt.excluded.image_path,
+                    'active': True,
+                    'status': 'active',
+                    'variants': stmt.excluded.variants,
+                    'last_update': stmt.excluded.last_update,
+                }
+                if full:
+                    changes.update(name=stmt.excluded.name, price=stmt.excluded.price,
+                                   creator_name=stmt.excluded.creator_name, is_public=stmt.excluded.is_public)
+                conn.execute(stmt.on_conflict_do_update(index_elements=['avatar_id'], set_=changes), rows)
+            if deactivated:
+                conn.execute(
+                    update(Avatar)
+                    .where(Avatar.avatar_id.in_(deactivated))
+                    .values(active=False, status='removed', last_update=now)
+                )
+        self.save_manifest(files)
+
+        return {
+            'scanned': len(files),
+            'hashed': hashed,
+            'added': added,
+            'updated': updated,
+            'deactivated': deactivated,
+            'duplicates': duplicates,
+            'thumbnails': thumbnail_count,
+            'seconds': time.perf_counter() - started,
+        }
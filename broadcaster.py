@@ -0,0 +1,152 @@
+"""
+Fixed-tick snapshot broadcaster for the Socket.IO multiplayer rooms.
+
+Instead of relaying every *_player_update to the rest of the room as it
+arrives (players x 20 Hz x (players - 1) emits per second), the handlers only
+update the player's state and mark it dirty. A background task wakes up
+tick_hz times a second and sends each room one '<game>_remote_batch' event
+with the latest state of the players that changed since the room's last
+tick. Rooms with more than adapt_players players tick proportionally slower
+(down to min_hz), so the fan-out of a crowded room stays bounded.
+
+Each room's members are split into two Socket.IO groups by the encoding they
+negotiated at join: JSON, or the binary format of wire.py.
+
+A room that carries an 'interest' manager (interest.py) gets one batch per
+recipient instead, holding only the players that recipient should see this
+tick. Its fan-out is bounded by the interest radius, so it always ticks at
+tick_hz.
+"""
+import threading
+import time
+
+ENCODINGS = ('json', 'binary')
+
+def batch_group(code, encoding):
+    """Socket.IO room of the members of a game room that take batches in this encoding."""
+    # Longer than any room code (12 characters), so it cannot clash with one
+    return f"remote-batch:{encoding}:{code}"
+
+class TickBroadcaster:
+    def __init__(self, socketio, registry, tick_hz=10.0, min_hz=4.0, adapt_players=8):
+        self.socketio = socketio
+        self.registry = registry
+        self.tick_hz = tick_hz
+        self.min_hz = min_hz
+        self.adapt_players = adapt_players   # 0 = every room ticks at tick_hz
+        self.fields = {}       # game -> player fields sent in a JSON batch
+        self.encoders = {}     # game -> binary batch encoder (list of player dicts -> bytes)
+        self.encodings = {}    # sid -> encoding negotiated at join (for per-recipient batches)
+        self.updates = 0
+        self.batches = 0
+        self.ticks = 0
+        self._dirty = {}       # (game, room code) -> set of sids changed since the room's last batch
+        self._next_due = {}    # (game, room code) -> monotonic time of the room's next batch
+        self._lock = threading.Lock()
+
+    def register(self, game, fields, encoder=None):
+        self.fields[game] = tuple(fields)
+        if encoder is not None:
+            self.encoders[game] = encoder
+
+    def set_encoding(self, sid, encoding):
+        self.encodings[sid] = encoding
+
+    def forget(self, sid):
+        self.encodings.pop(sid, None)
+
+    def mark(self, game, room, sid):
+        """Queue a player's current state for the room's next batch."""
+        with self._lock:
+            self._dirty.setdefault((game, room), set()).add(sid)
+            self.updates += 1
+
+    def interval(self, players):
+        """Seconds between two batches of a room with this many players."""
+        hz = self.tick_hz
+        if self.adapt_players and players > self.adapt_players:
+            hz = max(self.min_hz, self.tick_hz * self.adapt_players / players)
+        return 1.0 / hz
+
+    def tick(self, now=None):
+        """Send the batches that are due; returns how many were sent."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            self.ticks += 1
+        sent = 0
+        for key, sids in dirty.items():
+            try:
+                sent += self._tick_room(key, sids, now)
+            except Exception as e:
+                # One bad room must not cost the others their batch; retry its changes next tick
+                print(f"Room broadcast failed for {key[0]} room {key[1]}: {e}")
+                with self._lock:
+                    self._dirty.setdefault(key, set()).update(sids)
+        with self._lock:
+            self.batches += sent
+        return sent
+
+    def _tick_room(self, key, sids, now):
+        """Send one room's batch(es) if due; returns how many were sent."""
+        game, code = key
+        room = self.registry.get(game, code)
+        if room is None:
+            self._next_due.pop(key, None)
+            return 0
+        if now < self._next_due.get(key, 0):
+            # Slowed-down room: keep its changes for a later tick
+            with self._lock:
+                self._dirty.setdefault(key, set()).update(sids)
+            return 0
+        interest = room.get('interest')
+        changed = [(sid, p) for sid, p in ((sid, room['players'].get(sid)) for sid in sids) if p is not None]
+        if interest is not None:
+            self._next_due[key] = now + 1.0 / self.tick_hz
+            sent = 0
+            for recipient, batch in interest.batches(room['players'], changed):
+                self.send(game, recipient, batch)
+                sent += 1
+            if interest.pending():
+                # Distant moves still owed to someone: tick the room again even if nobody moves
+                with self._lock:
+                    self._dirty.setdefault(key, set())
+            return sent
+        self._next_due[key] = now + self.interval(len(room['players']))
+        if not changed:
+            return 0
+        fields = self.fields[game]
+        self.socketio.emit(f'{game}_remote_batch',
+                           {'players': {sid: {f: p.get(f) for f in fields} for sid, p in changed}},
+                           to=batch_group(code, 'json'))
+        encoder = self.encoders.get(game)
+        if encoder is not None:
+            self.socketio.emit(f'{game}_remote_batch', encoder([p for _, p in changed]),
+                               to=batch_group(code, 'binary'))
+        return 1
+
+    def send(self, game, to_sid, players):
+        """Send one client a batch of [(sid, player)] in the encoding it joined with."""
+        encoder = self.encoders.get(game)
+        if encoder is not None and self.encodings.get(to_sid) == 'binary':
+            self.socketio.emit(f'{game}_remote_batch', encoder([p for _, p in players]), to=to_sid)
+            return
+        fields = self.fields[game]
+        self.socketio.emit(f'{game}_remote_batch',
+                           {'players': {sid: {f: p.get(f) for f in fields} for sid, p in players}},
+                           to=to_sid)
+
+    def run(self):
+        """Background task: tick forever at tick_hz."""
+        period = 1.0 / self.tick_hz
+        while True:
+            started = time.monotonic()
+            try:
+                self.tick(started)
+            except Exception as e:
+                print(f"Room broadcast tick failed: {e}")
+            self.socketio.sleep(max(0.0, period - (time.monotonic() - started)))
+
+    def stats(self):
+        with self._lock:
+            return {'tick_hz': self.tick_hz, 'ticks': self.ticks, 'updates': self.updates, 'batches': self.batches}
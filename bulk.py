@@ -0,0 +1,53 @@
+"""
+Bulk row inserts for the NDJSON import and the indexes it feeds.
+
+insert(model) with a list of dicts spends most of its time in SQLAlchemy's
+per-row parameter processing, and on PostgreSQL every row still goes through
+the INSERT path. bulk_insert() takes the column list once and writes plain
+tuples instead:
+
+PostgreSQL (psycopg 3): COPY ... FROM STDIN, which psycopg adapts UUIDs,
+datetimes and booleans for natively.
+SQLite: one executemany on the DB-API cursor, with the column types' bind
+processors (UUID -> hex, datetime -> string) applied up front.
+
+Any other driver gets the regular SQLAlchemy executemany. Rows are written on
+the caller's connection and commit with the rest of its transaction.
+
+Bulk-written rows get uuid7() keys: time-ordered, so a batch lands next to
+the previous one in the primary key (and form_a_id) indexes instead of
+splitting pages all over them - about twice the insert rate of uuid4 keys
+once the tables outgrow the cache.
+"""
+import os
+import time
+import uuid
+from sqlalchemy import insert
+
+def uuid7():
+    """Time-ordered UUID (version 7, RFC 9562): 48-bit millisecond timestamp, then random bits."""
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), 'big')
+    value = value & ~(0xF << 76) | 0x7 << 76   # version 7
+    value = value & ~(0x3 << 62) | 0x2 << 62   # RFC 9562 variant
+    return uuid.UUID(int=value)
+
+def bulk_insert(conn, table, columns, rows):
+    """Insert rows (sequences ordered like columns) into table."""
+    if not rows:
+        return
+    if conn.dialect.name == 'postgresql' and conn.dialect.driver == 'psycopg':
+        cursor = conn.connection.driver_connection.cursor()
+        with cursor.copy(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row)
+        return
+    if conn.dialect.name == 'sqlite':
+        processors = [table.c[column].type.bind_processor(conn.dialect) for column in columns]
+        if any(processors):
+            rows = [tuple(value if process is None or value is None else process(value)
+                          for process, value in zip(processors, row)) for row in rows]
+        conn.exec_driver_sql(
+            f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+        )
+        return
+    conn.execute(insert(table), [dict(zip(columns, row)) for row in rows])
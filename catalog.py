@@ -0,0 +1,151 @@
+"""
+In-process avatar catalog cache for the Labyrinth marketplace.
+
+The catalog only changes when the avatar scripts run or a purchase bumps an
+avatar's number_of_users, so it is loaded once, served as pre-encoded JSON
+with a strong ETag, and re-read only when its version changes: in-process
+writes bump the version (and the stamp) directly, and writes from other
+processes are picked up by comparing a cheap change stamp (row count, newest
+last_update, total number_of_users) at most every refresh_seconds. Purchases
+leave last_update alone. Every reload also gets the sprite atlas of the
+public avatars when a ThumbnailCache is given; it is keyed by the images'
+content hashes, so a reload that changed no image (e.g. only purchase counts)
+reuses the existing layout and sheets without drawing anything.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from models import Avatar
+from thumbnails import srcsets
+
+DEFAULT_AVATAR = {
+    'avatar_id': 'avatar-default',
+    'name': 'Default Avatar',
+    'price': 0,
+    'creator_name': None,
+    'image_path': 'games/img/avatars/public/avatar-default.png',
+    'is_public': True,
+    'number_of_users': 0,
+    'srcset': {}
+}
+
+class CatalogSnapshot:
+    __slots__ = ('version', 'avatars', 'prices', 'atlas', 'body', 'etag')
+
+    def __init__(self, version, avatars, prices, atlas=None):
+        self.version = version
+        self.avatars = avatars  # Public avatars in marketplace order
+        self.prices = prices    # avatar_id -> price for every active avatar
+        self.atlas = atlas      # {"tile", "sheets"} of the sprite atlas (avatars carry their "sprite"), or None
+        self.body = json.dumps({'avatars': avatars, 'atlas': atlas}, separators=(',', ':')).encode('utf-8')
+        self.etag = hashlib.sha1(self.body).hexdigest()[:16]
+
+class AvatarCatalog:
+    def __init__(self, engine, refresh_seconds=30, thumbnails=None, source_root='.', atlas_tile=192, atlas_max_tiles=64):
+        self.engine = engine
+        self.refresh_seconds = refresh_seconds
+        self.thumbnails = thumbnails    # ThumbnailCache for the sprite atlas (None = no atlas)
+        self.source_root = source_root  # Directory image_path is relative to
+        self.atlas_tile = atlas_tile
+        self.atlas_max_tiles = atlas_max_tiles
+        self.version = 0
+        self._snapshot = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _read_stamp(self, db_session):
+        return tuple(db_session.execute(select(
+            func.count(Avatar.id), func.max(Avatar.last_update), func.coalesce(func.sum(Avatar.number_of_users), 0)
+        )).one())
+
+    def load(self):
+        """(Re)load the whole catalog from the database."""
+        with Session(self.engine) as db_session:
+            stamp = self._read_stamp(db_session)
+            rows = db_session.query(Avatar).filter(Avatar.active == True).order_by(Avatar.price.asc()).all()
+            avatars = [{
+                'avatar_id': avatar.avatar_id,
+                'name': avatar.name,
+                'price': avatar.price,
+                'creator_name': avatar.creator_name,
+                'image_path': avatar.image_path,
+                'is_public': avatar.is_public,
+                'number_of_users': avatar.number_of_users,
+                # mimetype -> srcset of the thumbnails; empty when only the original exists
+                'srcset': srcsets(json.loads(avatar.variants) if avatar.variants else None)
+            } for avatar in rows if avatar.is_public]
+            prices = {avatar.avatar_id: avatar.price for avatar in rows}
+
+        # Add default avatar at beginning if not already in list
+        if not any(a['avatar_id'] == 'avatar-default' for a in avatars):
+            avatars.insert(0, dict(DEFAULT_AVATAR))
+        prices['avatar-default'] = 0
+        atlas = self._build_atlas(avatars)
+
+        with self._lock:
+            self.version += 1
+            self._snapshot = CatalogSnapshot(self.version, avatars, prices, atlas)
+            self._stamp = stamp
+            self._checked_at = time.monotonic()
+
+    def _build_atlas(self, avatars):
+        """Pack the avatars into sprite sheets and set each one's 'sprite' ([sheet, x, y], or None)."""
+        atlas = None
+        if self.thumbnails is not None and self.thumbnails.available:
+            sources = [(a['avatar_id'], os.path.join(self.source_root, a['image_path'])) for a in avatars]
+            sources = [(avatar_id, path) for avatar_id, path in sources if os.path.isfile(path)]
+            try:
+                atlas = self.thumbnails.build_atlas(sources, self.atlas_tile, self.atlas_max_tiles)
+            except Exception as e:
+                # The pages fall back to one image per avatar
+                print(f"Could not build avatar sprite atlas: {e}")
+        sprites = atlas.pop('sprites') if atlas else {}
+        for a in avatars:
+            a['sprite'] = sprites.get(a['avatar_id'])
+        return atlas
+
+    def snapshot(self, force_check=False):
+        """Current catalog, reloading first if another process changed the avatars table."""
+        now = time.monotonic()
+        if self._snapshot is None:
+            self.load()
+        elif force_check or now - self._checked_at >= self.refresh_seconds:
+            self._checked_at = now
+            with Session(self.engine) as db_session:
+                stamp = self._read_stamp(db_session)
+            if stamp != self._stamp:
+                self.load()
+        return self._snapshot
+
+    def get_price(self, avatar_id):
+        """Price of an active avatar, or None if it does not exist."""
+        price = self.snapshot().prices.get(avatar_id)
+        if price is None:
+            # Possibly added by another process since the last check
+            price = self.snapshot(force_check=True).prices.get(avatar_id)
+        return price
+
+    def record_purchase(self, avatar_id):
+        """Reflect a committed purchase (number_of_users + 1) without re-reading the table."""
+        with self._lock:
+            current = self._snapshot
+            if current is None:
+                return
+            avatars = [dict(a, number_of_users=(a['number_of_users'] or 0) + 1) if a['avatar_id'] == avatar_id else a
+                       for a in current.avatars]
+            self.version += 1
+            self._snapshot = CatalogSnapshot(self.version, avatars, current.prices, current.atlas)
+            if self._stamp is not None:
+                # Our own sale is already in the snapshot: only other processes' writes should reload it
+                count, last_update, users = self._stamp
+                self._stamp = (count, last_update, users + 1)
+
+    def invalidate(self):
+        """Force a reload on next access (after writing the avatars table from this process)."""
+        with self._lock:
+            self._snapshot = None
@@ -24,3 +24,84 @@ class Config:
     SESSION_COOKIE_HTTPONLY = True
     REMEMBER_COOKIE_HTTPONLY = True
     # For production, consider setting SESSION_COOKIE_SECURE = True
+
+    # Keyword -> user identity cache (see get_user_by_keyword)
+    KEYWORD_CACHE_SIZE = int(os.getenv("KEYWORD_CACHE_SIZE", "1024"))
+    KEYWORD_CACHE_TTL = int(os.getenv("KEYWORD_CACHE_TTL", "300"))
+
+    # Rows per executemany batch for the NDJSON bulk import (/import)
+    IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+    IMPORT_MAX_BATCH_SIZE = int(os.getenv("IMPORT_MAX_BATCH_SIZE", "10000"))
+    # Imported Form A stories are search/entity-indexed in the background (index_queue.py):
+    # stories per indexing transaction, and how often each worker checks the queue
+    INDEX_QUEUE_BATCH_SIZE = int(os.getenv("INDEX_QUEUE_BATCH_SIZE", "5000"))
+    INDEX_QUEUE_INTERVAL_SECONDS = float(os.getenv("INDEX_QUEUE_INTERVAL_SECONDS", "1"))
+
+    # In-memory game leaderboard: entries per ranking, and how often each worker re-seeds it from the DB
+    LEADERBOARD_TOP_K = int(os.getenv("LEADERBOARD_TOP_K", "15"))
+    LEADERBOARD_REFRESH_SECONDS = int(os.getenv("LEADERBOARD_REFRESH_SECONDS", "60"))
+
+    # Avatar catalog cache: how often to check the avatars table for writes from other processes
+    CATALOG_REFRESH_SECONDS = int(os.getenv("CATALOG_REFRESH_SECONDS", "30"))
+
+    # Request threads per gunicorn worker (the start command passes --threads ${WEB_THREADS:-4})
+    WEB_THREADS = int(os.getenv("WEB_THREADS", "4"))
+
+    # Game password hashing: bcrypt cost factor (existing hashes are upgraded on login) and the
+    # per-worker process pool it runs in - requests beyond MAX_PENDING get an immediate 503.
+    # MAX_PENDING must stay below WEB_THREADS, so logins can never occupy every request thread
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", "2"))
+    PASSWORD_POOL_MAX_PENDING = int(os.getenv("PASSWORD_POOL_MAX_PENDING", "2"))
+    PASSWORD_HASH_TIMEOUT = int(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+    # Game wallet (POST /games/01/api/user/wallet): coalescing window, how long idempotency keys are
+    # remembered, and the largest accepted single delta
+    WALLET_FLUSH_SECONDS = float(os.getenv("WALLET_FLUSH_SECONDS", "1.0"))
+    WALLET_KEY_TTL_HOURS = int(os.getenv("WALLET_KEY_TTL_HOURS", "24"))
+    WALLET_MAX_DELTA = int(os.getenv("WALLET_MAX_DELTA", "100000"))
+
+    # Verified game JWTs cached per worker (entries never outlive the token's exp)
+    GAME_TOKEN_CACHE_SIZE = int(os.getenv("GAME_TOKEN_CACHE_SIZE", "4096"))
+    GAME_TOKEN_CACHE_TTL = int(os.getenv("GAME_TOKEN_CACHE_TTL", "3600"))
+
+    # Output of scripts/build_assets.py (relative to the app directory); ignored if missing or stale
+    ASSET_BUILD_DIR = os.getenv("ASSET_BUILD_DIR", "build/assets")
+    # Browser cache lifetime (seconds) of built HTML pages; their scripts and styles are immutable
+    ASSET_PAGE_MAX_AGE = int(os.getenv("ASSET_PAGE_MAX_AGE", "60"))
+
+    # Avatar thumbnails (thumbnails.py): content-addressed cache dir (relative to the app directory),
+    # widths in pixels and WebP/AVIF quality
+    THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "build/thumbs")
+    THUMBNAIL_WIDTHS = [int(w) for w in os.getenv("THUMBNAIL_WIDTHS", "64,128,256").split(",")]
+    THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+    # Avatar sprite atlas for the marketplace grid: tile size in pixels and tiles per sheet
+    AVATAR_ATLAS_TILE = int(os.getenv("AVATAR_ATLAS_TILE", "192"))
+    AVATAR_ATLAS_MAX_TILES = int(os.getenv("AVATAR_ATLAS_MAX_TILES", "64"))
+
+    # Size/mtime/hash manifest of the avatar images (scripts/populate_avatars_from_images.py), so a sync
+    # only re-reads new or changed files
+    AVATAR_MANIFEST = os.getenv("AVATAR_MANIFEST", "build/avatar_manifest.json")
+
+    # Multiplayer rooms: batched position snapshots per second, and the room size above which a
+    # room's rate is scaled down (to no less than ROOM_TICK_MIN_HZ); 0 disables the scaling
+    ROOM_TICK_HZ = float(os.getenv("ROOM_TICK_HZ", "10"))
+    ROOM_TICK_MIN_HZ = float(os.getenv("ROOM_TICK_MIN_HZ", "4"))
+    ROOM_TICK_ADAPT_PLAYERS = int(os.getenv("ROOM_TICK_ADAPT_PLAYERS", "8"))
+
+    # City Life rooms: player cap, and the spatial interest management (interest.py) that cuts
+    # their fan-out - players within CITY_INTEREST_RADIUS world units (18 = one block) are sent
+    # every tick, farther ones every CITY_FAR_UPDATE_EVERY ticks; CITY_INTEREST_CELL is the grid
+    # cell size (27 = one city block plus its road). The city has a fixed size, so each player's
+    # traffic still grows with the room: at the default cap it stays below what an 8-player room
+    # sent without interest management (python scripts/bench_interest.py)
+    CITY_MAX_PLAYERS = int(os.getenv("CITY_MAX_PLAYERS", "32"))
+    CITY_INTEREST_RADIUS = float(os.getenv("CITY_INTEREST_RADIUS", "18"))
+    CITY_INTEREST_CELL = float(os.getenv("CITY_INTEREST_CELL", "27"))
+    CITY_FAR_UPDATE_EVERY = int(os.getenv("CITY_FAR_UPDATE_EVERY", "10"))
+
+    # Resumable multiplayer sessions (sessions.py): seconds a dropped player's seat is held for a
+    # reconnect with its resume token (0 frees it at once), and world events kept per room so a
+    # reconnecting client can catch up without the full room state
+    SESSION_GRACE_SECONDS = float(os.getenv("SESSION_GRACE_SECONDS", "20"))
+    ROOM_EVENT_BUFFER = int(os.getenv("ROOM_EVENT_BUFFER", "256"))
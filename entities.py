@@ -0,0 +1,144 @@
+"""
+Persons/organizations inverted index for Form A.
+
+FormA.persons and FormA.organizations are free text lists (comma, semicolon or
+newline separated). index_entities() splits and normalizes them into the
+entities / entity_mentions tables so lookups, per-user top lists and
+co-occurrence counts are answered from indexes instead of scanning form_a.
+"""
+import re
+import unicodedata
+import uuid
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from bulk import bulk_insert, uuid7
+from models import Entity, EntityMention, FormA
+
+# FormA column -> Entity.kind
+ENTITY_FIELDS = {'persons': 'person', 'organizations': 'organization'}
+
+SEPARATORS = re.compile(r'[,;\n\r]+')
+MAX_NAME_LENGTH = 255
+
+MENTION_COLUMNS = ('id', 'entity_id', 'form_a_id', 'user_id', 'created_at')
+
+def clean_name(raw):
+    """Display form of a name: collapsed whitespace, surrounding punctuation removed."""
+    name = unicodedata.normalize('NFKC', raw)
+    name = ' '.join(name.split())
+    return name.strip(' .:-–—"\'()[]')[:MAX_NAME_LENGTH]
+
+def normalize_name(name):
+    """Lookup key: case-folded, accents stripped, whitespace collapsed."""
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(stripped.casefold().split())[:MAX_NAME_LENGTH]
+
+def tokenize_entities(text):
+    """Split a persons/organizations field into {norm: display name}, first spelling wins."""
+    found = {}
+    for part in SEPARATORS.split(text or ''):
+        name = clean_name(part)
+        if not name:
+            continue
+        norm = normalize_name(name)
+        if norm and norm not in found:
+            found[norm] = name
+    return found
+
+def _insert_ignore(conn):
+    dialect = postgresql if conn.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(Entity.__table__).on_conflict_do_nothing(index_elements=['kind', 'norm'])
+
+def index_entities(conn, rows, replace=False):
+    """Index Form A rows: dicts with id, user_id, created_at, persons and organizations.
+
+    Pass replace=True to drop existing mentions of the rows first (updates, rebuilds).
+    Runs on the caller's connection so the mentions commit with the stories.
+    """
+    if not rows:
+        return
+    parsed = [(row, {kind: tokenize_entities(row.get(field)) for field, kind in ENTITY_FIELDS.items()})
+              for row in rows]
+
+    # Resolve entity ids, creating the ones we have not seen before
+    entity_ids = {}
+    for kind in ENTITY_FIELDS.values():
+        names = {}
+        for _, by_kind in parsed:
+            for norm, name in by_kind[kind].items():
+                names.setdefault(norm, name)
+        if not names:
+            continue
+        existing = conn.execute(
+            select(Entity.norm, Entity.id).where(Entity.kind == kind, Entity.norm.in_(names))
+        ).all()
+        known = {norm: entity_id for norm, entity_id in existing}
+        missing = [{'id': uuid.uuid4(), 'kind': kind, 'norm': norm, 'name': name}
+                   for norm, name in names.items() if norm not in known]
+        if missing:
+            conn.execute(_insert_ignore(conn), missing)
+            # Re-read: a concurrent writer may have created some of them first
+            known.update(conn.execute(
+                select(Entity.norm, Entity.id).where(Entity.kind == kind, Entity.norm.in_([m['norm'] for m in missing]))
+            ).all())
+        for norm, entity_id in known.items():
+            entity_ids[(kind, norm)] = entity_id
+
+    if replace:
+        conn.execute(delete(EntityMention).where(EntityMention.form_a_id.in_([row['id'] for row, _ in parsed])))
+    mentions = [(uuid7(), entity_ids[(kind, norm)], row['id'], row['user_id'], row['created_at'])
+                for row, by_kind in parsed for kind, names in by_kind.items() for norm in names]
+    bulk_insert(conn, EntityMention.__table__, MENTION_COLUMNS, mentions)
+
+def find_entity(conn, name, kind=None):
+    """Entity rows matching a name exactly (after normalization)."""
+    stmt = select(Entity.id, Entity.kind, Entity.name).where(Entity.norm == normalize_name(clean_name(name)))
+    if kind:
+        stmt = stmt.where(Entity.kind == kind)
+    return conn.execute(stmt).all()
+
+def stories_mentioning(conn, entity_id, user_id, limit=50):
+    """A user's stories mentioning an entity, newest first (via ix_entity_mentions_entity_user)."""
+    mentions = (select(EntityMention.form_a_id, EntityMention.created_at)
+                .where(EntityMention.entity_id == entity_id, EntityMention.user_id == user_id)
+                .order_by(EntityMention.created_at.desc())
+                .limit(limit)
+                .subquery())
+    return conn.execute(
+        select(FormA.id, FormA.headline, FormA.about, FormA.created_at)
+        .join(mentions, FormA.id == mentions.c.form_a_id)
+        .order_by(mentions.c.created_at.desc())
+    ).all()
+
+def top_entities(conn, user_id, kind=None, limit=20):
+    """Most-mentioned entities across a user's stories (via ix_entity_mentions_user_entity)."""
+    counts = (select(EntityMention.entity_id, func.count().label('mentions'))
+              .where(EntityMention.user_id == user_id)
+              .group_by(EntityMention.entity_id)
+              .subquery())
+    stmt = (select(Entity.id, Entity.kind, Entity.name, counts.c.mentions)
+            .join(counts, Entity.id == counts.c.entity_id)
+            .order_by(counts.c.mentions.desc(), Entity.name)
+            .limit(limit))
+    if kind:
+        stmt = stmt.where(Entity.kind == kind)
+    return conn.execute(stmt).all()
+
+def cooccurring_entities(conn, entity_id, user_id, limit=20):
+    """Entities named in the same stories as entity_id, with the number of shared stories."""
+    stories = (select(EntityMention.form_a_id)
+               .where(EntityMention.entity_id == entity_id, EntityMention.user_id == user_id)
+               .subquery())
+    other = EntityMention.__table__.alias('other')
+    counts = (select(other.c.entity_id, func.count().label('stories'))
+              .join(stories, other.c.form_a_id == stories.c.form_a_id)
+              .where(other.c.entity_id != entity_id)
+              .group_by(other.c.entity_id)
+              .subquery())
+    return conn.execute(
+        select(Entity.id, Entity.kind, Entity.name, counts.c.stories)
+        .join(counts, Entity.id == counts.c.entity_id)
+        .order_by(counts.c.stories.desc(), Entity.name)
+        .limit(limit)
+    ).all()
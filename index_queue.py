@@ -0,0 +1,125 @@
+"""
+Deferred search and entity indexing for bulk-imported Form A stories.
+
+Indexing a story costs several times more than storing it: an FTS5 row on
+SQLite, and on both databases a mention row per person/organization that
+goes into four B-tree indexes. /import therefore stores the stories and
+queues their ids in form_a_index_queue in the same transaction, and
+IndexQueue.run_once() - called every interval_seconds by a background task
+in each worker - writes the index entries for a large chunk of the queue at
+a time. Stories submitted through form_a() are still indexed right away.
+
+A chunk is claimed with DELETE ... RETURNING (FOR UPDATE SKIP LOCKED on
+PostgreSQL) in the transaction that writes its index entries, so two workers
+never index the same story, and a crash or error rolls the claim back: the
+queue lives in the database and survives restarts. Imported stories appear in
+search and the entity views once the queue has caught up; pending() is the
+backlog. While an import is streaming into a worker (importing()), that
+worker's background indexing waits, so the two do not take turns on the
+write lock - the import's stories are indexed in chunks right after it.
+"""
+import datetime
+import threading
+from contextlib import contextmanager
+from sqlalchemy import select, delete, func
+from bulk import bulk_insert
+from entities import index_entities
+from models import FormA, FormAIndexQueue
+from search import SEARCH_COLUMNS, index_form_a
+
+QUEUE_COLUMNS = ('form_a_id', 'queued_at')
+
+class IndexQueue:
+    def __init__(self, engine, search=True, batch_size=5000, interval_seconds=1.0):
+        self.engine = engine
+        self.search = search            # Whether the full-text index is available (ensure_search_index)
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self.indexed = 0
+        self.failed = 0
+        self.chunks = 0
+        self._importing = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def importing(self):
+        """Hold back this worker's background indexing for the duration of an import"""
+        with self._lock:
+            self._importing += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._importing -= 1
+
+    def enqueue(self, conn, ids):
+        """Queue stories for indexing, on the connection (and in the transaction) that inserts them."""
+        now = datetime.datetime.utcnow()
+        bulk_insert(conn, FormAIndexQueue.__table__, QUEUE_COLUMNS, [(story_id, now) for story_id in ids])
+
+    def _claim(self, conn):
+        queue = FormAIndexQueue.__table__
+        oldest = select(queue.c.form_a_id).order_by(queue.c.form_a_id).limit(self.batch_size)
+        if conn.dialect.name == 'postgresql':
+            # Rows another worker is indexing right now are skipped, not waited for
+            oldest = oldest.with_for_update(skip_locked=True)
+        return conn.scalars(delete(queue).where(queue.c.form_a_id.in_(oldest)).returning(queue.c.form_a_id)).all()
+
+    def _index(self, conn, rows):
+        if self.search:
+            index_form_a(conn, rows)
+        index_entities(conn, rows)
+
+    def run_once(self):
+        """Index one chunk of the queue; returns how many stories were claimed (0 = queue empty)."""
+        with self.engine.connect() as conn:
+            ids = self._claim(conn)
+            if not ids:
+                conn.rollback()
+                return 0
+            columns = [FormA.id, FormA.user_id, FormA.created_at] + [getattr(FormA, c) for c in SEARCH_COLUMNS]
+            rows = [dict(row._mapping) for row in conn.execute(select(*columns).where(FormA.id.in_(ids)))]
+            failed = 0
+            try:
+                with conn.begin_nested():
+                    self._index(conn, rows)
+            except Exception as e:
+                # One bad story must not keep the rest of the chunk out of the index
+                print(f"Indexing {len(rows)} imported stories failed, retrying one by one: {e}")
+                for row in rows:
+                    try:
+                        with conn.begin_nested():
+                            self._index(conn, [row])
+                    except Exception as e:
+                        failed += 1
+                        print(f"Could not index story {row['id']}: {e}")
+            conn.commit()
+        with self._lock:
+            self.indexed += len(rows) - failed
+            self.failed += failed
+            self.chunks += 1
+        return len(ids)
+
+    def run_pending(self):
+        """Background task body: index chunks until the queue is empty or an import starts"""
+        while not self._importing and self.run_once():
+            pass
+
+    def drain(self):
+        """Index until the queue is empty; returns how many stories were claimed."""
+        total = 0
+        while True:
+            claimed = self.run_once()
+            if not claimed:
+                return total
+            total += claimed
+
+    def pending(self):
+        with self.engine.connect() as conn:
+            return conn.scalar(select(func.count()).select_from(FormAIndexQueue))
+
+    def stats(self):
+        with self._lock:
+            stats = {'indexed': self.indexed, 'failed': self.failed, 'chunks': self.chunks, 'batch_size': self.batch_size}
+        stats['pending'] = self.pending()
+        return stats
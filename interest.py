@@ -0,0 +1,107 @@
+"""
+Spatial interest management for the City Life rooms.
+
+Every player's position is kept in a uniform grid (one cell per city block
+plus its road by default), so "who is near this player" is a look at a few
+cells instead of the whole room. Each tick, RoomInterest turns the players
+that moved into one batch per recipient: players within radius are sent
+every tick, the others only every far_every ticks (with their latest
+state), and players inside their private house interior are not sent at
+all - nor sent anything. A recipient's share then depends on how many
+players are around it; as the city has a fixed size that still rises with
+the room, which is why the room cap stays modest.
+"""
+import math
+import threading
+
+class SpatialGrid:
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self._cells = {}       # (cx, cz) -> set of sids
+        self._positions = {}   # sid -> (cell, x, z)
+        self._lock = threading.Lock()
+
+    def _cell(self, x, z):
+        return math.floor(x / self.cell_size), math.floor(z / self.cell_size)
+
+    def move(self, sid, x, z):
+        cell = self._cell(x, z)
+        with self._lock:
+            current = self._positions.get(sid)
+            if current is not None and current[0] != cell:
+                self._discard(sid, current[0])
+            if current is None or current[0] != cell:
+                self._cells.setdefault(cell, set()).add(sid)
+            self._positions[sid] = (cell, x, z)
+
+    def remove(self, sid):
+        with self._lock:
+            current = self._positions.pop(sid, None)
+            if current is not None:
+                self._discard(sid, current[0])
+
+    def _discard(self, sid, cell):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(sid)
+            if not members:
+                del self._cells[cell]
+
+    def within(self, x, z, radius):
+        """Set of sids within radius of (x, z)."""
+        (cx0, cz0), (cx1, cz1) = self._cell(x - radius, z - radius), self._cell(x + radius, z + radius)
+        r2 = radius * radius
+        found = set()
+        with self._lock:
+            for cx in range(cx0, cx1 + 1):
+                for cz in range(cz0, cz1 + 1):
+                    for sid in self._cells.get((cx, cz), ()):
+                        _, px, pz = self._positions[sid]
+                        if (px - x) ** 2 + (pz - z) ** 2 <= r2:
+                            found.add(sid)
+        return found
+
+class RoomInterest:
+    def __init__(self, cell_size=27.0, radius=18.0, far_every=10):
+        self.grid = SpatialGrid(cell_size)
+        self.radius = radius
+        self.far_every = max(1, far_every)   # Distant players are sent every far_every-th batch
+        self._far_dirty = set()              # Moved since the last far batch
+        self._batches = 0
+        self._lock = threading.Lock()
+
+    def batches(self, players, changed):
+        """[(recipient sid, [(sid, player), ...])] for one tick of a room.
+
+        players is the room's {sid: player} dict, changed the [(sid, player)] that moved since
+        the room's last tick.
+        """
+        with self._lock:
+            self._batches += 1
+            self._far_dirty.update(sid for sid, _ in changed)
+            far = set(self._far_dirty) if self._batches % self.far_every == 0 else set()
+            if far:
+                self._far_dirty.clear()
+        near_changed = {sid for sid, _ in changed}
+
+        out = []
+        for recipient, rp in list(players.items()):
+            if rp.get('insideHouse'):
+                continue
+            near = self.grid.within(rp['x'], rp['z'], self.radius)
+            sids = (near_changed & near) | (far - near)
+            sids.discard(recipient)
+            batch = [(sid, players[sid]) for sid in sids
+                     if sid in players and not players[sid].get('insideHouse')]
+            if batch:
+                out.append((recipient, batch))
+        return out
+
+    def pending(self):
+        """True while moves are waiting for the next far batch."""
+        with self._lock:
+            return bool(self._far_dirty)
+
+    def visible(self, players, recipient):
+        """Every player the recipient may see (for a full refresh when it leaves a house)."""
+        return [(sid, p) for sid, p in list(players.items()) if sid != recipient and not p.get('insideHouse')]
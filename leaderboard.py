@@ -0,0 +1,293 @@
+"""
+In-memory leaderboard for the Labyrinth game (game 01).
+
+Every player's standing is kept in memory, with one order-statistic list per
+ranking. The game API updates it incrementally as players level up, earn
+coins or buy avatars. /games/01/api/leaderboard serves a pre-serialized JSON
+snapshot that is rebuilt only when the version changes; exact ranks, windows
+around a player and paginated full rankings are answered in O(log n).
+"""
+import base64
+import datetime
+import hashlib
+import json
+import threading
+from bisect import bisect_left, insort
+
+# Players without a highest_level_at sort after everyone on the same level
+NEVER = datetime.datetime.max
+
+class PlayerStanding:
+    __slots__ = ('user_id', 'name', 'highest_level', 'highest_level_at', 'avatars', 'coins')
+
+    def __init__(self, user_id, name, highest_level, highest_level_at, avatars, coins):
+        self.user_id = user_id
+        self.name = name
+        self.highest_level = highest_level or 1
+        self.highest_level_at = highest_level_at
+        self.avatars = avatars or 0
+        self.coins = coins or 0
+
+    def level_key(self):
+        # Highest level first, tie-break by who got there first
+        return (-self.highest_level, self.highest_level_at or NEVER, self.user_id)
+
+    def avatar_key(self):
+        # Most avatars first, tie-break by coins
+        return (-self.avatars, -self.coins, self.user_id)
+
+def encode_cursor(board, key):
+    """Opaque keyset cursor for a board key"""
+    if board == 'level':
+        raw = [key[0], key[1].isoformat(), key[2]]
+    else:
+        raw = list(key)
+    return base64.urlsafe_b64encode(json.dumps(raw).encode()).decode().rstrip('=')
+
+def decode_cursor(board, cursor):
+    """Board key from a cursor, or None if it is malformed"""
+    try:
+        a, b, user_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if board == 'level':
+            return (int(a), datetime.datetime.fromisoformat(b), str(user_id))
+        return (int(a), int(b), str(user_id))
+    except (ValueError, TypeError):
+        return None
+
+class OrderStatisticList:
+    """Sorted list of keys with O(log n) rank and positional lookup.
+
+    Keys live in buckets of at most 2 * LOAD entries, with a Fenwick tree over the
+    bucket sizes, so insert/remove only shift one small bucket and rank() / at()
+    cost two binary searches plus a tree walk.
+    """
+    LOAD = 256
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self._buckets = [keys[i:i + self.LOAD] for i in range(0, len(keys), self.LOAD)]
+        self._rebuild()
+
+    def _rebuild(self):
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._tree = [0] * (len(self._buckets) + 1)
+        for i, bucket in enumerate(self._buckets):
+            self._tree_add(i, len(bucket))
+        self._len = sum(len(bucket) for bucket in self._buckets)
+
+    def _tree_add(self, i, delta):
+        i += 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _tree_prefix(self, i):
+        """Number of keys in buckets [0, i)"""
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def __len__(self):
+        return self._len
+
+    def add(self, key):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._rebuild()
+            return
+        i = min(bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[i]
+        insort(bucket, key)
+        self._maxes[i] = bucket[-1]
+        self._tree_add(i, 1)
+        self._len += 1
+        if len(bucket) > 2 * self.LOAD:
+            self._buckets[i:i + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self._rebuild()
+
+    def remove(self, key):
+        """Remove key if present; returns whether it was found."""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            return False
+        bucket = self._buckets[i]
+        j = bisect_left(bucket, key)
+        if j == len(bucket) or bucket[j] != key:
+            return False
+        del bucket[j]
+        self._len -= 1
+        if bucket:
+            self._maxes[i] = bucket[-1]
+            self._tree_add(i, -1)
+        else:
+            del self._buckets[i]
+            self._rebuild()
+        return True
+
+    def rank(self, key):
+        """Number of keys strictly smaller than key (0-based position of key)."""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            return self._len
+        return self._tree_prefix(i) + bisect_left(self._buckets[i], key)
+
+    def _locate(self, index):
+        """(bucket, offset) of the key at position index, via a Fenwick tree descent."""
+        pos = 0
+        remaining = index
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= remaining:
+                pos = nxt
+                remaining -= self._tree[nxt]
+            step >>= 1
+        return pos, remaining
+
+    def at(self, index):
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        i, j = self._locate(index)
+        return self._buckets[i][j]
+
+    def islice(self, start, stop):
+        """Yield keys at positions [start, stop)."""
+        start = max(start, 0)
+        stop = min(stop, self._len)
+        if start >= stop:
+            return
+        i, j = self._locate(start)
+        count = stop - start
+        while count > 0:
+            bucket = self._buckets[i]
+            chunk = bucket[j:j + count]
+            yield from chunk
+            count -= len(chunk)
+            i, j = i + 1, 0
+
+class Leaderboard:
+    def __init__(self, top_k=15):
+        self.top_k = top_k
+        self.version = 0
+        self._players = {}
+        self._boards = {'level': OrderStatisticList(), 'avatars': OrderStatisticList()}
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def load(self, standings):
+        """Replace the whole board, e.g. when seeding from the database."""
+        players = {p.user_id: p for p in standings}
+        boards = {
+            'level': OrderStatisticList(p.level_key() for p in players.values()),
+            'avatars': OrderStatisticList(p.avatar_key() for p in players.values()),
+        }
+        with self._lock:
+            self._players = players
+            self._boards = boards
+            self.version += 1
+
+    def update(self, user_id, name=None, create=True, **fields):
+        """Add a player or change some of their fields (highest_level, highest_level_at, avatars, coins).
+
+        With create=False (partial updates) a player not on the board is left alone; returns
+        False in that case, True once the board has been changed.
+        """
+        with self._lock:
+            player = self._players.get(user_id)
+            if player is None:
+                if not create:
+                    return False
+                player = PlayerStanding(user_id, name or '', fields.get('highest_level'),
+                                        fields.get('highest_level_at'), fields.get('avatars'), fields.get('coins'))
+                self._players[user_id] = player
+            else:
+                self._remove_keys(player)
+                if name is not None:
+                    player.name = name
+                for field, value in fields.items():
+                    setattr(player, field, value)
+            self._boards['level'].add(player.level_key())
+            self._boards['avatars'].add(player.avatar_key())
+            self.version += 1
+            return True
+
+    def remove(self, user_id):
+        with self._lock:
+            player = self._players.pop(user_id, None)
+            if player is not None:
+                self._remove_keys(player)
+                self.version += 1
+
+    def _remove_keys(self, player):
+        self._boards['level'].remove(player.level_key())
+        self._boards['avatars'].remove(player.avatar_key())
+
+    def __contains__(self, user_id):
+        return user_id in self._players
+
+    def _entry(self, board, rank, key):
+        player = self._players[key[-1]]
+        if board == 'level':
+            return {
+                'rank': rank,
+                'name': player.name,
+                'highest_level': player.highest_level,
+                'achieved_at': player.highest_level_at.strftime('%Y-%m-%d') if player.highest_level_at else None
+            }
+        return {'rank': rank, 'name': player.name, 'avatars': player.avatars, 'coins': player.coins}
+
+    def _key(self, board, player):
+        return player.level_key() if board == 'level' else player.avatar_key()
+
+    def rank(self, board, user_id):
+        """Exact 1-based rank of a player on a board ('level' or 'avatars'), or None."""
+        with self._lock:
+            player = self._players.get(user_id)
+            if player is None:
+                return None
+            return self._boards[board].rank(self._key(board, player)) + 1
+
+    def around(self, board, user_id, window):
+        """(rank, total, entries) for the players ranked within +/- window of user_id."""
+        with self._lock:
+            player = self._players.get(user_id)
+            if player is None:
+                return None, len(self._players), []
+            keys = self._boards[board]
+            position = keys.rank(self._key(board, player))
+            start = max(position - window, 0)
+            entries = [dict(self._entry(board, start + i + 1, key), is_me=key[-1] == user_id)
+                       for i, key in enumerate(keys.islice(start, position + window + 1))]
+            return position + 1, len(keys), entries
+
+    def page(self, board, after=None, limit=50):
+        """Keyset page of a full ranking: entries strictly after the key `after`, plus the last key."""
+        with self._lock:
+            keys = self._boards[board]
+            start = keys.rank(after) if after is not None else 0
+            if after is not None and start < len(keys) and keys.at(start) == after:
+                start += 1
+            page_keys = list(keys.islice(start, start + limit))
+            entries = [self._entry(board, start + i + 1, key) for i, key in enumerate(page_keys)]
+            last = page_keys[-1] if page_keys and start + limit < len(keys) else None
+            return entries, last
+
+    def snapshot(self):
+        """Return (version, etag, JSON bytes) for the top-K of both rankings."""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot[0] == self.version:
+            return snapshot
+        with self._lock:
+            version = self.version
+            body = json.dumps({
+                'level_ranking': [self._entry('level', i + 1, key)
+                                  for i, key in enumerate(self._boards['level'].islice(0, self.top_k))],
+                'avatar_ranking': [self._entry('avatars', i + 1, key)
+                                   for i, key in enumerate(self._boards['avatars'].islice(0, self.top_k))]
+            }, separators=(',', ':')).encode('utf-8')
+            # Content hash, so ETags agree across gunicorn workers with different version counters
+            etag = hashlib.sha1(body).hexdigest()[:16]
+            self._snapshot = (version, etag, body)
+            return self._snapshot
@@ -1,7 +1,7 @@
 from datetime import datetime
 import uuid
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.dialects.postgresql import UUID
 
 class Base(DeclarativeBase):
@@ -28,6 +28,10 @@ class User(Base):
 # Four example forms with a few text fields
 class FormA(Base):
     __tablename__ = "form_a"
+    __table_args__ = (
+        # Keyset pagination for the Button D timeline: WHERE user_id = ? AND (created_at, id) < (?, ?)
+        Index("ix_form_a_user_created", "user_id", "created_at", "id"),
+    )
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), nullable=False)
     about: Mapped[str] = mapped_column(String(200), nullable=False)
@@ -48,6 +52,9 @@ class FormA(Base):
 
 class FormB(Base):
     __tablename__ = "form_b"
+    __table_args__ = (
+        Index("ix_form_b_user_created", "user_id", "created_at", "id"),
+    )
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), nullable=False)
     name: Mapped[str] = mapped_column(String(200), nullable=False)
@@ -63,6 +70,9 @@ class FormB(Base):
 
 class FormC(Base):
     __tablename__ = "form_c"
+    __table_args__ = (
+        Index("ix_form_c_user_created", "user_id", "created_at", "id"),
+    )
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), nullable=False)
     subject: Mapped[str] = mapped_column(String(200), nullable=False)
@@ -91,6 +101,38 @@ class FormD(Base):
 
     user: Mapped["User"] = relationship("User", back_populates="forms_d")
 
+# Persons/organizations named in Form A stories, one row per distinct normalized name
+class Entity(Base):
+    __tablename__ = "entities"
+    __table_args__ = (
+        Index("ux_entities_kind_norm", "kind", "norm", unique=True),
+    )
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    kind: Mapped[str] = mapped_column(String(20), nullable=False)  # 'person' or 'organization'
+    name: Mapped[str] = mapped_column(String(255), nullable=False)  # Display form, as first written
+    norm: Mapped[str] = mapped_column(String(255), nullable=False)  # Normalized lookup key
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+# Inverted index: which Form A stories mention which entity (maintained by entities.index_entities)
+class EntityMention(Base):
+    __tablename__ = "entity_mentions"
+    __table_args__ = (
+        Index("ux_entity_mentions_record_entity", "form_a_id", "entity_id", unique=True),
+        Index("ix_entity_mentions_entity_user", "entity_id", "user_id", "created_at"),
+        Index("ix_entity_mentions_user_entity", "user_id", "entity_id"),
+    )
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    entity_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("entities.id"), nullable=False)
+    form_a_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("form_a.id"), nullable=False)
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)  # Story's created_at
+
+# Bulk-imported Form A stories whose search/entity index entries are not written yet (see index_queue.py)
+class FormAIndexQueue(Base):
+    __tablename__ = "form_a_index_queue"
+    form_a_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    queued_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
 # Avatar catalog - defines all available avatars
 class Avatar(Base):
     __tablename__ = "avatars"
@@ -106,6 +148,7 @@ class Avatar(Base):
     last_update: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     active: Mapped[bool] = mapped_column(Boolean, default=True)
     status: Mapped[str] = mapped_column(String(100), nullable=True)
+    variants: Mapped[str] = mapped_column(Text, nullable=True)  # JSON thumbnail variants (see thumbnails.py), NULL = originals only
 
 # Game user model for Labyrinth Game
 class GameUser(Base):
@@ -117,7 +160,7 @@ class GameUser(Base):
     coins: Mapped[int] = mapped_column(Integer, default=0)
     highest_level: Mapped[int] = mapped_column(Integer, default=1)
     highest_level_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
-    avatars: Mapped[int] = mapped_column(Integer, default=0)
+    avatars: Mapped[int] = mapped_column(Integer, default=0)  # Number of game_user_avatars rows (denormalized)
     selected_avatar: Mapped[str] = mapped_column(String(100), default='avatar-default')
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     last_update: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -127,10 +170,19 @@ class GameUser(Base):
     # Relationship to owned avatars
     owned_avatars: Mapped[list["GameUserAvatar"]] = relationship("GameUserAvatar", back_populates="user", cascade="all, delete-orphan")
 
+# Level ranking order (highest_level desc, earliest highest_level_at first) for the leaderboard seed query
+Index("ix_game_users_level_rank", GameUser.highest_level.desc(), GameUser.highest_level_at.asc())
+# Avatar ranking order (avatars desc, coins desc); avatars is a counter kept by game_buy_avatar
+Index("ix_game_users_avatar_rank", GameUser.avatars.desc(), GameUser.coins.desc())
+
 
 # Game user avatars - tracks which avatars each player owns
 class GameUserAvatar(Base):
     __tablename__ = "game_user_avatars"
+    __table_args__ = (
+        # One row per (player, avatar); game_buy_avatar relies on it for INSERT ... ON CONFLICT DO NOTHING
+        Index("ux_game_user_avatars_user_avatar", "user_id", "avatar_id", unique=True),
+    )
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("game_users.id"), nullable=False)
     avatar_id: Mapped[str] = mapped_column(String(100), nullable=False)  # References Avatar.avatar_id
@@ -140,3 +192,19 @@ class GameUserAvatar(Base):
     status: Mapped[str] = mapped_column(String(100), nullable=True)
 
     user: Mapped["GameUser"] = relationship("GameUser", back_populates="owned_avatars")
+
+
+# Game wallet ledger - idempotency keys of applied coin deltas (see wallet.py)
+class GameWalletEntry(Base):
+    __tablename__ = "game_wallet_entries"
+    __table_args__ = (
+        # A retried delta with the same key is applied once, whichever gunicorn worker receives it
+        Index("ux_game_wallet_entries_user_key", "user_id", "idempotency_key", unique=True),
+        # Pruning of expired keys
+        Index("ix_game_wallet_entries_created", "created_at"),
+    )
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("game_users.id"), nullable=False)
+    idempotency_key: Mapped[str] = mapped_column(String(100), nullable=False)
+    delta: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
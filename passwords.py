@@ -0,0 +1,167 @@
+"""
+Bounded process pool for bcrypt password hashing (game 01 login/register).
+
+bcrypt is deliberately slow, so hashing inline lets a burst of logins tie up
+every gunicorn thread. Hashes run in a small per-worker process pool instead,
+with a hard limit on queued + running jobs: once it is reached, callers get
+PasswordPoolBusy immediately (the API answers 503) rather than queueing behind
+the burst. A request thread still waits for its own job, so the limit has to
+stay below the worker's request thread count - the hasher refuses to start
+otherwise - which keeps at least one thread free for everything else. The
+pool processes come from a forkserver (spawn where that is unavailable): the
+app already runs background threads by the time the first hash is needed,
+and forking a multi-threaded process is unsafe. They are started with the
+main module hidden, so they never re-run the entry script (for `python
+app.py`, the whole app start-up). A pool process that dies mid-job fails
+only that request (503) and the pool is replaced. The cost factor is
+configurable; hashes made with another cost are flagged by needs_rehash()
+so login can upgrade them transparently.
+"""
+import contextlib
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+
+class PasswordPoolBusy(Exception):
+    """Raised when the pool's queue is full or a job did not finish in time."""
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+def hash_rounds(hashed):
+    """Cost factor of a bcrypt hash ($2b$12$...), or None if it cannot be parsed."""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+# Serializes the process starts that swap out sys.modules['__main__']
+_spawn_lock = threading.Lock()
+
+@contextlib.contextmanager
+def _main_hidden():
+    # spawn/forkserver re-import the parent's main module in every new process (and in the
+    # fork server, when it preloads); with a bare stand-in there is nothing to re-import
+    with _spawn_lock:
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = main
+
+def _pool_context():
+    methods = multiprocessing.get_all_start_methods()
+    if 'forkserver' in methods:
+        context = multiprocessing.get_context('forkserver')
+        # The fork server imports these once; each pool process then starts with them loaded
+        context.set_forkserver_preload(['bcrypt', __name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+class PasswordHasher:
+    def __init__(self, rounds=12, workers=2, max_pending=2, timeout=10, request_threads=None):
+        if request_threads is not None and max_pending >= request_threads:
+            raise ValueError(f"max_pending ({max_pending}) must be lower than the request threads per worker "
+                             f"({request_threads}), or a burst of logins can occupy all of them")
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._stats = {'hash': [0, 0.0, 0.0], 'check': [0, 0.0, 0.0]}  # op -> [count, total ms, max ms]
+        self.rejected = 0
+        self.timeouts = 0
+        self.broken = 0
+
+    def _executor(self):
+        # Created lazily and per process, so gunicorn workers forked after import each get their own
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context())
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _reset(self, pool):
+        # Replace a broken pool (unless another thread already did)
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, *args):
+        # Submitting may start pool processes (and the fork server)
+        with _main_hidden():
+            pool = self._executor()
+            try:
+                return pool, pool.submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed); start a fresh pool and retry once
+                self._reset(pool)
+                pool = self._executor()
+                return pool, pool.submit(fn, *args)
+
+    def _run(self, op, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordPoolBusy('Password hashing is saturated')
+        started = time.perf_counter()
+        try:
+            pool, future = self._submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is held until the job really finishes, even if we stop waiting for it
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise PasswordPoolBusy('Password hashing timed out')
+        except BrokenProcessPool:
+            # A pool process died while this job was queued or running
+            self._reset(pool)
+            with self._lock:
+                self.broken += 1
+            raise PasswordPoolBusy('Password hashing pool restarted')
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stat = self._stats[op]
+            stat[0] += 1
+            stat[1] += elapsed_ms
+            stat[2] = max(stat[2], elapsed_ms)
+        return result, elapsed_ms
+
+    def hash(self, password):
+        """(bcrypt hash as str, elapsed ms) at the configured cost."""
+        hashed, elapsed_ms = self._run('hash', _hash, password.encode('utf-8'), self.rounds)
+        return hashed.decode('utf-8'), elapsed_ms
+
+    def check(self, password, hashed):
+        """(whether password matches hashed, elapsed ms)."""
+        return self._run('check', _check, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def stats(self):
+        with self._lock:
+            ops = {op: {'count': count, 'avg_ms': round(total / count, 1) if count else None, 'max_ms': round(peak, 1)}
+                   for op, (count, total, peak) in self._stats.items()}
+            return {'rounds': self.rounds, 'workers': self.workers, 'max_pending': self.max_pending,
+                    'rejected': self.rejected, 'timeouts': self.timeouts, 'broken': self.broken, **ops}
@@ -0,0 +1,104 @@
+"""
+In-memory multiplayer room registry for the Socket.IO games (Elf Quest, City Life).
+
+Rooms are kept per game as plain dicts ({'players': {sid: player}, ...game
+state}), plus a reverse index sid -> (game, room code) so the per-event
+handlers find the sender's room with one dict lookup instead of scanning
+every room. Join and leave go through the registry under one lock (handlers
+run on several threads with async_mode='threading') and keep both sides
+consistent: a sid is in at most one room, and empty rooms are dropped.
+"""
+import threading
+
+class RoomRegistry:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._rooms = {}   # game -> {room code: room}
+        self._where = {}   # sid -> (game, room code)
+
+    def rooms(self, game):
+        """Live {room code: room} dict of a game (read it under self.lock if you iterate it)."""
+        with self.lock:
+            return self._rooms.setdefault(game, {})
+
+    def get(self, game, code):
+        """A room by code, or None (lock-free)."""
+        rooms = self._rooms.get(game)
+        return rooms.get(code) if rooms is not None else None
+
+    def find(self, sid, game):
+        """(room code, room, player) of a sid in one of game's rooms, or None.
+
+        Lock-free: a single dict lookup each, so it stays O(1) however many rooms exist.
+        """
+        where = self._where.get(sid)
+        if where is None or where[0] != game:
+            return None
+        room = self._rooms[game].get(where[1])
+        player = room['players'].get(sid) if room is not None else None
+        if player is None:
+            return None
+        return where[1], room, player
+
+    def join(self, game, code, sid, new_room, new_player, max_players):
+        """Add sid to a room, leaving its previous room first.
+
+        new_room() creates the room state, new_player(room) the player dict (called under the
+        lock, so it can pick a free slot). Returns (room, player, left) - left is what leave()
+        returned for the previous room, or None - or (None, None, None) if the room is full
+        (the sid then stays where it was).
+        """
+        with self.lock:
+            rooms = self._rooms.setdefault(game, {})
+            room = rooms.get(code)
+            if room is not None and sid not in room['players'] and len(room['players']) >= max_players:
+                return None, None, None
+            where = self._where.get(sid)
+            left = None
+            if where is not None and where != (game, code):
+                left = self.leave(sid)
+            if room is None:
+                room = rooms[code] = new_room()
+            player = room['players'][sid] = new_player(room)
+            self._where[sid] = (game, code)
+            return room, player, left
+
+    def leave(self, sid):
+        """Remove a sid from its room; returns (game, room code, room, player) or None.
+
+        The room is dropped once its last player leaves (room['players'] is then empty).
+        """
+        with self.lock:
+            where = self._where.pop(sid, None)
+            if where is None:
+                return None
+            game, code = where
+            rooms = self._rooms[game]
+            room = rooms.get(code)
+            if room is None:
+                return None
+            player = room['players'].pop(sid, None)
+            if not room['players']:
+                del rooms[code]
+            return game, code, room, player
+
+    def rename(self, old_sid, new_sid):
+        """Hand a player's seat (and player dict) to a new sid; returns (game, room code, room, player) or None."""
+        with self.lock:
+            where = self._where.get(old_sid)
+            if where is None or new_sid in self._where:
+                return None
+            game, code = where
+            room = self._rooms[game].get(code)
+            if room is None or old_sid not in room['players']:
+                return None
+            player = room['players'].pop(old_sid)
+            room['players'][new_sid] = player
+            del self._where[old_sid]
+            self._where[new_sid] = where
+            return game, code, room, player
+
+    def stats(self):
+        with self.lock:
+            return {game: {'rooms': len(rooms), 'players': sum(len(r['players']) for r in rooms.values())}
+                    for game, rooms in self._rooms.items()}
@@ -0,0 +1,71 @@
+"""
+Backfill / verify the denormalized game_users.avatars counter.
+
+game_buy_avatar keeps game_users.avatars equal to the number of the player's
+game_user_avatars rows. This script recomputes the counts in batches and
+either fixes the drift (default) or only reports it (--check, exits 1 when
+drift is found).
+
+Run from repo root:
+    python scripts/backfill_avatar_counts.py [--check] [--batch-size 1000]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, select, update, func, bindparam
+from config import Config
+from models import GameUser, GameUserAvatar
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill or check game_users.avatars.")
+    parser.add_argument("--check", action="store_true", help="Only report drift, do not write")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
+
+    counts = (select(GameUserAvatar.user_id, func.count().label('owned'))
+              .group_by(GameUserAvatar.user_id)
+              .subquery())
+    checked = 0
+    drifted = 0
+    last_id = None
+    with engine.connect() as conn:
+        while True:
+            stmt = (select(GameUser.id, GameUser.username, GameUser.avatars,
+                           func.coalesce(counts.c.owned, 0).label('owned'))
+                    .outerjoin(counts, counts.c.user_id == GameUser.id)
+                    .order_by(GameUser.id)
+                    .limit(args.batch_size))
+            if last_id is not None:
+                stmt = stmt.where(GameUser.id > last_id)
+            rows = conn.execute(stmt).all()
+            if not rows:
+                break
+            checked += len(rows)
+            last_id = rows[-1].id
+
+            drift = [row for row in rows if row.avatars != row.owned]
+            for row in drift:
+                print(f"  {row.username}: avatars={row.avatars} actual={row.owned}")
+            drifted += len(drift)
+            if drift and not args.check:
+                conn.execute(
+                    update(GameUser.__table__)
+                    .where(GameUser.__table__.c.id == bindparam('user_id'))
+                    .values(avatars=bindparam('owned')),
+                    [{'user_id': row.id, 'owned': row.owned} for row in drift]
+                )
+                conn.commit()
+
+    print(f"\nChecked {checked} players, {drifted} with drift" +
+          ("" if args.check or not drifted else " (fixed)"))
+    if args.check and drifted:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Rebuild the persons/organizations entity index for existing Form A stories.
+New stories are indexed by form_a() as they are submitted; run this once after
+deploying the entity tables, or any time the index needs rebuilding.
+Bulk-imported stories still waiting in form_a_index_queue are left to the queue.
+
+Run from repo root:
+    python scripts/backfill_entities.py [--batch-size 500]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, select
+from config import Config
+from models import Base, FormA, FormAIndexQueue
+from entities import index_entities
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the Form A entity index.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
+    Base.metadata.create_all(engine)
+
+    columns = (FormA.id, FormA.user_id, FormA.created_at, FormA.persons, FormA.organizations)
+    total = 0
+    last_id = None
+    with engine.connect() as conn:
+        while True:
+            stmt = (select(*columns).where(FormA.id.not_in(select(FormAIndexQueue.form_a_id)))
+                    .order_by(FormA.id).limit(args.batch_size))
+            if last_id is not None:
+                stmt = stmt.where(FormA.id > last_id)
+            rows = [dict(row._mapping) for row in conn.execute(stmt)]
+            if not rows:
+                break
+            index_entities(conn, rows, replace=True)
+            conn.commit()
+            total += len(rows)
+            last_id = rows[-1]['id']
+            print(f"Indexed {total} stories...")
+
+    print(f"Done. Indexed {total} stories.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark the NDJSON bulk import endpoint (/import) in-process.
+
+Uses whatever DATABASE_URL points at (SQLite or PostgreSQL) and creates a
+throwaway user plus the imported rows - run it against a scratch database.
+
+Measured on fresh databases (50,000 rows, batch size 1000, PostgreSQL 16 on
+the same host):
+
+    form   SQLite         PostgreSQL
+    a      ~14,000 rows/s ~14,500 rows/s
+    b      ~21,500        ~20,000
+    c      ~21,500        ~18,000
+
+Form A stories are search- and entity-indexed by the background queue
+(index_queue.py) after they are stored; for Form A the script also waits for
+the queue to empty. That end-to-end figure is ~4,000 stories/s on SQLite and
+~2,500 on PostgreSQL with a single worker (the entity mentions, with their
+foreign keys and indexes, are most of it); on PostgreSQL each worker indexes
+its own chunks, so it grows with the number of workers.
+
+Run from repo root:
+    python scripts/bench_import.py [--rows 50000] [--form a] [--batch-size 1000]
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy.orm import Session
+from app import app, db_engine, index_queue
+from models import User
+
+def make_line(form, i):
+    if form == 'a':
+        return {'about': f'Story {i}', 'headline': f'Headline number {i}', 'body': 'Lorem ipsum dolor sit amet ' * 8,
+                'persons': f'Person {i % 100}, Jane Doe', 'organizations': f'Org {i % 20}'}
+    if form == 'b':
+        return {'name': f'Name {i}', 'summary': 'Lorem ipsum dolor sit amet ' * 4, 'comment': 'ok'}
+    return {'subject': f'Subject {i}', 'details': 'Lorem ipsum dolor sit amet ' * 4, 'extra': ''}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NDJSON bulk import.")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--form", choices=['a', 'b', 'c'], default='b')
+    parser.add_argument("--batch-size", type=int, default=app.config["IMPORT_BATCH_SIZE"])
+    args = parser.parse_args()
+
+    keyword = f"bench-{uuid.uuid4().hex}"
+    with Session(db_engine) as session:
+        session.add(User(email=f"{keyword}@bench.local", keyword=keyword))
+        session.commit()
+
+    body = "\n".join(json.dumps(make_line(args.form, i)) for i in range(args.rows)).encode('utf-8')
+    print(f"Database: {db_engine.dialect.name}, form {args.form}, {args.rows} rows, "
+          f"batch size {args.batch_size}, payload {len(body) / 1e6:.1f} MB")
+
+    client = app.test_client()
+    started = time.perf_counter()
+    response = client.post(f"/import?key={keyword}&form={args.form}&batch_size={args.batch_size}", data=body)
+    elapsed = time.perf_counter() - started
+
+    result = response.get_json()
+    print(f"Inserted {result['inserted']} rows ({result['error_count']} errors) in {elapsed:.2f}s "
+          f"-> {result['inserted'] / elapsed:,.0f} rows/s")
+    if args.form == 'a':
+        # Stories become searchable as the background indexer works through the queue
+        while index_queue.pending():
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        print(f"Searchable and entity-indexed after {elapsed:.2f}s -> {result['inserted'] / elapsed:,.0f} rows/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Fan-out of a City Life room with and without spatial interest management
+(interest.py): player records the server sends per second as the room grows.
+
+Every player walks around the 4x4 block city at 20 updates per second, and
+batches go out ROOM_TICK_HZ times a second. Without interest management each
+batch carries every player that moved to every member (players^2 records per
+tick); with it, a member gets its neighbours within CITY_INTEREST_RADIUS
+every tick and everyone else every CITY_FAR_UPDATE_EVERY ticks. "per player"
+is what one client receives; the city has a fixed size, so it still grows
+with the room and CITY_MAX_PLAYERS should stay where it is no higher than an
+8-player room without interest management (the first line of the output).
+
+Run from repo root:
+    python scripts/bench_interest.py [--seconds 5] [--players 8,16,32,64]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import Config
+from interest import RoomInterest
+
+CITY_LIMIT = 56.5
+
+def walk(p):
+    p['x'] = min(CITY_LIMIT, max(-CITY_LIMIT, p['x'] + random.uniform(-0.5, 0.5)))
+    p['z'] = min(CITY_LIMIT, max(-CITY_LIMIT, p['z'] + random.uniform(-0.5, 0.5)))
+
+def simulate(count, seconds, tick_hz):
+    players = {f"sid-{i}": {'x': random.uniform(-CITY_LIMIT, CITY_LIMIT), 'z': random.uniform(-CITY_LIMIT, CITY_LIMIT),
+                            'ry': 0.0, 'moving': True, 'colorSlot': i, 'insideHouse': False} for i in range(count)}
+    interest = RoomInterest(Config.CITY_INTEREST_CELL, Config.CITY_INTEREST_RADIUS, Config.CITY_FAR_UPDATE_EVERY)
+    for sid, p in players.items():
+        interest.grid.move(sid, p['x'], p['z'])
+    broadcast = culled = 0
+    elapsed = 0.0
+    for _ in range(int(seconds * tick_hz)):
+        for sid, p in players.items():
+            walk(p)
+            interest.grid.move(sid, p['x'], p['z'])
+        changed = list(players.items())
+        broadcast += len(changed) * (count - 1)
+        started = time.perf_counter()
+        culled += sum(len(batch) for _, batch in interest.batches(players, changed))
+        elapsed += time.perf_counter() - started
+    ticks = int(seconds * tick_hz)
+    return broadcast / seconds, culled / seconds, elapsed / ticks * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare City Life room fan-out with and without interest management.")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--players", default="8,16,32,64", help="Comma-separated room sizes")
+    parser.add_argument("--tick-hz", type=float, default=Config.ROOM_TICK_HZ)
+    args = parser.parse_args()
+
+    random.seed(1)
+    print(f"Radius {Config.CITY_INTEREST_RADIUS:g}, far players every {Config.CITY_FAR_UPDATE_EVERY} ticks, "
+          f"{args.tick_hz:g} Hz, room cap {Config.CITY_MAX_PLAYERS}")
+    print(f"8-player room without interest management: {7 * args.tick_hz:,.0f} records/s per player")
+    print(f"{'players':>8} {'broadcast rec/s':>16} {'interest rec/s':>15} {'per player':>11} {'saving':>8} {'ms/tick':>8}")
+    for count in (int(n) for n in args.players.split(",")):
+        broadcast, culled, ms = simulate(count, args.seconds, args.tick_hz)
+        print(f"{count:>8} {broadcast:>16,.0f} {culled:>15,.0f} {culled / count:>11,.0f} "
+              f"{broadcast / max(culled, 1):>7.1f}x {ms:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Concurrency benchmark for the game avatar purchase endpoint
+(/games/01/api/user/avatars/buy), run in-process.
+
+Creates throwaway players and avatars in whatever DATABASE_URL points at -
+run it against a scratch database. Every player fires the same set of
+purchases from several threads at once (so most requests race for an avatar
+the player is already buying), then the script checks the invariants:
+no duplicate ownership rows, coins never negative and coins spent equal to
+the price of what was bought, and game_users.avatars matching the rows.
+
+Run from repo root:
+    python scripts/bench_purchase.py [--players 20] [--avatars 10] [--threads 16] [--repeat 3]
+"""
+import argparse
+import datetime
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import jwt
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from app import app, db_engine, GAME_JWT_SECRET, avatar_catalog
+from models import GameUser, GameUserAvatar, Avatar
+
+PRICE = 10
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent avatar purchases.")
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--avatars", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3, help="Identical requests per (player, avatar)")
+    args = parser.parse_args()
+
+    run = uuid.uuid4().hex[:8]
+    # Enough coins for all but the last avatar, so the coin check is exercised too
+    budget = PRICE * (args.avatars - 1)
+    with Session(db_engine) as session:
+        avatar_ids = [f"bench-{run}-{i}" for i in range(args.avatars)]
+        session.add_all(Avatar(avatar_id=avatar_id, name=avatar_id, price=PRICE, image_path='')
+                        for avatar_id in avatar_ids)
+        players = [GameUser(name=f"Bench {i}", username=f"bench-{run}-{i}", password='!', coins=budget)
+                   for i in range(args.players)]
+        session.add_all(players)
+        session.commit()
+        player_ids = [player.id for player in players]
+    avatar_catalog.invalidate()
+
+    expires = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    tokens = {player_id: jwt.encode({'id': str(player_id), 'username': 'bench', 'exp': expires},
+                                    GAME_JWT_SECRET, algorithm='HS256')
+              for player_id in player_ids}
+    jobs = [(player_id, avatar_id) for _ in range(args.repeat) for avatar_id in avatar_ids for player_id in player_ids]
+
+    client = app.test_client()
+
+    def buy(job):
+        player_id, avatar_id = job
+        started = time.perf_counter()
+        response = client.post('/games/01/api/user/avatars/buy', json={'avatar_id': avatar_id},
+                               headers={'Authorization': f'Bearer {tokens[player_id]}'})
+        return response.status_code, (time.perf_counter() - started) * 1000
+
+    print(f"Database: {db_engine.dialect.name}, {args.players} players x {args.avatars} avatars x "
+          f"{args.repeat} repeats = {len(jobs)} requests on {args.threads} threads")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(buy, jobs))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(ms for _, ms in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"{len(jobs) / elapsed:,.0f} requests/s, p50 {statistics.median(latencies):.1f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f} ms, statuses {statuses}")
+
+    # Invariants
+    problems = 0
+    with Session(db_engine) as session:
+        for player_id in player_ids:
+            player = session.get(GameUser, player_id)
+            owned = session.scalar(select(func.count()).select_from(GameUserAvatar)
+                                   .where(GameUserAvatar.user_id == player_id))
+            distinct = session.scalar(select(func.count(func.distinct(GameUserAvatar.avatar_id)))
+                                      .where(GameUserAvatar.user_id == player_id))
+            if owned != distinct or player.coins < 0 or budget - player.coins != owned * PRICE or player.avatars != owned:
+                problems += 1
+                print(f"  {player.username}: rows={owned} distinct={distinct} coins={player.coins} avatars={player.avatars}")
+    print("Invariants OK" if not problems else f"{problems} players with inconsistent state")
+    if problems:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
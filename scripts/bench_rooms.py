@@ -0,0 +1,78 @@
+"""
+Microbenchmark for finding a Socket.IO sender's room: the registry's
+sid -> room index (rooms.py) against the old scan over every room.
+
+Fills a registry with --players players in each of 10 ... 10,000 rooms and
+times the lookup plus the field updates an elf_player_update event does, for
+random senders. The indexed cost should stay flat as the room count grows;
+the scan grows linearly (it is skipped above --scan-limit rooms unless asked).
+
+Run from repo root:
+    python scripts/bench_rooms.py [--players 4] [--events 200000] [--scan-limit 10000]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from rooms import RoomRegistry
+
+UPDATE = {'x': 20, 'y': 14, 'dir': 'left', 'frame': 1, 'hasSword': True, 'hp': 3}
+
+def apply_update(p, data):
+    p['x'] = data.get('x', p['x'])
+    p['y'] = data.get('y', p['y'])
+    p['dir'] = data.get('dir', p['dir'])
+    p['frame'] = data.get('frame', p['frame'])
+
+def indexed_event(registry, sid):
+    found = registry.find(sid, 'elf')
+    if found is not None:
+        apply_update(found[2], UPDATE)
+
+def scan_event(rooms, sid):
+    # The loop the handlers used before the registry
+    for room, r in rooms.items():
+        if sid in r['players']:
+            apply_update(r['players'][sid], UPDATE)
+            break
+
+def time_events(fn, target, sids):
+    started = time.perf_counter()
+    for sid in sids:
+        fn(target, sid)
+    return (time.perf_counter() - started) / len(sids) * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sid -> room lookup in the room registry.")
+    parser.add_argument("--players", type=int, default=4, help="Players per room")
+    parser.add_argument("--events", type=int, default=200000, help="Events timed per room count")
+    parser.add_argument("--scan-limit", type=int, default=10000, help="Largest room count to time the scan at")
+    args = parser.parse_args()
+
+    print(f"{'rooms':>8} {'players':>8} {'indexed ns/event':>17} {'scan ns/event':>14}")
+    for room_count in (10, 100, 1000, 10000):
+        registry = RoomRegistry()
+        sids = []
+        for room in range(room_count):
+            for player in range(args.players):
+                sid = f"sid-{room}-{player}"
+                registry.join('elf', f"room{room}", sid, lambda: {'players': {}},
+                              lambda r: {'username': 'bench', 'x': 0, 'y': 0, 'dir': 'down', 'frame': 0}, args.players)
+                sids.append(sid)
+        senders = [random.choice(sids) for _ in range(args.events)]
+
+        indexed = time_events(indexed_event, registry, senders)
+        scan = '-'
+        if room_count <= args.scan_limit:
+            # The scan is slow enough at 10k rooms that a sample is plenty
+            sample = senders[:max(1000, args.events * 10 // room_count)]
+            scan = f"{time_events(scan_event, registry.rooms('elf'), sample):,.0f}"
+        print(f"{room_count:>8} {len(sids):>8} {indexed:>17,.0f} {scan:>14}")
+
+if __name__ == "__main__":
+    main()
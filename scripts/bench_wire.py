@@ -0,0 +1,97 @@
+"""
+Bytes/sec of the multiplayer position traffic: per-update JSON relays (the
+old path), JSON batches and binary batches (wire.py).
+
+Simulates one room where every player moves and sends 20 updates per second,
+with batches going out ROOM_TICK_HZ times a second, and counts what the server
+writes to all clients of the room in Socket.IO packets (the event name and
+framing included; the binary format also pays its placeholder header).
+
+Run from repo root:
+    python scripts/bench_wire.py [--seconds 10]
+"""
+import argparse
+import json
+import math
+import random
+import string
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import Config
+from wire import encode_elf_batch, encode_city_batch
+
+UPDATES_PER_SECOND = 20
+
+def sid():
+    return ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(20))
+
+def json_packet(event, data):
+    # Socket.IO EVENT packet: "2" + JSON array (after the engine.io "4" message prefix)
+    return len('42' + json.dumps([event, data], separators=(',', ':')))
+
+def binary_packet(event, payload):
+    # BINARY_EVENT header with one attachment placeholder, then the attachment frame
+    header = '451-' + json.dumps([event, {'_placeholder': True, 'num': 0}], separators=(',', ':'))
+    return len(header) + len(payload)
+
+def elf_players(n):
+    return {sid(): {'username': f'Player{i}', 'x': random.randint(3, 36), 'y': random.randint(3, 26),
+                    'dir': random.choice(('down', 'up', 'left', 'right')), 'frame': random.randint(0, 1),
+                    'hasSword': True, 'colorSlot': i, 'hp': 3} for i in range(n)}
+
+def city_players(n):
+    return {sid(): {'username': f'Player{i}', 'x': random.uniform(-55, 55), 'z': random.uniform(-55, 55),
+                    'ry': random.uniform(-math.pi, math.pi), 'moving': True, 'colorSlot': i} for i in range(n)}
+
+def move(game, p):
+    if game == 'elf':
+        p['x'] = min(36, max(3, p['x'] + random.choice((-1, 0, 1))))
+        p['frame'] ^= 1
+    else:
+        p['x'] += random.uniform(-0.5, 0.5)
+        p['z'] += random.uniform(-0.5, 0.5)
+        p['ry'] = (p['ry'] + random.uniform(-0.2, 0.2) + math.pi) % (2 * math.pi) - math.pi
+
+def simulate(game, players, fields, encoder, seconds, tick_hz):
+    clients = len(players)
+    relay = batch_json = batch_binary = 0
+    steps = UPDATES_PER_SECOND * seconds
+    ticks_per_step = tick_hz / UPDATES_PER_SECOND
+    ticks_due = 0.0
+    for _ in range(steps):
+        for player_sid, p in players.items():
+            move(game, p)
+            # Old path: every update relayed to everybody else in the room
+            relay += json_packet(f'{game}_remote_update', {'sid': player_sid, **p}) * (clients - 1)
+        ticks_due += ticks_per_step
+        while ticks_due >= 1:
+            ticks_due -= 1
+            batch = {'players': {s: {f: p[f] for f in fields} for s, p in players.items()}}
+            batch_json += json_packet(f'{game}_remote_batch', batch) * clients
+            batch_binary += binary_packet(f'{game}_remote_batch', encoder(list(players.values()))) * clients
+    return relay / seconds, batch_json / seconds, batch_binary / seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON and binary multiplayer traffic.")
+    parser.add_argument("--seconds", type=int, default=10)
+    parser.add_argument("--tick-hz", type=float, default=Config.ROOM_TICK_HZ)
+    args = parser.parse_args()
+
+    random.seed(1)
+    cases = [
+        ('elf', 4, elf_players, ('x', 'y', 'dir', 'frame', 'hasSword', 'hp'), encode_elf_batch),
+        ('city', 8, city_players, ('x', 'z', 'ry', 'moving'), encode_city_batch),
+    ]
+    print(f"All players moving, {UPDATES_PER_SECOND} updates/s each, batches at {args.tick_hz:g} Hz")
+    print(f"{'room':>10} {'JSON relay B/s':>15} {'JSON batch B/s':>15} {'binary B/s':>12} {'binary vs batch':>16}")
+    for game, n, make, fields, encoder in cases:
+        relay, batch_json, batch_binary = simulate(game, make(n), fields, encoder, args.seconds, args.tick_hz)
+        print(f"{f'{game} x{n}':>10} {relay:>15,.0f} {batch_json:>15,.0f} {batch_binary:>12,.0f} "
+              f"{batch_json / batch_binary:>15.1f}x")
+
+if __name__ == "__main__":
+    main()
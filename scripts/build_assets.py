@@ -0,0 +1,245 @@
+"""
+Build the precompressed, fingerprinted asset table served by app.py (see assets.py).
+
+Game pages first go through a bundling stage: inline <script>/<style> blocks
+of the HTML under games/ are moved into separate, minified files
+(games/03/game.html -> games/03/game.1.css, games/03/game.2.js), so the page
+shell stays small and the engine code is cached on its own. Minification
+uses rjsmin/rcssmin when installed; without them CSS gets a built-in
+comment/whitespace pass and JS is left as-is (it is still compressed).
+
+Then, for every file under games/ and static/ this writes, into build/assets/:
+  - the file itself, under a content-hash name for everything but HTML
+    (games/01/move_square.js -> games/01/move_square.1a2b3c4d.js)
+  - a .gz variant, and a .br variant when the optional brotli package is
+    installed (already-compressed images/audio are stored as-is)
+  - manifest.json mapping source paths to their fingerprinted names and variants
+HTML and CSS references (src=, href=, url()) to built files are rewritten to
+the fingerprinted names. Re-run it after changing anything under games/ or
+static/ - the server ignores a build that no longer matches the sources.
+
+Run from repo root:
+    python scripts/build_assets.py [--out build/assets]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from assets import MANIFEST_NAME, SOURCE_DIRS, INCOMPRESSIBLE, fingerprint_name, is_fingerprinted_type
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+ROOT = Path(__file__).parent.parent
+
+# Source files that are not served
+SKIP_SUFFIXES = {'.md', '.py', '.pyc'}
+SKIP_NAMES = {'.gitignore', '.DS_Store'}
+
+# Smallest file worth compressing
+MIN_COMPRESS_SIZE = 256
+
+REFERENCE = re.compile(r'''(?P<prefix>\b(?:src|href)\s*=\s*["'])(?P<url>[^"'#?]+)|(?P<css>url\(\s*["']?)(?P<cssurl>[^"')#?]+)''')
+
+def source_files():
+    for top in SOURCE_DIRS:
+        for dirpath, dirnames, filenames in os.walk(ROOT / top):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            for filename in sorted(filenames):
+                if filename in SKIP_NAMES or os.path.splitext(filename)[1] in SKIP_SUFFIXES:
+                    continue
+                path = Path(dirpath) / filename
+                yield path.relative_to(ROOT).as_posix()
+
+def resolve(url, relpath):
+    """Repo-relative path a reference in relpath points to, or None for external URLs."""
+    if re.match(r'^[a-z][a-z0-9+.-]*:', url, re.I) or url.startswith('//'):
+        return None
+    if url.startswith('/'):
+        return posixpath.normpath(url.lstrip('/'))
+    return posixpath.normpath(posixpath.join(posixpath.dirname(relpath), url))
+
+def rewrite_references(text, relpath, urls):
+    """Point src=/href=/url() references at fingerprinted names."""
+    def replace(match):
+        prefix, url = (match.group('prefix'), match.group('url')) if match.group('prefix') else \
+                      (match.group('css'), match.group('cssurl'))
+        target = resolve(url.strip(), relpath)
+        if target in urls:
+            return prefix + '/' + urls[target]
+        return match.group(0)
+    return REFERENCE.sub(replace, text)
+
+INLINE_BLOCK = re.compile(r'<(?P<tag>script|style)\b(?P<attrs>[^>]*)>(?P<body>.*?)</(?P=tag)\s*>', re.S | re.I)
+SCRIPT_TYPE = re.compile(r'\btype\s*=\s*["\']?([^"\'\s>]+)', re.I)
+JS_TYPES = {'text/javascript', 'application/javascript', 'module'}
+
+# Inline blocks smaller than this stay in the page
+MIN_BUNDLE_SIZE = 512
+
+CSS_TOKEN = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|(/\*.*?\*/)|(\s+)|([^"\'/\s]+|/)', re.S)
+CSS_PUNCTUATION = set('{};,>')
+
+def minify_css(css):
+    """Drop comments and redundant whitespace (strings are left untouched)."""
+    if rcssmin is not None:
+        return rcssmin.cssmin(css)
+    out = []
+    pending_space = False
+    for string, comment, space, other in CSS_TOKEN.findall(css):
+        if comment:
+            continue
+        if space:
+            pending_space = True
+            continue
+        token = string or other
+        # A space is only needed between two words ("0 auto", "div p"); never after "prop:"
+        if pending_space and out and out[-1][-1] not in CSS_PUNCTUATION | {':'} and token[0] not in CSS_PUNCTUATION:
+            out.append(' ')
+        pending_space = False
+        out.append(token)
+    return ''.join(out)
+
+def minify_js(js):
+    return rjsmin.jsmin(js) if rjsmin is not None else js.strip() + '\n'
+
+def extract_inline_blocks(relpath, html):
+    """Move a page's inline <script>/<style> blocks into separate files.
+
+    Returns the rewritten page and {bundle relpath: bytes}. Classic scripts become
+    <script src> in the same position, so they still run in document order.
+    """
+    bundles = {}
+    base = posixpath.splitext(relpath)[0]
+
+    def replace(match):
+        tag, attrs, body = match.group('tag').lower(), match.group('attrs'), match.group('body')
+        if len(body.strip()) < MIN_BUNDLE_SIZE:
+            return match.group(0)
+        if tag == 'script':
+            script_type = SCRIPT_TYPE.search(attrs)
+            if re.search(r'\bsrc\s*=', attrs, re.I) or 'document.currentScript' in body:
+                return match.group(0)
+            if script_type and script_type.group(1).lower() not in JS_TYPES:
+                return match.group(0)  # JSON, import maps, templates
+        ext = '.js' if tag == 'script' else '.css'
+        bundle = f"{base}.{len(bundles) + 1}{ext}"
+        bundles[bundle] = (minify_js(body) if tag == 'script' else minify_css(body)).encode('utf-8')
+        name = posixpath.basename(bundle)
+        if tag == 'script':
+            return f'<script src="{name}"{attrs}></script>'
+        return f'<link rel="stylesheet" href="{name}"{attrs}>'
+
+    return INLINE_BLOCK.sub(replace, html), bundles
+
+def write_variants(out_dir, url_path, data, compress):
+    """Write the file and its compressed variants; returns encoding -> file name."""
+    variants = {'identity': url_path}
+    target = out_dir / url_path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_bytes(data)
+    if not compress or len(data) < MIN_COMPRESS_SIZE:
+        return variants
+
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        (out_dir / (url_path + '.gz')).write_bytes(gz)
+        variants['gzip'] = url_path + '.gz'
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            (out_dir / (url_path + '.br')).write_bytes(br)
+            variants['br'] = url_path + '.br'
+    return variants
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompress and fingerprint games/ and static/ assets.")
+    parser.add_argument("--out", default=str(ROOT / "build" / "assets"))
+    args = parser.parse_args()
+
+    out_dir = Path(args.out)
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    out_dir.mkdir(parents=True)
+    if brotli is None:
+        print("brotli not installed - writing gzip variants only (pip install brotli)")
+
+    files = list(source_files())
+    contents = {relpath: (ROOT / relpath).read_bytes() for relpath in files}
+    if rjsmin is None or rcssmin is None:
+        print("rjsmin/rcssmin not installed - JS bundles are not minified (pip install rjsmin rcssmin)")
+
+    # Bundling stage: split inline scripts/styles out of the game pages
+    sources = {relpath: relpath for relpath in files}
+    for relpath in list(files):
+        if relpath.startswith('games/') and relpath.endswith('.html'):
+            html, bundles = extract_inline_blocks(relpath, contents[relpath].decode('utf-8'))
+            contents[relpath] = html.encode('utf-8')
+            for bundle, data in bundles.items():
+                files.append(bundle)
+                contents[bundle] = data
+                sources[bundle] = relpath
+
+    # Fingerprint plain assets first, so pages and stylesheets can be rewritten to point at them.
+    # CSS is hashed after its own references are rewritten, so a changed image changes the CSS name too.
+    urls = {}
+    for relpath in files:
+        if is_fingerprinted_type(relpath) and not relpath.endswith('.css'):
+            urls[relpath] = fingerprint_name(relpath, hashlib.sha256(contents[relpath]).hexdigest())
+    for relpath in files:
+        if relpath.endswith('.css'):
+            contents[relpath] = rewrite_references(contents[relpath].decode('utf-8'), relpath, urls).encode('utf-8')
+            urls[relpath] = fingerprint_name(relpath, hashlib.sha256(contents[relpath]).hexdigest())
+    for relpath in files:
+        if relpath.endswith('.html'):
+            contents[relpath] = rewrite_references(contents[relpath].decode('utf-8'), relpath, urls).encode('utf-8')
+
+    manifest = {'files': {}}
+    original_size = compressed_size = 0
+    for relpath in files:
+        data = contents[relpath]
+        st = (ROOT / sources[relpath]).stat()
+        url_path = urls.get(relpath, relpath)
+        compress = os.path.splitext(relpath)[1].lower() not in INCOMPRESSIBLE
+        variants = write_variants(out_dir, url_path, data, compress)
+        manifest['files'][relpath] = {
+            'url_path': url_path,
+            'hash': hashlib.sha256(data).hexdigest(),
+            'source': sources[relpath],
+            'source_size': st.st_size,
+            'source_mtime_ns': st.st_mtime_ns,
+            'variants': variants,
+        }
+        if compress:
+            original_size += len(data)
+            best = variants.get('br') or variants.get('gzip') or url_path
+            compressed_size += (out_dir / best).stat().st_size
+
+    (out_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    print(f"Built {len(files)} assets into {out_dir} "
+          f"(text assets {original_size / 1024:.0f} KB -> {compressed_size / 1024:.0f} KB compressed)")
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,7 @@ engine = create_engine(Config.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
 
 
 def hash_password(plain):
-    return bcrypt.hashpw(plain.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(plain.encode('utf-8'), bcrypt.gensalt(Config.BCRYPT_ROUNDS)).decode('utf-8')
 
 
 def main():
@@ -14,6 +14,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import Session
 from config import Config
 from models import Avatar
+from avatar_sync import migrate_avatars_table
 
 def main():
     """Add default avatars to the database."""
@@ -106,6 +107,7 @@ def main():
         }
     ]
 
+    migrate_avatars_table(engine)
     with Session(engine) as session:
         # Check and add each avatar
         for avatar_data in default_avatars:
@@ -1,48 +1,44 @@
 """
-Reset and repopulate avatars table on production.
-This clears all avatars and repopulates from scratch.
+Reset the avatars table to what the image files in games/img/avatars describe.
+
+Every image is hashed again (the sync manifest is ignored) and name, price,
+creator and visibility of each avatar are reset to the values derived from its
+file; avatars without an image are deactivated. Rows are updated in place, so
+purchases and number_of_users are kept.
 
 Run from repo root:
-    python scripts/reset_avatars.py
+    python scripts/reset_avatars.py [--no-thumbnails]
 """
+import argparse
 import sys
 from pathlib import Path
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import Session
+from sqlalchemy import create_engine
 from config import Config
-from models import Base, Avatar
+from models import Base
+from avatar_sync import migrate_avatars_table
+from populate_avatars_from_images import make_sync, print_report
 
 def main():
+    parser = argparse.ArgumentParser(description="Reset the avatars table from games/img/avatars.")
+    parser.add_argument("--no-thumbnails", action="store_true", help="Do not generate thumbnails")
+    args = parser.parse_args()
+
     engine = create_engine(Config.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
 
     print("="*60)
     print("RESETTING AVATARS TABLE")
     print("="*60)
 
-    with Session(engine) as session:
-        # Clear existing avatars
-        print("\n1. Clearing existing avatars...")
-        deleted = session.query(Avatar).delete()
-        session.commit()
-        print(f"   Deleted {deleted} avatar records")
-
-    # Recreate table structure
-    print("\n2. Ensuring table structure is correct...")
+    # Ensure table structure is correct
     Base.metadata.create_all(engine)
-    print("   Done")
+    migrate_avatars_table(engine)
 
-    # Now run populate script
-    print("\n3. Populating avatars from image files...")
-    import populate_avatars_from_images
-    populate_avatars_from_images.main()
-
-    print("\n" + "="*60)
-    print("Avatar reset complete!")
-    print("="*60)
+    report = make_sync(engine, thumbnails=not args.no_thumbnails).sync(full=True)
+    print_report(report)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,200 @@
+"""
+Full-text search over Form A stories.
+
+SQLite: an FTS5 table (form_a_fts) that index_form_a() keeps in sync.
+PostgreSQL: a form_a_search table of weighted tsvectors with a GIN index,
+which index_form_a() fills from form_a in one INSERT ... SELECT per batch.
+
+Both live beside form_a rather than in it, so storing a story does not pay
+for indexing it: bulk-imported stories are indexed in chunks by
+index_queue.py, and the rest as they are submitted.
+"""
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import text, inspect, Uuid, String, DateTime
+
+# Columns searched, in the order they appear in the FTS table / tsvector
+SEARCH_COLUMNS = ('headline', 'lede', 'nut_graf', 'body', 'conclusion', 'organizations', 'persons')
+
+# Per-column bm25 weights (SQLite) / tsvector weights (PostgreSQL)
+SQLITE_WEIGHTS = (10.0, 4.0, 3.0, 1.0, 2.0, 2.0, 2.0)
+PG_WEIGHTS = ('A', 'B', 'B', 'D', 'C', 'C', 'C')
+
+# Private-use characters mark highlighted terms until the snippet is HTML-escaped
+MARK_START = '\ue000'
+MARK_END = '\ue001'
+
+SNIPPET_WORDS = 24
+
+# Typed result columns for the raw search queries
+RESULT_COLUMNS = {'id': Uuid(), 'about': String(), 'headline': String(), 'created_at': DateTime(), 'snippet': String()}
+
+def ensure_search_index(engine):
+    """Create the search index for this database if missing. Returns False if search is unavailable."""
+    if engine.dialect.name == 'sqlite':
+        return _ensure_sqlite_index(engine)
+    if engine.dialect.name == 'postgresql':
+        return _ensure_pg_index(engine)
+    return False
+
+# pg_advisory_xact_lock key serializing the index setup across workers starting together
+PG_SETUP_LOCK = 0x666f726d61   # "forma"
+
+def _already_exists(error):
+    # Another worker won the race to create it: the index is there, which is all we need
+    return 'already exists' in str(error)
+
+def _ensure_sqlite_index(engine):
+    with engine.connect() as conn:
+        if 'form_a_fts' in inspect(conn).get_table_names():
+            return True
+        try:
+            # Workers start together on a deploy: the write lock lets one of them create and
+            # backfill the table while the others wait, then find it there
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            if 'form_a_fts' in inspect(conn).get_table_names():
+                conn.rollback()
+                return True
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS form_a_fts USING fts5("
+                "record_id UNINDEXED, user_id UNINDEXED, " + ", ".join(SEARCH_COLUMNS) + ", "
+                "tokenize='unicode61 remove_diacritics 2')"
+            ))
+            # Backfill stories written before the index existed (queued imports are indexed by the queue)
+            columns = ", ".join(f"coalesce({c}, '')" for c in SEARCH_COLUMNS)
+            conn.execute(text(
+                f"INSERT INTO form_a_fts SELECT id, user_id, {columns} FROM form_a "
+                "WHERE id NOT IN (SELECT form_a_id FROM form_a_index_queue)"
+            ))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            if _already_exists(e):
+                return True
+            print(f"Full-text search disabled, FTS5 not available: {e}")
+            return False
+        print("Created form_a_fts search index")
+    return True
+
+# Weighted tsvector of a form_a row (aliased f)
+PG_VECTOR = " || ".join(
+    f"setweight(to_tsvector('simple'::regconfig, coalesce(f.{c}, '')), '{w}')"
+    for c, w in zip(SEARCH_COLUMNS, PG_WEIGHTS)
+)
+
+def _ensure_pg_index(engine):
+    with engine.connect() as conn:
+        try:
+            # One worker at a time; the others find the table there
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': PG_SETUP_LOCK})
+            if 'form_a_search' in inspect(conn).get_table_names():
+                conn.rollback()
+                return True
+            conn.execute(text(
+                "CREATE TABLE form_a_search (record_id uuid PRIMARY KEY, user_id uuid NOT NULL, "
+                "search_vector tsvector NOT NULL)"
+            ))
+            conn.execute(text("CREATE INDEX ix_form_a_search_vector ON form_a_search USING GIN (search_vector)"))
+            # Backfill stories written before the index existed (queued imports are indexed by the queue)
+            conn.execute(text(
+                f"INSERT INTO form_a_search SELECT f.id, f.user_id, {PG_VECTOR} FROM form_a f "
+                "WHERE f.id NOT IN (SELECT form_a_id FROM form_a_index_queue)"
+            ))
+            # Earlier versions kept a generated tsvector column (and its GIN index) on form_a itself
+            conn.execute(text("ALTER TABLE form_a DROP COLUMN IF EXISTS search_vector"))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Full-text search disabled, could not create form_a_search: {e}")
+            return False
+        print("Created form_a_search search index")
+    return True
+
+def index_form_a(conn, rows, replace=False):
+    """Add Form A rows (dicts with id, user_id and SEARCH_COLUMNS) to the search index.
+
+    Pass replace=True for rows that may already be indexed (updates). Runs on the
+    caller's connection so the index commits with the rows themselves.
+    """
+    if not rows:
+        return
+    if conn.dialect.name == 'postgresql':
+        ids = [row['id'] for row in rows]
+        if replace:
+            conn.execute(text("DELETE FROM form_a_search WHERE record_id = ANY(:ids)"), {'ids': ids})
+        # The stories are in form_a already (same transaction): vectorize them there in one statement
+        conn.execute(text(
+            f"INSERT INTO form_a_search SELECT f.id, f.user_id, {PG_VECTOR} FROM form_a f WHERE f.id = ANY(:ids)"
+        ), {'ids': ids})
+        return
+    if conn.dialect.name != 'sqlite':
+        return
+    ids = [row['id'].hex for row in rows]
+    if replace:
+        conn.execute(text("DELETE FROM form_a_fts WHERE record_id = :id"), [{'id': i} for i in ids])
+    # Plain tuples on the DB-API cursor: this runs for every imported story
+    conn.exec_driver_sql(
+        "INSERT INTO form_a_fts (record_id, user_id, " + ", ".join(SEARCH_COLUMNS) + ") "
+        "VALUES (" + ", ".join("?" * (len(SEARCH_COLUMNS) + 2)) + ")",
+        [(i, row['user_id'].hex, *(row.get(c) or '' for c in SEARCH_COLUMNS)) for i, row in zip(ids, rows)]
+    )
+
+def _fts5_query(query):
+    """Turn free text into a safe FTS5 query: every word must match, the last one as a prefix."""
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    quoted = ['"' + t + '"' for t in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+def highlight(snippet):
+    """HTML-escape a snippet and wrap the marked terms in <mark>."""
+    html = str(escape(snippet or ''))
+    return Markup(html.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+def search_form_a(conn, user_id, query, page=1, per_page=20):
+    """Ranked search over a user's stories. Returns (results, has_more)."""
+    params = {'user_id': user_id, 'limit': per_page + 1, 'offset': (page - 1) * per_page}
+    if conn.dialect.name == 'sqlite':
+        match = _fts5_query(query)
+        if not match:
+            return [], False
+        weights = ", ".join(str(w) for w in SQLITE_WEIGHTS)
+        stmt = text(
+            "SELECT f.id, f.about, f.headline, f.created_at, s.snippet "
+            f"FROM (SELECT record_id, bm25(form_a_fts, 0, 0, {weights}) AS score, "
+            f"      snippet(form_a_fts, -1, :mark_start, :mark_end, '…', {SNIPPET_WORDS}) AS snippet "
+            "      FROM form_a_fts WHERE form_a_fts MATCH :match AND user_id = :user_id "
+            "      ORDER BY score LIMIT :limit OFFSET :offset) s "
+            "JOIN form_a f ON f.id = s.record_id "
+            "ORDER BY s.score"
+        )
+        params.update(match=match, user_id=user_id.hex, mark_start=MARK_START, mark_end=MARK_END)
+    else:
+        if not query.strip():
+            return [], False
+        document = "concat_ws(' … ', " + ", ".join(f"f.{c}" for c in SEARCH_COLUMNS) + ")"
+        stmt = text(
+            "SELECT f.id, f.about, f.headline, f.created_at, "
+            f"       ts_headline('simple'::regconfig, {document}, s.q, :options) AS snippet "
+            "FROM (SELECT x.record_id, q, ts_rank_cd(x.search_vector, q) AS score, a.created_at "
+            "      FROM form_a_search x JOIN form_a a ON a.id = x.record_id, "
+            "           websearch_to_tsquery('simple'::regconfig, :query) q "
+            "      WHERE x.user_id = :user_id AND x.search_vector @@ q "
+            "      ORDER BY score DESC, a.created_at DESC LIMIT :limit OFFSET :offset) s "
+            "JOIN form_a f ON f.id = s.record_id "
+            "ORDER BY s.score DESC, f.created_at DESC"
+        )
+        params.update(query=query, options=(
+            f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords={SNIPPET_WORDS}, MinWords=8, MaxFragments=2"
+        ))
+
+    rows = conn.execute(stmt.columns(**RESULT_COLUMNS), params).all()
+    results = [{
+        'uuid': str(row.id),
+        'headline': row.headline or row.about[:50],
+        'created_at': row.created_at,
+        'snippet': highlight(row.snippet),
+    } for row in rows[:per_page]]
+    return results, len(rows) > per_page
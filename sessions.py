@@ -0,0 +1,112 @@
+"""
+Resumable multiplayer sessions and per-room event logs.
+
+A player who joins a room is handed a resume token. When their connection
+drops (anything but an explicit disconnect), they keep their seat - same
+colour slot, frozen in place - for grace_seconds, and rejoining with the
+token in that window takes the seat back under the new sid instead of
+joining afresh. Seats still empty at the deadline are freed by a sweeper.
+
+Rooms with shared world state also keep an EventLog: every world event gets
+the room's next sequence number and goes into a bounded ring buffer, so a
+client that rejoins with the (epoch, seq) it last saw is sent only the events
+it missed - or the full snapshot when the buffer no longer reaches back that
+far.
+"""
+import secrets
+import threading
+import time
+from collections import deque
+
+class EventLog:
+    """Monotonically numbered world events of one room (callers hold the room registry's lock)."""
+
+    def __init__(self, size=256):
+        self.epoch = secrets.token_hex(4)   # Tells a recreated room, whose sequence restarted, from the old one
+        self.seq = 0
+        self._events = deque(maxlen=size)
+
+    def append(self, event):
+        """Number an event dict (sets its 'seq') and keep it; returns the event."""
+        self.seq += 1
+        event['seq'] = self.seq
+        self._events.append(event)
+        return event
+
+    def since(self, epoch, seq):
+        """Events after seq, or None if the client has to take a full snapshot instead."""
+        if epoch != self.epoch or not isinstance(seq, int) or not 0 <= seq <= self.seq:
+            return None
+        oldest = self._events[0]['seq'] if self._events else self.seq + 1
+        if seq < oldest - 1:
+            return None   # Some of the missed events already fell out of the buffer
+        return [event for event in self._events if event['seq'] > seq]
+
+class ResumeSessions:
+    def __init__(self, grace_seconds=20.0):
+        self.grace_seconds = grace_seconds
+        self.resumed = 0
+        self.evicted = 0
+        self._tokens = {}      # token -> sid currently holding the seat
+        self._by_sid = {}      # sid -> token
+        self._deadlines = {}   # sid -> monotonic time its seat is freed, while disconnected
+        self._lock = threading.Lock()
+
+    def issue(self, sid):
+        """The sid's resume token (a new one on its first join)."""
+        with self._lock:
+            token = self._by_sid.get(sid)
+            if token is None:
+                token = secrets.token_urlsafe(16)
+                self._tokens[token] = sid
+                self._by_sid[sid] = token
+            return token
+
+    def holder(self, token):
+        """Sid whose seat the token resumes, or None."""
+        with self._lock:
+            return self._tokens.get(token) if isinstance(token, str) else None
+
+    def suspend(self, sid, now=None):
+        """Hold a dropped sid's seat for the grace period; False if it has no session to resume."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if sid not in self._by_sid or self.grace_seconds <= 0:
+                return False
+            self._deadlines[sid] = now + self.grace_seconds
+            return True
+
+    def transfer(self, old_sid, new_sid):
+        """Move the session (and its token) to the reconnected sid."""
+        with self._lock:
+            token = self._by_sid.pop(old_sid, None)
+            if token is None:
+                # Expired while the seat was being taken back: the seat is kept, under a new token
+                token = secrets.token_urlsafe(16)
+            self._tokens[token] = new_sid
+            self._by_sid[new_sid] = token
+            self._deadlines.pop(old_sid, None)
+            self.resumed += 1
+
+    def drop(self, sid):
+        with self._lock:
+            token = self._by_sid.pop(sid, None)
+            if token is not None:
+                del self._tokens[token]
+            self._deadlines.pop(sid, None)
+
+    def expired(self, now=None):
+        """Drop and return the suspended sids whose grace period is over."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            sids = [sid for sid, deadline in self._deadlines.items() if deadline <= now]
+        for sid in sids:
+            self.drop(sid)
+        with self._lock:
+            self.evicted += len(sids)
+        return sids
+
+    def stats(self):
+        with self._lock:
+            return {'grace_seconds': self.grace_seconds, 'sessions': len(self._by_sid), 'held': len(self._deadlines),
+                    'resumed': self.resumed, 'evicted': self.evicted}
@@ -0,0 +1,9 @@
+// Shared avatar image markup for the game pages (marketplace, profile).
+
+// <picture> with the WebP/AVIF thumbnails from the catalog (if any); the original image is the fallback
+function avatarPicture(src, srcset, sizes, attrs) {
+    const sources = Object.entries(srcset || {})
+        .map(([type, set]) => `<source type="${type}" srcset="${set}" sizes="${sizes}">`)
+        .join('');
+    return `<picture>${sources}<img src="${src}" ${attrs} decoding="async"></picture>`;
+}
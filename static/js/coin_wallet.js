@@ -0,0 +1,46 @@
+// Shared coin wallet client for the game pages (POST /games/01/api/user/wallet).
+//
+// Coins are synced to the shared wallet as signed deltas. Each delta carries an idempotency key
+// and stays queued (same key) until the server has accepted it, so a retry is never counted twice.
+//
+//   const coinWallet = createCoinWallet(() => authToken);
+//   coinWallet.queue(delta);   // resolves once the queue has been flushed as far as possible
+
+function newIdempotencyKey() {
+    return (window.crypto && crypto.randomUUID) ? crypto.randomUUID()
+        : Date.now().toString(36) + Math.random().toString(36).slice(2);
+}
+
+function createCoinWallet(getToken) {
+    const unsentCoinDeltas = [];
+    let coinSyncInFlight = false;
+
+    async function flush() {
+        const token = getToken();
+        if (!token || coinSyncInFlight) return;
+        coinSyncInFlight = true;
+        try {
+            while (unsentCoinDeltas.length) {
+                const { delta, key } = unsentCoinDeltas[0];
+                const res = await fetch('/games/01/api/user/wallet', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json', 'Authorization': 'Bearer ' + token, 'Idempotency-Key': key },
+                    body: JSON.stringify({ delta })
+                });
+                if (res.status >= 500) break; // Keep it queued for the next sync (a 409 spend was refused: drop it)
+                unsentCoinDeltas.shift();
+            }
+        } catch (e) {
+            // Offline - keep it queued for the next sync
+        } finally {
+            coinSyncInFlight = false;
+        }
+    }
+
+    function queue(delta) {
+        if (delta) unsentCoinDeltas.push({ delta, key: newIdempotencyKey() });
+        return flush();
+    }
+
+    return { queue, flush };
+}
@@ -0,0 +1,252 @@
+"""
+Multi-resolution avatar thumbnails (WebP, plus AVIF when Pillow can write it).
+
+The avatar portraits under games/img/avatars are full-size photos, but the
+marketplace and profile pages only draw 50-200px tiles. ThumbnailCache
+resizes each source once per configured width and format into a
+content-addressed cache (build/thumbs/<hash[:2]>/<hash>-<width>.<format>,
+where hash is the sha256 of the source file), so a URL never changes meaning
+and can be cached as immutable. scripts/populate_avatars_from_images.py
+generates them and records the variants on Avatar; a thumbnail missing from
+the cache (new deploy, wiped build dir) is generated on its first request
+through serve_game_images.
+
+Pillow is in requirements.txt; on an install without it no variants are
+recorded and the pages keep using the original images.
+
+build_atlas() packs square tiles of many avatars into a few sprite sheets
+(build/thumbs/atlas/atlas-<key>-<n>.webp, key = hash of the member images),
+so the marketplace grid is one image request instead of one per avatar.
+"""
+import hashlib
+import math
+import os
+import re
+import tempfile
+import threading
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+if Image is not None:
+    try:
+        import pillow_avif  # noqa: F401 - registers the AVIF plugin on Pillow < 11.3
+    except ImportError:
+        pass
+
+# URL prefix of the cache (served by serve_game_images from the cache dir)
+URL_PREFIX = '/games/img/thumbs/'
+
+# Source images the cache will build thumbnails for
+SOURCE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
+
+# Preferred first: browsers pick the first <source> type they support
+FORMAT_MIMETYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+THUMBNAIL_NAME = re.compile(r'^(?P<hash>[0-9a-f]{16})-(?P<width>\d+)\.(?P<format>avif|webp)$')
+ATLAS_NAME = re.compile(r'^atlas-(?P<key>[0-9a-f]{16})-(?P<sheet>\d+)\.(?P<format>avif|webp)$')
+
+def supported_formats():
+    """Thumbnail formats this Pillow build can write, best first."""
+    if Image is None:
+        return ()
+    formats = []
+    if Image.registered_extensions().get('.avif') == 'AVIF':
+        formats.append('avif')
+    if features.check('webp'):
+        formats.append('webp')
+    return tuple(formats)
+
+def file_hash(path):
+    """Content hash used in thumbnail and atlas names (first 16 hex digits of the sha256)."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()[:16]
+
+def thumbnail_url(digest, width, fmt):
+    return f"{URL_PREFIX}{digest}-{width}.{fmt}"
+
+def srcsets(variants):
+    """{mimetype: 'url 64w, url 128w, ...'} for <picture><source> tags, from Avatar.variants."""
+    if not variants:
+        return {}
+    return {FORMAT_MIMETYPES[fmt]: ', '.join(f"{thumbnail_url(variants['hash'], w, fmt)} {w}w"
+                                             for w in variants['widths'])
+            for fmt in variants['formats'] if fmt in FORMAT_MIMETYPES}
+
+class ThumbnailCache:
+    def __init__(self, cache_dir, source_dir, widths=(64, 128, 256), quality=80):
+        self.cache_dir = cache_dir
+        self.source_dir = source_dir   # Directory the avatar sources live under
+        self.widths = tuple(sorted(widths))
+        self.quality = quality
+        self.formats = supported_formats()
+        self._hashes = {}    # source path -> ((size, mtime_ns), hash)
+        self._sources = {}   # hash -> source path
+        self._atlases = {}   # atlas key -> build_atlas() arguments, to redraw a sheet on demand
+        self._atlas_layouts = {}  # atlas key -> (sheets, sprites) of the last build
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return bool(self.formats)
+
+    def source_hash(self, source_path, digest=None):
+        """Content hash of a source image (re-read only when its size or mtime changes).
+
+        A caller that already hashed the file can pass its digest to skip the read.
+        """
+        st = os.stat(source_path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        cached = self._hashes.get(source_path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        if digest is None:
+            digest = file_hash(source_path)
+        with self._lock:
+            self._hashes[source_path] = (stamp, digest)
+            self._sources[digest] = source_path
+        return digest
+
+    def path_for(self, digest, width, fmt):
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}-{width}.{fmt}")
+
+    def generate(self, source_path, digest=None):
+        """Write any missing thumbnails of a source; returns its variants (None without Pillow).
+
+        Variants are {"hash", "width", "height", "widths", "formats"} - what Avatar.variants
+        stores and srcsets() turns into URLs.
+        """
+        if not self.available:
+            return None
+        digest = self.source_hash(source_path, digest)
+        with Image.open(source_path) as img:
+            img = ImageOps.exif_transpose(img)
+            # Never upscale: a source narrower than the smallest width gets a single thumbnail
+            widths = [w for w in self.widths if w < img.width] or [img.width]
+            missing = [(w, fmt) for w in widths for fmt in self.formats
+                       if not os.path.exists(self.path_for(digest, w, fmt))]
+            if missing:
+                if img.mode not in ('RGB', 'RGBA'):
+                    img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA', 'P') else 'RGB')
+                for w in sorted({w for w, _ in missing}, reverse=True):
+                    resized = img.resize((w, max(1, round(img.height * w / img.width))), Image.LANCZOS)
+                    for fmt in self.formats:
+                        if (w, fmt) in missing:
+                            self._write(resized, self.path_for(digest, w, fmt), fmt)
+            return {'hash': digest, 'width': img.width, 'height': img.height,
+                    'widths': widths, 'formats': list(self.formats)}
+
+    def _write(self, img, path, fmt):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so another worker never serves a half-written file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                img.save(f, format=fmt.upper(), quality=self.quality)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def atlas_path(self, key, sheet, fmt):
+        return os.path.join(self.cache_dir, 'atlas', f"atlas-{key}-{sheet}.{fmt}")
+
+    def _tile_source(self, digest, source_path, tile):
+        # The smallest cached thumbnail that is still big enough decodes much faster than the original
+        if 'webp' in self.formats:
+            for w in self.widths:
+                if w >= tile and os.path.exists(self.path_for(digest, w, 'webp')):
+                    return self.path_for(digest, w, 'webp')
+        return source_path
+
+    def build_atlas(self, sources, tile=192, max_tiles=64):
+        """Pack square tiles of the sources into sprite sheets, drawing only sheets not in the cache.
+
+        sources is [(name, source path)]. Returns {"tile", "sheets": [{"url", "width", "height"}],
+        "sprites": {name: [sheet, x, y]}}, or None without Pillow. Sheets are named after the
+        member images, so they are only redrawn when an image is added, removed, changed or moved;
+        the same members again (e.g. a catalog reload for new purchase counts) reuse the last layout.
+        """
+        if not self.available or not sources:
+            return None
+        fmt = 'webp' if 'webp' in self.formats else self.formats[0]
+        members = [(name, path, self.source_hash(path)) for name, path in sources]
+        key = hashlib.sha256(f"{tile}:{max_tiles}:{fmt}:{','.join(d for _, _, d in members)}".encode()).hexdigest()[:16]
+        with self._lock:
+            self._atlases[key] = (sources, tile, max_tiles)
+            layout = self._atlas_layouts.get(key)
+        if layout is not None and all(os.path.exists(self.atlas_path(key, n, fmt)) for n in range(len(layout[0]))):
+            return {'tile': tile, 'sheets': [dict(s) for s in layout[0]], 'sprites': dict(layout[1])}
+
+        sheets = []
+        sprites = {}
+        for sheet, start in enumerate(range(0, len(members), max_tiles)):
+            chunk = members[start:start + max_tiles]
+            cols = math.ceil(math.sqrt(len(chunk)))
+            rows = math.ceil(len(chunk) / cols)
+            path = self.atlas_path(key, sheet, fmt)
+            if not os.path.exists(path):
+                canvas = Image.new('RGBA', (cols * tile, rows * tile), (0, 0, 0, 0))
+                for i, (_, source_path, digest) in enumerate(chunk):
+                    with Image.open(self._tile_source(digest, source_path, tile)) as img:
+                        img = ImageOps.fit(ImageOps.exif_transpose(img).convert('RGBA'), (tile, tile), Image.LANCZOS)
+                        canvas.paste(img, ((i % cols) * tile, (i // cols) * tile))
+                self._write(canvas, path, fmt)
+            sheets.append({'url': f"{URL_PREFIX}atlas-{key}-{sheet}.{fmt}",
+                           'width': cols * tile, 'height': rows * tile})
+            for i, (name, _, _) in enumerate(chunk):
+                sprites[name] = [sheet, (i % cols) * tile, (i // cols) * tile]
+        with self._lock:
+            self._atlas_layouts[key] = ([dict(s) for s in sheets], dict(sprites))
+        return {'tile': tile, 'sheets': sheets, 'sprites': sprites}
+
+    def _find_source(self, digest):
+        with self._lock:
+            source_path = self._sources.get(digest)
+        if source_path and os.path.exists(source_path):
+            return source_path
+        # Unknown hash (e.g. first request after a restart): hash the sources once
+        for dirpath, _, filenames in os.walk(self.source_dir):
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() in SOURCE_EXTENSIONS:
+                    path = os.path.join(dirpath, filename)
+                    if self.source_hash(path) == digest:
+                        return path
+        return None
+
+    def ensure(self, name):
+        """Cache path of a thumbnail (<hash>-<width>.<format>) or atlas sheet, generating it on demand.
+
+        Returns None for names that do not match a current source, width and format
+        (or an atlas this process built).
+        """
+        atlas = ATLAS_NAME.match(name)
+        if atlas:
+            path = self.atlas_path(atlas['key'], int(atlas['sheet']), atlas['format'])
+            if not os.path.exists(path):
+                with self._lock:
+                    args = self._atlases.get(atlas['key'])
+                if args is None:
+                    return None
+                self.build_atlas(*args)
+            return path if os.path.exists(path) else None
+
+        match = THUMBNAIL_NAME.match(name)
+        if not match or match['format'] not in self.formats:
+            return None
+        digest, width, fmt = match['hash'], int(match['width']), match['format']
+        path = self.path_for(digest, width, fmt)
+        if os.path.exists(path):
+            return path
+        source_path = self._find_source(digest)
+        if source_path is None:
+            return None
+        variants = self.generate(source_path)
+        if variants is None or width not in variants['widths']:
+            return None
+        return path
@@ -0,0 +1,177 @@
+"""
+Delta-based coin wallet for the game API, with write coalescing.
+
+Games report coins they earned or spent as signed deltas instead of absolute
+totals, so concurrent tabs add up instead of overwriting each other. Earned
+coins are buffered per player in memory and flushed every window_seconds in
+one transaction: the idempotency keys go to game_wallet_entries with
+INSERT ... ON CONFLICT DO NOTHING (retries are applied once, even across
+gunicorn workers), and each player gets a single atomic
+coins = coins + :delta UPDATE however many deltas arrived in the window.
+
+Spends are not buffered: spend() applies them right away with a guarded
+coins = coins + :delta WHERE coins + :delta >= 0, so a spend the balance
+cannot cover is rejected instead of clamping the balance to 0.
+"""
+import datetime
+import threading
+import time
+from sqlalchemy import select, update, delete, bindparam
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects import postgresql, sqlite
+from models import GameUser, GameWalletEntry
+
+class PendingDeltas:
+    __slots__ = ('delta', 'keyed')
+
+    def __init__(self):
+        self.delta = 0    # Sum of deltas sent without an idempotency key
+        self.keyed = {}   # idempotency key -> delta
+
+    def total(self):
+        return self.delta + sum(self.keyed.values())
+
+    def merge(self, other):
+        self.delta += other.delta
+        for key, delta in other.keyed.items():
+            self.keyed.setdefault(key, delta)
+
+class Wallet:
+    def __init__(self, engine, window_seconds=1.0, key_ttl_hours=24):
+        self.engine = engine
+        self.window_seconds = window_seconds
+        self.key_ttl = datetime.timedelta(hours=key_ttl_hours)
+        self.received = 0
+        self.flushes = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pruned_at = 0.0
+        dialect = postgresql if engine.dialect.name == 'postgresql' else sqlite
+        self._insert_keys = (dialect.insert(GameWalletEntry.__table__)
+                             .on_conflict_do_nothing(index_elements=['user_id', 'idempotency_key'])
+                             .returning(GameWalletEntry.user_id, GameWalletEntry.delta))
+
+    def add(self, user_id, delta, key=None):
+        """Queue earned coins (delta >= 0); returns False if the key is already queued for this player."""
+        if delta < 0:
+            raise ValueError("Spends go through spend()")
+        with self._lock:
+            pending = self._pending.get(user_id)
+            if pending is None:
+                pending = self._pending[user_id] = PendingDeltas()
+            if key is None:
+                pending.delta += delta
+            elif key in pending.keyed:
+                return False
+            else:
+                pending.keyed[key] = delta
+            self.received += 1
+            return True
+
+    def pending(self, user_id):
+        """Not yet flushed delta of a player (in this process)."""
+        with self._lock:
+            pending = self._pending.get(user_id)
+            return pending.total() if pending else 0
+
+    def spend(self, user_id, delta, key=None):
+        """Apply a spend (delta < 0) now if the balance covers it.
+
+        Returns (result, coins): result is 'spent', 'duplicate' (key already applied) or
+        'insufficient', coins the balance afterwards (None if the player does not exist).
+        """
+        users = GameUser.__table__
+        with self._flush_lock:
+            # Coins earned in this process but not flushed yet count towards the balance
+            with self._lock:
+                pending = self._pending.pop(user_id, None)
+            if pending is not None:
+                try:
+                    self._write({user_id: pending})
+                except Exception:
+                    with self._lock:
+                        self._pending.setdefault(user_id, PendingDeltas()).merge(pending)
+                    raise
+        with self.engine.begin() as conn:
+            result = 'spent'
+            if key is not None and conn.execute(
+                    self._insert_keys, {'user_id': user_id, 'idempotency_key': key, 'delta': delta}).first() is None:
+                result = 'duplicate'
+            elif conn.execute(
+                    update(users)
+                    .where(users.c.id == user_id, users.c.coins + delta >= 0)
+                    .values(coins=users.c.coins + delta, last_update=datetime.datetime.utcnow())
+            ).rowcount == 0:
+                result = 'insufficient'
+                if key is not None:
+                    # Not applied, so a retry with the same key must be checked again
+                    conn.execute(delete(GameWalletEntry).where(GameWalletEntry.user_id == user_id,
+                                                               GameWalletEntry.idempotency_key == key))
+            coins = conn.execute(select(users.c.coins).where(users.c.id == user_id)).scalar()
+        return result, coins
+
+    def flush(self):
+        """Write all queued deltas; returns {user_id: new coins} for the players that changed."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return {}
+            try:
+                balances = self._write(batch)
+            except OperationalError as e:
+                # Database unreachable: keep the deltas for the next flush
+                print(f"Wallet flush failed, will retry: {e}")
+                with self._lock:
+                    for user_id, pending in batch.items():
+                        self._pending.setdefault(user_id, PendingDeltas()).merge(pending)
+                return {}
+            except Exception as e:
+                # One bad player (e.g. deleted meanwhile) must not block everybody else's coins
+                print(f"Wallet batch flush failed, retrying per player: {e}")
+                balances = {}
+                for user_id, pending in batch.items():
+                    try:
+                        balances.update(self._write({user_id: pending}))
+                    except Exception as e:
+                        print(f"Dropping {pending.total()} coins for {user_id}: {e}")
+            self.flushes += 1
+            self._prune()
+            return balances
+
+    def _write(self, batch):
+        totals = {user_id: pending.delta for user_id, pending in batch.items()}
+        keyed = [{'user_id': user_id, 'idempotency_key': key, 'delta': delta}
+                 for user_id, pending in batch.items() for key, delta in pending.keyed.items()]
+        with self.engine.begin() as conn:
+            if keyed:
+                # Only keys seen for the first time come back, so retried deltas are skipped
+                for user_id, delta in conn.execute(self._insert_keys, keyed):
+                    totals[user_id] += delta
+            changes = [{'user_id': user_id, 'delta': delta} for user_id, delta in totals.items() if delta]
+            if not changes:
+                return {}
+            conn.execute(
+                update(GameUser.__table__)
+                .where(GameUser.__table__.c.id == bindparam('user_id'))
+                .values(coins=GameUser.__table__.c.coins + bindparam('delta'),
+                        last_update=datetime.datetime.utcnow()),
+                changes
+            )
+            return dict(conn.execute(
+                select(GameUser.id, GameUser.coins).where(GameUser.id.in_([c['user_id'] for c in changes]))
+            ).all())
+
+    def _prune(self):
+        now = time.monotonic()
+        if now - self._pruned_at < 3600:
+            return
+        self._pruned_at = now
+        cutoff = datetime.datetime.utcnow() - self.key_ttl
+        with self.engine.begin() as conn:
+            conn.execute(delete(GameWalletEntry).where(GameWalletEntry.created_at < cutoff))
+
+    def stats(self):
+        with self._lock:
+            return {'received': self.received, 'flushes': self.flushes, 'pending_players': len(self._pending)}
@@ -0,0 +1,74 @@
+"""
+Compact binary encoding of the multiplayer *_remote_batch events.
+
+Clients that join a room with {"encoding": "binary"} get each batch as one
+binary Socket.IO attachment instead of a JSON object. A player is identified
+by its room slot (the colorSlot already announced, together with the static
+fields - username, colour - in *_room_state and *_player_joined), positions
+and angles are fixed-point and the small fields are bit-packed.
+Little-endian layout:
+
+  header  u8 format (1 = elf, 2 = city), u16 player count
+  elf     u16 slot, u8 x, u8 y (tiles), u8 flags: dir (bits 0-1), frame (2), hasSword (3), hp (4-7)
+  city    u16 slot, i16 x, i16 z (1/64 unit), u16 ry (1/65536 turn), u8 flags: moving (bit 0)
+
+games/04 and games/06 decode it with a DataView (decodeElfBatch / decodeCityBatch).
+"""
+import math
+import struct
+
+FORMAT_ELF = 1
+FORMAT_CITY = 2
+
+ELF_DIRS = ('down', 'up', 'left', 'right')
+
+# City positions in 1/64 units: +-512 covers the city (+-57) and the house interiors (~300)
+POSITION_SCALE = 64
+ANGLE_SCALE = 65536 / (2 * math.pi)
+
+HEADER = struct.Struct('<BH')
+ELF_RECORD = struct.Struct('<HBBB')
+CITY_RECORD = struct.Struct('<HhhHB')
+
+def _number(value):
+    # Player state comes straight from client JSON
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return value if math.isfinite(value) else 0.0
+
+def _clamp(value, low, high):
+    return low if value < low else high if value > high else value
+
+def encode_elf_batch(players):
+    """Binary batch of Elf Quest player dicts (each with its colorSlot)."""
+    buf = bytearray(HEADER.size + ELF_RECORD.size * len(players))
+    HEADER.pack_into(buf, 0, FORMAT_ELF, len(players))
+    offset = HEADER.size
+    for p in players:
+        direction = p.get('dir')
+        flags = (ELF_DIRS.index(direction) if direction in ELF_DIRS else 0) \
+            | (1 if p.get('frame') else 0) << 2 \
+            | (1 if p.get('hasSword') else 0) << 3 \
+            | _clamp(int(_number(p.get('hp'))), 0, 15) << 4
+        ELF_RECORD.pack_into(buf, offset, p.get('colorSlot', 0),
+                             _clamp(round(_number(p.get('x'))), 0, 255),
+                             _clamp(round(_number(p.get('y'))), 0, 255),
+                             flags)
+        offset += ELF_RECORD.size
+    return bytes(buf)
+
+def encode_city_batch(players):
+    """Binary batch of City Life player dicts (each with its colorSlot)."""
+    buf = bytearray(HEADER.size + CITY_RECORD.size * len(players))
+    HEADER.pack_into(buf, 0, FORMAT_CITY, len(players))
+    offset = HEADER.size
+    for p in players:
+        CITY_RECORD.pack_into(buf, offset, p.get('colorSlot', 0),
+                              _clamp(round(_number(p.get('x')) * POSITION_SCALE), -32768, 32767),
+                              _clamp(round(_number(p.get('z')) * POSITION_SCALE), -32768, 32767),
+                              round(_number(p.get('ry')) * ANGLE_SCALE) % 65536,
+                              1 if p.get('moving') else 0)
+        offset += CITY_RECORD.size
+    return bytes(buf)